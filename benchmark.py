@@ -0,0 +1,310 @@
+# font.py の変換処理を、段階ごとに計測するベンチマーク
+#
+#   python benchmark.py                       # 生成した小さなTTFで、すべてのサイズとコードセットを計測
+#   python benchmark.py -s 12 16 -cs ASCII LEVEL1 -r 5 -o result.json
+#   python benchmark.py --compare before.json  # 前回の結果と比較して表示
+#   python benchmark.py --verify                # 計測せずに、出力をfontreader.pyで読み戻して確かめる
+#
+# フォントを指定しない場合は、fontToolsで簡単な図形のグリフを持つTTFを一時ディレクトリに作るので、
+# ネットワークや外部のフォントファイルがなくても実行できる。
+# 計測する段階は、コード表の作成（getCodeTbl）、レンダリング（render_glyph_to_bitmap）、
+# ビット配列化（display_bitmap_data）、オフセットの付与を含むビットマップ配列の作成（convToDataAndBitmap）、
+# 各出力形式の書き込み（Output2*）。それぞれ文字数/秒と、出力形式はバイト数/秒も出す。
+# --verify では、PBinaryとFONTX2の出力を fontreader.py で読み、すべての文字のビットマップが書いたものと同じかを調べる。
+
+import argparse
+import collections
+import datetime
+import json
+import locale
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import PIL
+
+import font as fontpy
+import fontreader
+
+BENCH_SIZES = [8, 12, 16, 24]
+BENCH_CODESETS = ["ASCII", "LEVEL1", "ALL"]
+# 出力形式と、そのデフォルトのエンコーディング（font.pyの -en DEFAULT と同じ）
+BENCH_WRITERS = [("CData", "UTF8"), ("PBinary", "UTF8"), ("Python", "UTF8"), ("FONTX2", "SJIS"), ("BDF", "JIS")]
+# --verify で読み戻す出力形式とエンコーディング
+VERIFY_WRITERS = [("PBinary", "UTF8"), ("PBinary", "SJIS"), ("PBinary", "JIS"), ("FONTX2", "SJIS"), ("FONTX2", "JIS")]
+# --verify のコードセット。全部の文字と、半角が一部の文字だけになる組み合わせ（charfileは VERIFY_CHARS を書いたファイル）
+VERIFY_CODESETS = ["ALL", "KIGOU | charfile"]
+VERIFY_CHARS = "あいうABC漢"
+
+
+def GetMessage(isJapanese, msgKey):
+    messages = {
+    "en" : {
+"general" : "Measure each stage of the font.py conversion separately and write the results to a JSON file.",
+"--font" : "TrueType font to measure with. If not specified, a small font is generated with fontTools.",
+"--size" : "Font sizes to measure.",
+"--codeset" : "Code set expressions to measure.",
+"--repeat" : "Number of runs per stage. The fastest run is reported.",
+"--output" : "JSON file to write the results to.",
+"--compare" : "JSON file from an earlier run. The ratio to it is shown for each stage.",
+"--verify" : "Do not measure. Write PBinary and FONTX2 files, read them back with fontreader.py, and check that every character has the bitmap that was written.",
+"log_verify" : "verify  size {}  {:<18} {:<8} {:<5} {} characters, {} mismatches",
+"err_verify" : "Error: {} characters did not read back correctly.",
+"log_genfont" : "Generating a benchmark font with {} glyphs: {}",
+"log_header" : "size  codeset     stage                 glyphs    seconds     glyphs/s       bytes/s",
+"log_compare" : "  ({:.2f}x of previous)",
+"log_saved" : "Results were written to {}.",
+"err_nofonttools" : "Error: fontTools is needed to generate the benchmark font. Install it with pip install fonttools, or specify a font with --font.",
+    },
+    "ja" : {
+"general" : "font.pyの変換処理を段階ごとに計測して、結果をJSONファイルに出力します。",
+"--font" : "計測に使うTrueTypeフォントを指定します。指定しない場合は、fontToolsで小さなフォントを作成します。",
+"--size" : "計測するフォントサイズを指定します。",
+"--codeset" : "計測するコードセットの式を指定します。",
+"--repeat" : "各段階を実行する回数を指定します。最も速かった回の結果を出力します。",
+"--output" : "結果を出力するJSONファイルを指定します。",
+"--compare" : "以前に出力したJSONファイルを指定します。各段階について、以前の結果との比を表示します。",
+"--verify" : "計測せずに、PBinaryとFONTX2のファイルを出力してfontreader.pyで読み戻し、すべての文字が書いたとおりのビットマップになっているかを調べます。",
+"log_verify" : "verify  size {}  {:<18} {:<8} {:<5} {}文字、不一致 {}文字",
+"err_verify" : "エラー: {}文字が正しく読み戻せませんでした。",
+"log_genfont" : "{}文字のベンチマーク用フォントを作成しています: {}",
+"log_header" : "size  codeset     stage                 glyphs    seconds     glyphs/s       bytes/s",
+"log_compare" : "  （前回の{:.2f}倍）",
+"log_saved" : "結果を{}に出力しました。",
+"err_nofonttools" : "エラー: ベンチマーク用フォントの作成にはfontToolsが必要です。pip install fonttools でインストールするか、--font でフォントを指定してください。",
+    }
+    }
+    return messages["ja" if isJapanese else "en"][msgKey]
+
+
+# ベンチマーク用のTTFを作る関数。文字ごとに、コードポイントのビットから4x4のマス目の塗りつぶしを決めるので、
+# 文字ごとに異なるビットマップになる（同じ形ばかりだと、キャッシュなどの効果で実際より速く見えるため）。
+def makeBenchmarkFont(path, chars):
+    try:
+        from fontTools.fontBuilder import FontBuilder
+        from fontTools.pens.ttGlyphPen import TTGlyphPen
+    except ImportError:
+        raise SystemExit(GetMessage(fontpy.isJapanese, "err_nofonttools"))
+
+    unitsPerEm = 1000
+    cell = unitsPerEm // 4
+    glyphOrder = [".notdef"]
+    cmap = {}
+    glyphs = {}
+    metrics = {}
+
+    pen = TTGlyphPen(None)
+    glyphs[".notdef"] = pen.glyph()
+    metrics[".notdef"] = (unitsPerEm, 0)
+    for codePoint in sorted(set(ord(char) for char in chars)):
+        name = f"uni{codePoint:04X}"
+        advance = unitsPerEm // 2 if codePoint <= 0xFF else unitsPerEm
+        columns = 2 if codePoint <= 0xFF else 4
+        pen = TTGlyphPen(None)
+        pattern = (codePoint * 2654435761) & 0xFFFF            # コードポイントのビットを混ぜて、マス目の模様にする
+        for bit in range(columns * 4):
+            if pattern >> bit & 1:
+                x = (bit % columns) * cell
+                y = (bit // columns) * cell - unitsPerEm // 8
+                pen.moveTo((x + 20, y + 20))
+                pen.lineTo((x + 20, y + cell - 20))
+                pen.lineTo((x + cell - 20, y + cell - 20))
+                pen.lineTo((x + cell - 20, y + 20))
+                pen.closePath()
+        glyphOrder.append(name)
+        glyphs[name] = pen.glyph()
+        metrics[name] = (advance, 0)
+        cmap[codePoint] = name
+
+    builder = FontBuilder(unitsPerEm, isTTF=True)
+    builder.setupGlyphOrder(glyphOrder)
+    builder.setupCharacterMap(cmap)
+    builder.setupGlyf(glyphs)
+    builder.setupHorizontalMetrics(metrics)
+    builder.setupHorizontalHeader(ascent=unitsPerEm * 7 // 8, descent=-unitsPerEm // 8)
+    builder.setupNameTable({"familyName": "PyFontConverterBench", "styleName": "Regular"})
+    builder.setupOS2(sTypoAscender=unitsPerEm * 7 // 8, sTypoDescender=-unitsPerEm // 8, usWinAscent=unitsPerEm * 7 // 8, usWinDescent=unitsPerEm // 8)
+    builder.setupPost()
+    builder.save(path)
+
+
+# 関数をrepeat回実行して、最も短かった実行時間と、最後の戻り値を返す関数
+def measure(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def outputSize(outFormat, outputFile):
+    return sum(os.path.getsize(path) for path in fontpy.outputFilesOf(outFormat, outputFile, fontpy.bdf_split) if os.path.exists(path))
+
+
+# font.py のグローバル変数を、１つのサイズ・コードセットの変換用に設定する関数
+def setupFontpy(fontPath, size, codeSet):
+    fontpy.font_path = fontPath
+    fontpy.font_XSize = size
+    fontpy.font_YSize = size
+    fontpy.code_set = codeSet
+    fontpy.structure_name = "BenchKanji"
+    fontpy.bitmapdata_name = "BenchBitmap"
+    fontpy.bdf_split = False
+    fontpy.font = fontpy.loadFont(fontPath, size)
+
+# １つのサイズ・コードセットについて、すべての段階を計測する関数
+def benchmarkOne(fontPath, size, codeSet, repeat, workDir):
+    setupFontpy(fontPath, size, codeSet)
+    results = []
+
+    def record(stage, glyphs, seconds, nbytes=None):
+        entry = {"size": size, "codeset": codeSet, "stage": stage, "glyphs": glyphs, "seconds": seconds,
+                 "glyphs_per_sec": glyphs / seconds if seconds > 0 else None}
+        if nbytes is not None:
+            entry["bytes"] = nbytes
+            entry["bytes_per_sec"] = nbytes / seconds if seconds > 0 else None
+        results.append(entry)
+
+    # コード表の作成。JIS X 0208の表は１回だけ作られてプロセス内で使い回されるので、毎回作り直して計測する
+    def buildTable():
+        fontpy.JIS_TABLE = None
+        return fontpy.buildCodeList(codeSet, "", "UTF8")
+    seconds, codeList = measure(buildTable, repeat)
+    record("getCodeTbl", len(codeList), seconds)
+
+    items = list(zip(codeList.records["utf8"].tolist(), codeList.chars.tolist()))
+    seconds, images = measure(lambda: [fontpy.render_glyph_to_bitmap(fontpy.font, codeUTF8, char, size, size, 0, -1) for codeUTF8, char in items], repeat)
+    record("render", len(items), seconds)
+
+    seconds, bitmaps = measure(lambda: [fontpy.display_bitmap_data(image) for image in images], repeat)
+    record("display_bitmap", len(images), seconds, sum(bitmap.size for bitmap in bitmaps))
+
+    for outFormat, encoding in BENCH_WRITERS:
+        targetList = fontpy.sortCodeList(codeList, encoding)
+        targetList, bmpList = fontpy.convToDataAndBitmap(targetList, size, size, 0, -1)
+        outputFile = os.path.join(workDir, f"bench_{size}_{len(results)}{fontpy.OUTPUT_EXTENSIONS[outFormat]}")
+        seconds, _ = measure(lambda: fontpy.writeOutput(outFormat, outputFile, targetList, bmpList, encoding), repeat)
+        record("Output2" + outFormat, len(targetList), seconds, outputSize(outFormat, outputFile))
+
+    seconds, _ = measure(lambda: fontpy.convToDataAndBitmap(codeList.copy(), size, size, 0, -1), repeat)
+    record("convToDataAndBitmap", len(codeList), seconds)
+    return results
+
+
+# １つのサイズ・コードセットについて、出力をfontreaderで読み戻し、書いたビットマップと違う文字の数を返す関数（--verify）
+# コードでの検索（find）と、コード表に１回だけ出てくる文字での検索（findChar）の両方を調べる。
+def verifyOne(fontPath, size, codeSet, charfile, workDir):
+    setupFontpy(fontPath, size, codeSet)
+    codeList = fontpy.buildCodeList(codeSet, charfile, "UTF8")
+    charCounts = collections.Counter(codeList.chars.tolist())
+    mismatches = 0
+    for outFormat, encoding in VERIFY_WRITERS:
+        targetList = fontpy.sortCodeList(codeList, encoding)
+        targetList, bmpList = fontpy.convToDataAndBitmap(targetList, size, size, 0, -1)
+        outputFile = os.path.join(workDir, f"verify_{size}_{outFormat}_{encoding}")
+        fontpy.writeOutput(outFormat, outputFile, targetList, bmpList, encoding)
+        codes = targetList.records[fontpy.CODE_SORT_FIELDS[encoding]].tolist()
+        if outFormat == "PBinary":
+            readers = {False: fontreader.PBinaryFont(outputFile, encoding)}
+        else:
+            readers = {False: fontreader.FontX2Font(outputFile + "_han.fnt", encoding),
+                       True: fontreader.FontX2Font(outputFile + "_zen.fnt", encoding)}
+        count = 0
+        for index, (code, char) in enumerate(zip(codes, targetList.chars.tolist())):
+            reader = readers[outFormat == "FONTX2" and code > 0xFF]
+            expected = bmpList.view(index).tobytes()
+            found = [reader.find(code)]
+            if len(char) == 1 and charCounts[char] == 1:
+                found.append(reader.findChar(char))
+            if any(glyph is None or bytes(glyph.bitmap) != expected for glyph in found):
+                count += 1
+        for reader in readers.values():
+            reader.close()
+        print(GetMessage(fontpy.isJapanese, "log_verify").format(size, codeSet, outFormat, encoding, len(codes), count))
+        mismatches += count
+    return mismatches
+
+
+def printResult(entry, previous):
+    bytesPerSec = entry.get("bytes_per_sec")
+    line = f"{entry['size']:>4}  {entry['codeset']:<10}  {entry['stage']:<20} {entry['glyphs']:>7} {entry['seconds']:>10.4f} {entry['glyphs_per_sec'] or 0:>12.0f}"
+    line += f" {bytesPerSec:>13.0f}" if bytesPerSec is not None else " " * 14
+    key = (entry["size"], entry["codeset"], entry["stage"])
+    if key in previous and entry["seconds"] > 0:
+        line += GetMessage(fontpy.isJapanese, "log_compare").format(entry["seconds"] / previous[key]["seconds"])
+    print(line)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=GetMessage(fontpy.isJapanese, "general"))
+    parser.add_argument("-f", "--font", type=str, default="", help=GetMessage(fontpy.isJapanese, "--font"))
+    parser.add_argument("-s", "--size", type=int, nargs="+", default=BENCH_SIZES, help=GetMessage(fontpy.isJapanese, "--size"))
+    parser.add_argument("-cs", "--codeset", type=str, nargs="+", default=BENCH_CODESETS, help=GetMessage(fontpy.isJapanese, "--codeset"))
+    parser.add_argument("-r", "--repeat", type=int, default=3, help=GetMessage(fontpy.isJapanese, "--repeat"))
+    parser.add_argument("-o", "--output", type=str, default="benchmark.json", help=GetMessage(fontpy.isJapanese, "--output"))
+    parser.add_argument("--compare", type=str, default="", help=GetMessage(fontpy.isJapanese, "--compare"))
+    parser.add_argument("--verify", action="store_true", help=GetMessage(fontpy.isJapanese, "--verify"))
+    args = parser.parse_args(argv)
+
+    previous = {}
+    if args.compare != "":
+        with open(args.compare, "r", encoding="utf-8") as f:
+            for entry in json.load(f)["results"]:
+                previous[(entry["size"], entry["codeset"], entry["stage"])] = entry
+
+    fontpy.command_args = ["font.py", "benchmark"]
+    with tempfile.TemporaryDirectory() as workDir:
+        fontPath = args.font
+        if fontPath == "":
+            fontPath = os.path.join(workDir, "bench.ttf")
+            chars = [char for char in fontpy.buildCodeList("ALL", "", "UTF8").chars.tolist() if len(char) == 1]
+            print(GetMessage(fontpy.isJapanese, "log_genfont").format(len(chars), fontPath))
+            makeBenchmarkFont(fontPath, chars)
+
+        if args.verify:
+            charfile = os.path.join(workDir, "verify_chars.txt")
+            with open(charfile, "w", encoding="utf-8") as f:
+                f.write(VERIFY_CHARS)
+            mismatches = sum(verifyOne(fontPath, size, codeSet, charfile, workDir) for size in args.size for codeSet in VERIFY_CODESETS)
+            if mismatches:
+                raise SystemExit(GetMessage(fontpy.isJapanese, "err_verify").format(mismatches))
+            return
+
+        print(GetMessage(fontpy.isJapanese, "log_header"))
+        results = []
+        for size in args.size:
+            for codeSet in args.codeset:
+                for entry in benchmarkOne(fontPath, size, codeSet, args.repeat, workDir):
+                    printResult(entry, previous)
+                    results.append(entry)
+
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "font": args.font if args.font != "" else "generated",
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(GetMessage(fontpy.isJapanese, "log_saved").format(args.output))
+
+
+if __name__ == "__main__":
+    # メッセージの言語は、font.pyと同じくロケールと環境変数LANGで決める
+    loc = locale.getlocale()[0]
+    fontpy.isJapanese = loc is not None and (('JP' in loc) or ('Japanese' in loc))
+    lang_env = os.environ.get('LANG')
+    if lang_env:
+        fontpy.isJapanese = ('ja' in lang_env.lower()) or ('jp' in lang_env.lower())
+    main(sys.argv[1:])
@@ -22,6 +22,7 @@
 # SOFTWARE.
 
 from fontTools.ttLib import TTFont
+from fontTools.ttLib.tables.E_B_D_T_ import BitAlignedBitmapMixin, ByteAlignedBitmapMixin
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 import codecs
@@ -31,7 +32,50 @@ from pathlib import Path
 import sys
 import os
 import locale
-
+import multiprocessing
+import itertools
+import json
+import concurrent.futures
+import hashlib
+import base64
+import io
+import sqlite3
+import time
+
+import fontreader     # PBinary・FONTX2ファイルの読み込み（FONTX2の入力とPackBitsの展開に使う）
+
+# 実行時の設定。コマンドライン引数（またはマニフェストのジョブ）により convertFont の中で設定される。
+# ワーカープロセスや、モジュールとして読み込んだ場合にも参照できるよう、デフォルト値を入れておく。
+isJapanese = False
+isVerbose = False
+isImage = False
+mapping = "KANA"
+isEndMark = "ALLZERO"
+bitsComment = True
+dedup = True
+compression = "none"
+hash_index = False
+kuten_index = False
+embedded_bitmap = True
+bitmap_source = None
+missing_mode = "render"
+python_format = "list"
+pbinary_byteorder = "big"
+pbinary_header = False
+engine = "glyph"
+command_args = sys.argv
+
+# レンダリング方式。glyphは１文字ずつ画像を作り、atlasは何文字かを１枚のキャンバスにまとめて描き、
+# maskは画像を作らずに、フォントから文字の濃淡（マスク）を直接受け取る
+RENDER_ENGINES = ("glyph", "atlas", "mask")
+# アトラス方式で１枚のキャンバスに描く文字数（JISの１区分）と、セル間のすき間に足す余裕（ピクセル）
+ATLAS_TILE_GLYPHS = 94
+ATLAS_GUTTER_MARGIN = 2
+
+# 読み込んだフォントと作成したコード一覧のキャッシュ。一括ビルドでジョブをまたいで再利用するために使う
+FONT_CACHE = {}
+CMAP_CACHE = {}
+CODELIST_CACHE = None
 
 def GetMessage(isJapanese,msgKey):
     messages = {
@@ -49,17 +93,22 @@ Fonts commonly used in GUI-based operating systems (such as MS-Mincho) may not c
 Here is the information about free fonts suitable for small sizes, including those available for commercial use:
 - Information on Free Fonts: [http://jikasei.me/font/jf-dotfont/]
 - Direct Download Link: [https://ftp.iij.ad.jp/pub/osdn.jp/users/8/8541/jfdotfont-20150527.7z]""",
-"font_path": "Path to the TrueType font file (.ttf) to be converted.",
+"font_path": "Path to the font file to be converted.\n"
+            "TrueType/OpenType fonts (.ttf, .otf, .ttc) are rendered. BDF bitmap fonts (.bdf) are used as they are: each character is taken from the bitmap whose ENCODING matches (JIS codes for CHARSET_REGISTRY JISX0208, Unicode for ISO10646, single-byte codes otherwise), and placed in the -s size cell, padded or cropped.\n"
+            "FONTX2 fonts (name_zen.fnt / name_han.fnt) are also used as they are. Give either file; the other one of the pair is read too if it exists.",
 "--name" : "Specify the name of the structure to be generated in the C language header file.\nIf not specified, it will be automatically generated based on the file name or other arguments.",
 "--size" : "The size of the output bitmap. \n Multibyte characters (aka. 全角) are converted into squares with equal width and height. \nSingle-byte characters (aka. 半角) are drawn with a width that is half of the size specified here. \nIf not specified, the default size is 12.",
 "--xoffset" : "Specify the number of pixels to shift characters horizontally or vertically.\nWhen TrueType fonts are rendered, adjacent characters may appear too close together, making them difficult to read.\r\nTo avoid this, characters usually have extra padding on all sides—top, bottom, left, and right.\r\nDuring data conversion, this padding may cause characters to exceed the specified size (set with the -s option) or result in unnatural spacing between characters.\nUse this offset to minimize padding or position it as needed, improving control over the output.\nIf unspecified, the default value is 0.",
-"--yoffset" : "Reffer to -xo option.\n If not specified, the default value is -1.\n",
+"--yoffset" : "Reffer to -xo option.\n If not specified, the default value is -1 (0 for BDF and FONTX2 fonts).\n",
 "--codeset" : "Code Sets to Include in the Data\n" \
                 "- ALL: Includes JIS Level 1, Level 2 characters, various symbols, Kana, and all other supported characters.\n" \
                 "- LEVEL1: Includes JIS Level 1 characters, various symbols, Kana, and all other supported characters.\n" \
                 "- SCHOOL: Includes educational Kanji (learned by the end of 6th grade in elementary school), Hiragana, Katakana, and various symbols.\n" \
                 "- CUSTOM: Specify the characters used in a text file with the '-cf' argument.\n" \
                 "- TEST: A smaller set of characters intended for debugging purposes. Used during testing and contains fewer characters.\n" \
+                "Code sets can be combined with the operators & (intersection), | (union) and - (difference), evaluated from left to right.\n" \
+                "Operands are the names above, ASCII/JISL1/JISL2/KIGOU, 'charfile' (the file given with -cf) or the path of a character file.\n" \
+                "Separate operators with spaces and quote the expression. e.g. \"LEVEL1 & charfile\", \"SCHOOL | extra.txt\", \"ALL - (excluded.txt)\"\n" \
                 "If not specified, the default value is ALL. ",
 "--charfile" : "Specify a text file containing the list of characters to include in the output. \nEach character in the file will be used for font data generation. \nThis option is required when using the CUSTOM code set (-cs CUSTOM).",
 "--output" : "Specifies the name of the output file.\nDepending on the output type, half-width and full-width characters may be generated as separate files\nIf not specified, the file name will be automatically generated based on the source file name, font size, and code set.",
@@ -86,17 +135,64 @@ Here is the information about free fonts suitable for small sizes, including tho
             "PBinary: Outputs as binary files (for code and bitmap). \n" \
             "Python: Outputs as a Python file containing font data.\n" \
             "FONTX2: Outputs in FONTX2 format (alf-width and full-width characters are output as separate files." \
+            "BDF: Outputs in BDF format.\n" \
+            "Several formats can be given separated by commas (e.g. CData,FONTX2,BDF). Glyphs are rendered once and written in every format.\n" \
             "If not specified, the default is CData.", 
 "--filereplace" : "Replace inappropriate characters in output file names (such as spaces and mathematical symbols) with underscores.",
 "--bdf-split" : "If set with -t BDF, outputs half-width and full-width characters as separate BDF files.",
+"--byteorder" : "Byte order of the records in the _code.bin file with -t PBinary (big or little).",
+"--bin-header" : "With -t PBinary, put a 16-byte header at the start of the _code.bin file.\n"
+            "Magic \"PFCB\", version, byte order ('B' or 'L'), record size, record count and bitmap data size.",
+"--python-format" : "Form of the data with -t Python.\n"
+            "list: Lists of integers, as before (default).\n"
+            "bytes: The code table and bitmap as single bytes literals, plus a find() helper that bisects an index. Imports in milliseconds.\n"
+            "base85: Like bytes, but base85-encoded. The file is smaller, but decoding takes about 0.2 seconds per MB at import.",
+"--engine" : "Rendering engine.\n"
+            "glyph: Draw each character on its own image (default).\n"
+            "atlas: Draw 94 characters at a time on one canvas, with gaps between the cells so that no character can reach into its neighbour, and cut them out with numpy. Same result, faster at small sizes.\n"
+            "mask: Take each character's coverage mask straight from FreeType and threshold it into the cell, without creating an image. Same result.",
+"--no-bits-comment" : "With -t CData, leave out the binary comment (// 00111100) at the end of each bitmap row.",
+"--no-dedup" : "Do not merge identical glyph bitmaps.\n"
+            "By default, with -t CData, PBinary and Python, characters whose bitmaps are byte-for-byte identical (blanks, look-alike variants, ...) share one copy of the bitmap data, and their offsetBMP points at the same position.\n"
+            "FONTX2 and BDF store one bitmap per character, so they are not affected.",
+"--compress" : "Compress each glyph bitmap with -t CData and PBinary.\n"
+            "none: No compression (default).\n"
+            "packbits: PackBits run-length encoding of the bitmap rows. offsetBMP points at the compressed data, and a C function DecodeKanjiBitmap() that expands one glyph is written into the header (CData) or into name_decoder.h (PBinary).",
+"--hash-index" : "With -t CData, add a minimal perfect hash over the codes of the output encoding (-en), and a C function name_FindKanji(code) that finds a character with at most two hashes and one compare instead of a binary search.\n"
+            "Adds about 3 bytes per character to the data.",
+"--kuten-index" : "With -t CData, add a direct index for JIS and Shift_JIS codes: a 256-entry table for single-byte codes and, for each of the 94 ku (rows), presence bits of the ten (cells) and base positions.\n"
+            "The C functions name_FindJIS(code) and name_FindSJIS(code) compute the position of a character without searching.\n"
+            "About 2 KB. When the output is sorted by UTF8, a table of 2 bytes per character is added.",
+"--no-embedded-bitmap" : "Always render the characters.\n"
+            "By default, if the font contains embedded bitmaps (EBLC/EBDT, or CBLC/CBDT) for the size given with -s, those hand-tuned bitmaps are used as they are, and only characters missing from them are rendered.",
+"--missing" : "How to handle characters that the font does not contain. Before rendering, each character of the code set is looked up in the cmap of the font (for BDF and FONTX2 fonts, in their glyphs).\n"
+            "render: Do not check; render every character (default). Missing characters come out as the font's .notdef box or blank.\n"
+            "drop: Leave missing characters out of the output.\n"
+            "alias: Keep them, but render one fallback glyph (per width) and let all of them share it.\n"
+            "report: Print the missing characters, and render every character.",
+"--watch" : "Watch mode. Keep running and watch the font file and the character files.\n"
+            "When one of them changes, the character set is rebuilt, only newly added characters are rendered, removed ones are dropped, and the output is rewritten.\n"
+            "Press Ctrl+C to stop.",
 "--verbose" : "Enable verbose output mode.\n",
 "--image" : "To assist with debugging, the screen displays the characters being converted during execution. This is useful when adjusting xoffset and yoffset\n",
-"--encoding" : "Encoding to use for the output file. " ,
+"--encoding" : "Encoding to use for the output file. (UTF8, SJIS or JIS)\n"
+            "When several output types are given with -t, one encoding per output type can be given separated by commas (e.g. UTF8,SJIS,JIS).\n"
+            "A single value applies to all output types. If not specified, the default depends on the output type." ,
+"--cache-dir" : "Directory of the glyph cache.\n"
+            "Rendered glyphs are stored on disk, keyed by the font file contents, size, x/y offsets, mapping and character code.\n"
+            "Later runs with the same parameters render only glyphs that are not in the cache. If not specified, no cache is used.",
+"--cache-size" : "Maximum size of the glyph cache in megabytes. Least recently used glyphs are removed when it is exceeded.\n"
+            "If not specified, the default value is 256.",
+"--jobs" : "Number of worker processes used to render glyphs.\n"
+            "The code list is split into chunks and rendered in parallel. The output is identical to a single-process run.\n"
+            "0 uses all CPU cores. If not specified, the default value is 1 (no parallel rendering).",
 "err_codeblock" : "Error: Block number overflow. In FONTX, consecutive character codes are managed as blocks in a table and maximum block number is 256.\n" 
                     "This character set required {} of blocks and unable to represent in FONTX2 format." 
                     "Change the code set specified with -cs or output in a format other than FONTX2." ,
 "err_codefileReqired" : "Error: -cf option is required when -cs CUSTOM is specified." ,
 "err_codefilenotexist" : "Error: The specified character file {} does not exist. Please check the path and file name." ,
+"err_codesetsyntax" : "Error: Invalid code set expression \"{}\". Separate operators (&, |, -) with spaces." ,
+"err_codesetunknown" : "Error: {} in the code set expression is neither a code set name nor an existing character file." ,
 "err_invalidcodepoint" : "Error: Invalid Unicode code-point {}.",
 "err_decordingerror":  "Error: Decorging error for {} : {}",
 "err_fontfilenotexist" : "Error: The specified font file {} does not exist. Please check the path and file name.",
@@ -105,6 +201,19 @@ Here is the information about free fonts suitable for small sizes, including tho
 "err_notsupportedencoding" : "Error: The specified encoding {} is not supported.",
 "err_cannotuseenc" : "Error: The specified encoding {} cannot use in {}.",
 "err_bdfsplitonlybdf": "Error: The --bdf-split option can only be used with the BDF output type (-t BDF).",
+"err_compressonly": "Error: The --compress option can only be used with the CData or PBinary output type (-t CData / -t PBinary).",
+"err_hashindexonlycdata": "Error: The --hash-index option can only be used with the C header output type (-t CData).",
+"err_kutenindexonlycdata": "Error: The --kuten-index option can only be used with the C header output type (-t CData).",
+"err_kutenindexsize": "Error: --kuten-index supports up to 65534 characters ({} characters).",
+"err_manifestnotexist" : "Error: The specified manifest file {} does not exist.",
+"err_manifestinvalid" : "Error: Failed to read the manifest file {}. Exception: {}",
+"err_manifestnofont" : "Error: A job in the manifest has no font. {}",
+"err_manifestkey" : "Error: Unknown key {} in the manifest.",
+"err_manifestduplicateoutput" : "Error: Two jobs in the manifest write the same output file {}.\n  {}\n  {}\nGive each job its own output, or leave output unset when font, size or codeset is a list.",
+"err_notsupportedouttype" : "Error: The specified output type {} is not supported. Use CData, PBinary, Python, FONTX2 or BDF.",
+"err_duplicateouttype" : "Error: The output type {} is specified more than once.",
+"err_hashseed" : "Error: Could not build the perfect hash for --hash-index (no displacement up to {} places the {} codes of a bucket). Please run without --hash-index.",
+"err_encodingcount" : "Error: The number of encodings ({}) does not match the number of output types ({}).",
 
 
 "log_gencodetbl" : "Generating code table for {} characters....",
@@ -138,6 +247,34 @@ Here is the information about free fonts suitable for small sizes, including tho
 "log_converting" : "Converting UTF-8:{}, SJIS:{}, JIS:{}, Character:\"{}\",Offset:{}",
 "log_doneconvert" : "done. code list count = {} , bitmap list count = {}",
 "log_genoutput" : "Generating output file {}",
+"log_parallel" : "Rendering glyphs with {} worker processes....",
+"log_cachestat" : "Glyph cache: {} hits, {} glyphs to render.",
+"log_watching" : "Watching for changes. Press Ctrl+C to stop....",
+"log_watchrebuilt" : "Rebuilt {} : {} characters added, {} removed ({:.0f} ms).",
+"log_watchstop" : "Stopped watching.",
+"log_atlas" : "Rendering with the atlas engine. {} characters per canvas, gap between cells: {} pixels",
+"log_strikefound" : "Using the embedded bitmaps of the font for {} pixels ({} glyphs). Characters not in it are rendered.",
+"log_strike" : "Embedded bitmaps ({} pixels): {} characters taken from the font, {} characters to render.",
+"log_bdffound" : "Using the BDF font as it is ({} glyphs, CHARSET_REGISTRY {}).",
+"log_bdf" : "BDF font: {} characters taken from the font, {} characters not in it are filled with DEFAULT_CHAR (or left blank).",
+"log_fontx2found" : "Using the FONTX2 font as it is ({} full-width and {} half-width characters, {} dots).",
+"log_fontx2" : "FONTX2 font: {} characters taken from the font, {} characters not in it are left blank.",
+"log_missingdrop" : "{} of {} characters are not in the font and were dropped.",
+"log_missingalias" : "{} of {} characters are not in the font and share one fallback glyph.",
+"log_missingreport" : "{} of {} characters are not in the font: {}",
+"log_dedup" : "Bitmap dedup: {} characters share an identical bitmap, {} bytes saved (bitmap data: {} bytes).",
+"log_compress" : "Bitmap compression ({}): {} -> {} bytes, ratio {:.1%}.",
+"log_buildbuilt" : "[{}/{}] built: {}",
+"log_buildskipped" : "[{}/{}] up to date: {}",
+"log_buildfailed" : "[{}/{}] failed: {}\n\t{}",
+"log_builddone" : "Build finished. {} jobs, {} failed.",
+"build_general" : "Build all font data listed in a manifest file (TOML or JSON).\n"
+            "[defaults] holds settings for all jobs, and each [[jobs]] entry holds the settings of one job, using the long option names (font, size, codeset, outtype, ...).\n"
+            "A list given for font, size or codeset expands into one job per combination.\n"
+            "All jobs run on one process pool, and jobs whose outputs are newer than their inputs are skipped.",
+"build_manifest" : "Path to the manifest file. Relative paths in the manifest are resolved from its directory.",
+"build_jobs" : "Number of worker processes. If not specified, all CPU cores are used.",
+"build_force" : "Build all jobs even if their outputs are up to date.",
 },
     "ja" : {
 "general" : 
@@ -151,17 +288,22 @@ GUIベースのオペレーティングシステム（MS-Minchoなど）で一
 以下は、商用利用可能な小型サイズに適した無料フォントに関する情報です。
 - 無料フォントの情報: [http://jikasei.me/font/jf-dotfont/]
 - 直接ダウンロードリンク: [https://ftp.iij.ad.jp/pub/osdn.jp/users/8/8541/jfdotfont-20150527.7z]""",
-"font_path": "変換するTrueTypeフォントファイル(.ttf)のパスを指定します。",
+"font_path": "変換するフォントファイルのパスを指定します。\n"
+            "TrueType/OpenTypeフォント(.ttf, .otf, .ttc)はレンダリングします。BDFのビットマップフォント(.bdf)はそのまま使います。ENCODINGが一致するビットマップ（CHARSET_REGISTRYがJISX0208ならJISコード、ISO10646ならUnicode、それ以外は１バイトコード）を、-s の大きさのセルに、余白を付けるか切って置きます。\n"
+            "FONTX2フォント（名前_zen.fnt / 名前_han.fnt）もそのまま使います。どちらか一方を指定すると、対になるもう一方のファイルがあれば一緒に読みます。",
 "--name" : "C言語ヘッダファイルで生成される構造体の名前を指定します。\r\n指定しない場合は、ファイル名や他の引数に基づいて自動的に生成されます。",
 "--size" : "出力されるビットマップのサイズを指定します。\r\nマルチバイト文字（全角）は、指定されたサイズの正方形に変換されます。\r\nシングルバイト文字（半角）は、指定されたサイズの半分の幅で描画されます。\r\n指定しない場合、デフォルトサイズは12です。",
 "--xoffset" : "文字を水平方向または垂直方向にシフトするピクセル数を指定します。\r\nTrueTypeフォントが描画されると、隣接する文字が近すぎて読みづらくなることがあります。\r\nこれを避けるために、通常、文字は上下左右に余分なパディングをもっています。\r\nデータ変換中、このパディングが原因で指定されたサイズ（-sオプションで設定）を超えたり、不自然な文字間の空白が生じる可能性があります。\r\nこのオフセットを使用して、パディングを最小限に抑えるか、必要な場所に配置し、出力の制御を改善します。\r\n指定しない場合、デフォルト値は0です。",
-"--yoffset" : "xoオプションを参照してください。\n指定しない場合、デフォルト値は-1です。\n",
+"--yoffset" : "xoオプションを参照してください。\n指定しない場合、デフォルト値は-1（BDFとFONTX2フォントでは0）です。\n",
 "--codeset" : "データに含める文字セットを指定します。\n" \
                 "- ALL: JISレベル1、レベル2の文字、各種記号、カタカナ、ひらがななど、サポートされているすべての文字を含みます。\n" \
                 "- LEVEL1: JISレベル1の文字、各種記号、カタカナ、ひらがななど、サポートされているすべての文字を含みます。\n" \
                 "- SCHOOL: 小学校6年生までに学習する教育漢字、ひらがな、カタカナ、各種記号を含みます。\n" \
                 "- CUSTOM: '-cf'引数で指定されたテキストファイルに使用されている文字を指定します。\n" \
                 "- TEST: デバッグ目的で使用される小さな文字セット。テスト用に使用され、文字数が少ないです。ソースコードを変更してください\n" \
+                "コードセットは、演算子 &（積）、|（和）、-（差）で組み合わせることができます。演算は左から順に行われます。\n" \
+                "演算の対象には、上記の名前、ASCII/JISL1/JISL2/KIGOU、'charfile'（-cfで指定したファイル）、文字ファイルのパスが使えます。\n" \
+                "演算子の前後は空白で区切り、式全体を引用符で囲んでください。例： \"LEVEL1 & charfile\", \"SCHOOL | extra.txt\", \"ALL - (excluded.txt)\"\n" \
                 "指定しない場合、デフォルト値はALLです。",
 "--charfile" : "出力に含める文字のリストを含むテキストファイルを指定します。\n各文字は、フォントデータ生成に使用されます。\nCUSTOMコードセット（-cs CUSTOM）を使用する場合、このオプションは必須です。",
 "--output" : "出力ファイルの名前を指定します。\n指定しない場合、ソースファイル名、フォントサイズ、コードセットに基づいて自動的に生成されます。出力タイプによっては半角文字と全角文字が別々のファイルとして出力されることもあります。",
@@ -185,17 +327,64 @@ GUIベースのオペレーティングシステム（MS-Minchoなど）で一
             "PBinary: バイナリファイルとして出力（コードとビットマップ用）。\n" \
             "Python: フォントデータを含むPythonファイルとして出力。\n" \
             "FONTX2: FONTX2形式で出力（半角文字と全角文字は別々のファイルとして出力）。\n" \
+            "BDF: BDF形式で出力。\n" \
+            "カンマ区切りで複数の形式を指定できます（例：CData,FONTX2,BDF）。グリフは一度だけレンダリングされ、すべての形式で出力されます。\n" \
             "指定しない場合、デフォルトはCDataです。",
 "--filereplace" : "出力ファイル名の不適切な文字（スペースや数学記号など）をアンダースコアに置き換えます。",
 "--bdf-split" : "BDF形式で出力する場合、半角文字と全角文字を別々のBDFファイルとして出力します。",
+"--byteorder" : "バイナリ形式（-t PBinary）で出力する場合の、_code.bin のレコードのバイト順を指定します（big または little）。",
+"--bin-header" : "バイナリ形式（-t PBinary）で出力する場合、_code.bin の先頭に16バイトのヘッダを付けます。\n"
+            "マジック \"PFCB\"、バージョン、バイト順（'B' または 'L'）、レコードサイズ、レコード数、ビットマップデータのサイズが入ります。",
+"--python-format" : "Python形式（-t Python）で出力する場合の、データの形式を指定します。\n"
+            "list: 従来どおり整数のリストで出力します（デフォルト）。\n"
+            "bytes: コード表とビットマップを１つずつのbytesリテラルで出力し、索引を二分探索する find() を付けます。importが数ミリ秒で終わります。\n"
+            "base85: bytesと同じですが、base85で符号化します。ファイルは小さくなりますが、importのときの復号に1MBあたり約0.2秒かかります。",
+"--engine" : "レンダリング方式を指定します。\n"
+            "glyph: １文字ずつ画像を作って描画します（デフォルト）。\n"
+            "atlas: 94文字ずつ１枚のキャンバスに、隣の文字がはみ出さないようすき間を空けて描画し、numpyで切り出します。結果は同じで、小さいサイズでは速くなります。\n"
+            "mask: 画像を作らずに、FreeTypeから文字の濃淡（マスク）を直接受け取り、しきい値で白黒にしてセルに置きます。結果は同じです。",
+"--no-bits-comment" : "Cヘッダ形式（-t CData）で出力する場合、ビットマップの各行の末尾の２進数のコメント（// 00111100）を出力しません。",
+"--no-dedup" : "同じビットマップをまとめません。\n"
+            "デフォルトでは、-t CData、PBinary、Python で出力する場合、ビットマップのバイト列が同じ文字（空白や、同じ形の異体字など）はビットマップデータを共有し、offsetBMPは同じ位置を指します。\n"
+            "FONTX2とBDFは１文字ごとにビットマップを持つ形式なので、影響しません。",
+"--compress" : "Cヘッダ形式（-t CData）とバイナリ形式（-t PBinary）で、ビットマップを１文字ずつ圧縮します。\n"
+            "none: 圧縮しません（デフォルト）。\n"
+            "packbits: ビットマップの行をPackBits（ランレングス圧縮）で圧縮します。offsetBMPは圧縮したデータの位置を指し、１文字を展開するCの関数 DecodeKanjiBitmap() を、ヘッダ（CData）または 名前_decoder.h（PBinary）に出力します。",
+"--hash-index" : "Cヘッダ形式（-t CData）で出力する場合、出力のエンコーディング（-en）のコードの最小完全ハッシュ表と、二分探索の代わりに最大２回のハッシュと１回の比較で文字を探すCの関数 名前_FindKanji(code) を出力します。\n"
+            "データは１文字あたり約3バイト大きくなります。",
+"--kuten-index" : "Cヘッダ形式（-t CData）で出力する場合、JISとシフトJISのコードの直接索引を出力します。１バイトコードの256個の表と、94区それぞれの、点の有無のビットと基準位置の表です。\n"
+            "Cの関数 名前_FindJIS(code) と 名前_FindSJIS(code) で、探さずに文字の位置を計算できます。\n"
+            "大きさは約2KBです。UTF8の順で出力する場合は、１文字あたり2バイトの表が加わります。",
+"--no-embedded-bitmap" : "常に文字をレンダリングします。\n"
+            "デフォルトでは、フォントに -s と同じサイズの埋め込みビットマップ（EBLC/EBDT、またはCBLC/CBDT）があれば、手で調整されたそのビットマップをそのまま使い、そこにない文字だけをレンダリングします。",
+"--missing" : "フォントにない文字の扱いを指定します。レンダリングの前に、コードセットの各文字をフォントのcmap（BDF・FONTX2フォントではそのグリフ）で調べます。\n"
+            "render: 調べずに、すべての文字をレンダリングします（デフォルト）。フォントにない文字は、フォントの.notdefの四角か空白になります。\n"
+            "drop: フォントにない文字を出力しません。\n"
+            "alias: フォントにない文字も出力しますが、代わりのグリフを（幅ごとに）１つだけレンダリングし、すべてでそれを共有します。\n"
+            "report: フォントにない文字を表示し、すべての文字をレンダリングします。",
+"--watch" : "監視モード。終了せずに、フォントファイルと文字ファイルの更新を監視します。\n"
+            "更新されると文字セットを作り直し、追加された文字だけをレンダリングし、削除された文字を取り除いて、出力ファイルを書き直します。\n"
+            "Ctrl+Cで終了します。",
 "--verbose" : "出力の詳細を表示します。\n" ,
 "--image": " デバッグのため、実行中に変換している文字の画面を表示させます。xoffsetやyoffsetの調整を行う際に便利です。\n" ,
-"--encoding" : "使用されるエンコーディングを指定します。 " ,
+"--encoding" : "使用されるエンコーディング（UTF8、SJIS、JIS）を指定します。\n"
+            "-tで複数の出力形式を指定した場合は、カンマ区切りで出力形式ごとのエンコーディングを指定できます（例：UTF8,SJIS,JIS）。\n"
+            "１つだけ指定した場合は、すべての出力形式に使われます。指定しない場合、デフォルト値は出力形式により異なります。" ,
+"--cache-dir" : "グリフキャッシュのディレクトリを指定します。\n"
+            "レンダリングしたグリフを、フォントファイルの内容・サイズ・X/Yオフセット・マッピング・文字コードをキーにしてディスクに保存します。\n"
+            "同じ条件で再度実行すると、キャッシュにないグリフだけをレンダリングします。指定しない場合、キャッシュは使用しません。",
+"--cache-size" : "グリフキャッシュの最大サイズをメガバイト単位で指定します。超えた場合は、最後に使われた時刻が古いものから削除されます。\n"
+            "指定しない場合、デフォルト値は256です。",
+"--jobs" : "グリフのレンダリングに使用するワーカープロセスの数を指定します。\n"
+            "コード一覧をチャンクに分割して並列にレンダリングします。出力は１プロセスで実行した場合と同じです。\n"
+            "0を指定すると、すべてのCPUコアを使用します。指定しない場合、デフォルト値は1（並列化しない）です。",
 "err_codeblock" : "エラー: ブロック番号のオーバーフローです。FONTXでは、連続する文字コードはテーブル内のブロックとして管理され、最大ブロック数は256です。\n" \
                 "この文字セットでは{}のブロックが必要で、FONTX2形式で表現できません。\n" \
                 "コードセットを変更するか、FONTX2以外の形式で出力してください。",
 "err_codefileReqired" : "エラー: -cs CUSTOMを指定した場合、-cfオプションが必要です。",
 "err_codefilenotexist" : "エラー: 指定された文字ファイル {} が存在しません。パスとファイル名を確認してください。",
+"err_codesetsyntax" : "エラー: コードセットの式 \"{}\" が不正です。演算子（&, |, -）の前後は空白で区切ってください。",
+"err_codesetunknown" : "エラー: コードセットの式の {} は、コードセットの名前でも、存在する文字ファイルでもありません。",
 "err_invalidcodepoint" : "エラー: Unicode {} のコードポイントが不正です",
 "err_decordingerror":  "エラー: 文字 {} のデコードに失敗しました: {}",
 "err_fontfilenotexist" : "エラー: 指定されたフォントファイル {} が存在しません。パスとファイル名を確認してください。",
@@ -204,6 +393,19 @@ GUIベースのオペレーティングシステム（MS-Minchoなど）で一
 "err_notsupportedencoding" : "エラー: 指定されたエンコーディング {} はサポートされていません。",
 "err_cannotuseenc" : "エラー: 指定されたエンコーディング {} は {} では使用できません。",
 "err_bdfsplitonlybdf": "エラー: --bdf-splitオプションはBDF出力タイプ（-t BDF）でのみ使用できます。",
+"err_compressonly": "エラー: --compressオプションはCヘッダ形式またはバイナリ形式（-t CData / -t PBinary）でのみ使用できます。",
+"err_hashindexonlycdata": "エラー: --hash-indexオプションはCヘッダ形式（-t CData）でのみ使用できます。",
+"err_kutenindexonlycdata": "エラー: --kuten-indexオプションはCヘッダ形式（-t CData）でのみ使用できます。",
+"err_kutenindexsize": "エラー: --kuten-indexで扱える文字数は65534文字までです（{}文字）。",
+"err_manifestnotexist" : "エラー: 指定されたマニフェストファイル {} が存在しません。",
+"err_manifestinvalid" : "エラー: マニフェストファイル {} の読み込みに失敗しました。例外：{}",
+"err_manifestnofont" : "エラー: マニフェストのジョブにフォントが指定されていません。{}",
+"err_manifestkey" : "エラー: マニフェストに不明なキー {} があります。",
+"err_manifestduplicateoutput" : "エラー: マニフェストの２つのジョブが、同じ出力ファイル {} に書き込みます。\n  {}\n  {}\nジョブごとに別のoutputを指定するか、font・size・codesetをリストにする場合はoutputを指定しないでください。",
+"err_notsupportedouttype" : "エラー: 指定された出力形式 {} はサポートされていません。CData、PBinary、Python、FONTX2、BDFのいずれかを指定してください。",
+"err_duplicateouttype" : "エラー: 出力形式 {} が２回以上指定されています。",
+"err_hashseed" : "エラー: --hash-index の完全ハッシュを作れませんでした（{}までの変位で、バケットの{}個のコードを置けません）。--hash-index を指定せずに実行してください。",
+"err_encodingcount" : "エラー: エンコーディングの数（{}）が、出力形式の数（{}）と一致しません。",
 
 "log_gencodetbl" : "{}文字のコードテーブルを生成しています....",
 "log_removingcodetbl" : "教育漢字以外の文字を削除しています....",
@@ -235,6 +437,34 @@ GUIベースのオペレーティングシステム（MS-Minchoなど）で一
 "log_converting" : "変換中: UTF-8:{}, SJIS:{}, JIS:{}, 文字:\"{}\", オフセット:{}",
 "log_doneconvert" : "完了しました。コードリストの数 = {} , ビットマップリストの数 = {}",
 "log_genoutput" : "出力ファイル {} を生成しています",
+"log_parallel" : "{}個のワーカープロセスでグリフをレンダリングしています....",
+"log_cachestat" : "グリフキャッシュ: {}個がキャッシュにあり、{}個をレンダリングします。",
+"log_watching" : "更新を監視しています。Ctrl+Cで終了します....",
+"log_watchrebuilt" : "{} を作り直しました。追加 {}文字、削除 {}文字（{:.0f} ms）。",
+"log_watchstop" : "監視を終了しました。",
+"log_atlas" : "アトラス方式でレンダリングします。キャンバス１枚あたり{}文字、セル間のすき間：{}ピクセル",
+"log_strikefound" : "フォントに埋め込まれた{}ピクセルのビットマップ（{}グリフ）を使います。そこにない文字はレンダリングします。",
+"log_strike" : "埋め込みビットマップ（{}ピクセル）: {}文字をフォントから取り、{}文字をレンダリングします。",
+"log_bdffound" : "BDFフォントをそのまま使います（{}グリフ、CHARSET_REGISTRY {}）。",
+"log_bdf" : "BDFフォント: {}文字をフォントから取り、フォントにない{}文字はDEFAULT_CHAR（なければ空白）にします。",
+"log_fontx2found" : "FONTX2フォントをそのまま使います（全角{}文字、半角{}文字、{}ドット）。",
+"log_fontx2" : "FONTX2フォント: {}文字をフォントから取り、フォントにない{}文字は空白にします。",
+"log_missingdrop" : "{1}文字のうち{0}文字はフォントにないので、取り除きました。",
+"log_missingalias" : "{1}文字のうち{0}文字はフォントにないので、１つの代わりのグリフを共有させます。",
+"log_missingreport" : "{1}文字のうち{0}文字はフォントにありません: {2}",
+"log_dedup" : "ビットマップの重複: {}文字が同じビットマップを共有し、{}バイト減りました（ビットマップデータ: {}バイト）。",
+"log_compress" : "ビットマップの圧縮（{}）: {} → {}バイト、圧縮率 {:.1%}。",
+"log_buildbuilt" : "[{}/{}] 作成しました: {}",
+"log_buildskipped" : "[{}/{}] 最新です: {}",
+"log_buildfailed" : "[{}/{}] 失敗しました: {}\n\t{}",
+"log_builddone" : "一括ビルドが終了しました。ジョブ数 {}、失敗 {}。",
+"build_general" : "マニフェストファイル（TOMLまたはJSON）に記述されたフォントデータを一括して作成します。\n"
+            "[defaults] には全ジョブ共通の設定を、[[jobs]] にはジョブごとの設定を、長いオプション名（font, size, codeset, outtype など）で記述します。\n"
+            "font、size、codesetにリストを指定すると、その組み合わせの数だけジョブに展開されます。\n"
+            "すべてのジョブは１つのプロセスプールで実行され、出力ファイルが入力ファイルより新しいジョブは飛ばされます。",
+"build_manifest" : "マニフェストファイルのパスを指定します。マニフェスト内の相対パスは、マニフェストファイルのあるディレクトリからのパスになります。",
+"build_jobs" : "ワーカープロセスの数を指定します。指定しない場合は、すべてのCPUコアを使用します。",
+"build_force" : "出力ファイルが最新でも、すべてのジョブを実行します。",
 },
 
     }
@@ -249,6 +479,8 @@ GUIベースのオペレーティングシステム（MS-Minchoなど）で一
 
 #二段階入れ子の要素数
 def total_size(obj):
+    if isinstance(obj, GlyphStore):     # GlyphStoreは合計サイズを持っている
+        return obj.nbytes
     count = 0
     
     for item in obj:
@@ -332,66 +564,83 @@ def render_glyph_to_bitmap(font, char_unicode , char, font_XSize=64,font_YSize=6
         print("\t\t" + GetMessage(isJapanese,"log_donewithsize").format(image.size))
     return image
 
+## グレースケールの画素配列を、しきい値128で白黒にしてビット配列に詰める
+# 最後の軸（X方向）を８ドットずつ１バイトにする。packbitsは行末の端数ビットを0で埋めるので、行ごとのパディングは不要。
+# 2次元（１文字）でも、3次元（複数文字をまとめたもの）でも、１回のpackbitsで処理できる。
+def pack_bitmap_array(pixels):
+    binary_bitmap = np.asarray(pixels) < 128           # しきい値128で白黒に変換（bool配列のまま使う）
+    return np.packbits(binary_bitmap, axis=-1)
+
 ## 画像データを、ビットマップ配列にする
 def display_bitmap_data(image):
-    # 画像データをNumPy配列に変換
-    bitmap_data = np.array(image)
-    #print("ビットマップデータ:")
-    #print(bitmap_data)  # 数値データをコンソールに表示
-
-    # ビットマップとして0と1のデータに変換
-    binary_bitmap = (bitmap_data < 128).astype(int)  # しきい値128で白黒に変換
-    #print("バイナリ形式のビットマップデータ:")
-    #print(binary_bitmap)  # コンソールに0と1のデータ
-    
-    ArraySizeY,ArraySizeX  = binary_bitmap.shape
-    ArraySizeX = round(ArraySizeX/8)
-    if (ArraySizeX == 0) :
-        ArraySizeX = 1
-    
-    bitArray = np.zeros((ArraySizeY, ArraySizeX), dtype=np.uint8)  # ビット配列を初期化
-
-
-    for i , row in enumerate(binary_bitmap) :
-        padding_length = padding_length = (8 - len(row) % 8) % 8
-        #print (f"{padding_length}")
-        padded_row = np.pad(row,  ( 0,padding_length), constant_values= 0 ) 
-        #print(f"{padded_row}")
-        byte_array = np.packbits(padded_row)  # ビットをバイトに変換
-        #print("value=",end=":")
-        for value in byte_array :
-            #print(bin(value)[2:].zfill(8),end="")  # バイナリ形式で表示
-            bitArray[i] = byte_array
-
-    return bitArray
+    return pack_bitmap_array(image)
 
 
 
 
 import codecs
 # JISコードをShift-JISとUTF-8に変換する関数
+# JIS X 0208 の区点表を作るときにだけ使う。未定義の区点では例外を出さずに 0,0,0 を返す。
 def jis_to_encodings(jis_code):
     """
     JISコードをShift-JISとUTF-8に変換してタプルで返す
     """
-    try:
-        # JISコードをバイト列に変換
-        jis_bytes = jis_code.to_bytes(2, byteorder='big')
-        jis_bytes = b'\x1b$B' + jis_bytes
+    # JISコードをバイト列に変換
+    jis_bytes = jis_code.to_bytes(2, byteorder='big')
+    jis_bytes = b'\x1b$B' + jis_bytes
 
-        # JISコードをUnicodeにデコード（iso2022_jp）
-        unicode_char = codecs.decode(jis_bytes, 'iso2022_jp')
-        
-        # Unicode文字をShift-JISとUTF-8にエンコード
-        shift_jis_bytes = unicode_char.encode('shift_jis')
-        sjis_code = int.from_bytes(shift_jis_bytes, byteorder='big')
-        utf8_bytes = unicode_char.encode('utf-8')
-        utf8_code = int.from_bytes(utf8_bytes, byteorder='big')
-
-        # 文字列形式の返却
-        return (jis_code, sjis_code, utf8_code)
-    except Exception as e:
+    # JISコードをUnicodeにデコード（iso2022_jp）。未定義の区点は置換文字になる。
+    unicode_char = codecs.decode(jis_bytes, 'iso2022_jp', errors='replace')
+    if len(unicode_char) != 1 or unicode_char == '�':
+        return 0,0,0
+
+    # Unicode文字をShift-JISとUTF-8にエンコード。Shift-JISで表せない文字は '?' になる。
+    shift_jis_bytes = unicode_char.encode('shift_jis', errors='replace')
+    if shift_jis_bytes == b'?':
         return 0,0,0
+    sjis_code = int.from_bytes(shift_jis_bytes, byteorder='big')
+    utf8_bytes = unicode_char.encode('utf-8')
+    utf8_code = int.from_bytes(utf8_bytes, byteorder='big')
+
+    # 文字列形式の返却
+    return (jis_code, sjis_code, utf8_code)
+
+# JIS X 0208 の区点（94×94）ごとの Shift-JIS / UTF-8 / 文字 の表。
+# 最初に使うときに一度だけ作成し、以降はコード表の作成を配列の参照だけで行う。
+# 未定義の区点は、SJIS/UTF-8ともに0になっている。
+JIS_TABLE = None
+
+def getJisTable():
+    global JIS_TABLE
+    if JIS_TABLE is None:
+        sjisTbl = np.zeros((94, 94), dtype=np.uint16)
+        utf8Tbl = np.zeros((94, 94), dtype=np.uint32)
+        charTbl = np.full((94, 94), "", dtype=object)
+        for ku in range(94):
+            for ten in range(94):
+                codeJIS, codeSJIS, codeUTF8 = jis_to_encodings(((ku + 0x21) << 8) | (ten + 0x21))
+                if codeJIS == 0 or codeSJIS == 0 or codeUTF8 == 0:
+                    continue
+                sjisTbl[ku, ten] = codeSJIS
+                utf8Tbl[ku, ten] = codeUTF8
+                charTbl[ku, ten] = decode_utf8(codeUTF8)
+        JIS_TABLE = (sjisTbl, utf8Tbl, charTbl)
+    return JIS_TABLE
+
+# JISコードの配列から、Shift-JIS / UTF-8 / 文字 の配列を引く関数
+# 区点の範囲外や未定義のコードは、SJIS/UTF-8が0になる。
+def lookupJisCodes(codesJIS):
+    sjisTbl, utf8Tbl, charTbl = getJisTable()
+    codesJIS = np.asarray(codesJIS, dtype=np.int64)
+    ku = (codesJIS >> 8) - 0x21
+    ten = (codesJIS & 0xFF) - 0x21
+    valid = (ku >= 0) & (ku < 94) & (ten >= 0) & (ten < 94)
+    ku = np.where(valid, ku, 0)
+    ten = np.where(valid, ten, 0)
+    codesSJIS = np.where(valid, sjisTbl[ku, ten], 0)
+    codesUTF8 = np.where(valid, utf8Tbl[ku, ten], 0)
+    chars = np.where(valid, charTbl[ku, ten], "")
+    return codesSJIS, codesUTF8, chars
 
 # JISコードの範囲を指定して、Shift-JISとUTF-8に変換する関数
 # 0x00～0xFFの場合は、JIS、SJIS、UTF-8は同じ値になる
@@ -399,66 +648,1047 @@ def jis_to_encodings(jis_code):
 def getCodeTbl(codeRange): 
     if (isVerbose):
         print("\t"+GetMessage(isJapanese,"log_getcodetbl").format(hex(codeRange.start),hex(codeRange.stop)))  
-    CodeList = []
-    for code in codeRange:
-        
-        if (code >= 0x00 and  code <= 0xFF):
-            if (isVerbose):
-                print(f"\t\t" + GetMessage(isJapanese,"log_analyzingcode").format(hex(code)),end="")
-            if mapping == "KANA" and code >= 0xA1 and code <= 0xDF :  # カナ文字にマッピングする場合、半角カナ文字は、全角カナ文字にマッピングを変える
-                if (isVerbose):
-                    print(GetMessage(isJapanese,"log_ishankakukana").format(hex(code)))
-                char = chr(code - 0xa1 + 0xFF61)
-                codeList.append([code,code,code,char,0,0,0])
-            else:                                                   # 半角文字、カナ文字マッピングを行わない場合                                           
-                char = chr(code)
-                if char.isprintable():                     # 印刷できる文字の場合
-                    if (isVerbose):
-                        print(GetMessage(isJapanese,"log_isascii").format(hex(code),code))
-                else:
-                    if (isVerbose):
-                        print(GetMessage(isJapanese,"log_isnonprintableascii").format(hex(code)))
-                    char = "0x" + hex(code)[2:].zfill(2)            # 印刷できない文字は、コードをそのまま表示する
-                codeList.append([code,code,code,char,0,0,0])
-            if (isVerbose):
-                print("\t\t\t" + GetMessage(isJapanese,"log_codedisp").format(hex(code),hex(code),hex(code)))
+    return getCodeTblFromCodes(np.arange(codeRange.start, codeRange.stop, codeRange.step))
+
+# １バイトコードの表示文字を返す関数
+def singleByteChar(code):
+    if mapping == "KANA" and code >= 0xA1 and code <= 0xDF :  # カナ文字にマッピングする場合、半角カナ文字は、全角カナ文字にマッピングを変える
+        return chr(code - 0xa1 + 0xFF61)
+    char = chr(code)
+    if not char.isprintable():
+        char = "0x" + hex(code)[2:].zfill(2)            # 印刷できない文字は、コードをそのまま表示する
+    return char
+
+# JISコードの配列から、表示文字の配列（object型）を作る関数
+def lookupChars(codesJIS):
+    codesJIS = np.asarray(codesJIS, dtype=np.int64)
+    chars = np.empty(len(codesJIS), dtype=object)
+    single = codesJIS <= 0xFF
+    chars[single] = [singleByteChar(code) for code in codesJIS[single].tolist()]
+    chars[~single] = lookupJisCodes(codesJIS[~single])[2]
+    return chars
+
+# JISコードの配列（昇順）から、コード表（CodeTable）を作る関数
+def getCodeTblFromCodes(codesJIS):
+    codesJIS = np.asarray(codesJIS, dtype=np.int64)
+    codesSingle = codesJIS[codesJIS <= 0xFF]
+    if (isVerbose):
+        for code in codesSingle.tolist():
+            print(f"\t\t" + GetMessage(isJapanese,"log_analyzingcode").format(hex(code)),end="")
+            if mapping == "KANA" and code >= 0xA1 and code <= 0xDF :
+                print(GetMessage(isJapanese,"log_ishankakukana").format(hex(code)))
+            elif chr(code).isprintable():
+                print(GetMessage(isJapanese,"log_isascii").format(hex(code),code))
+            else:
+                print(GetMessage(isJapanese,"log_isnonprintableascii").format(hex(code)))
+            print("\t\t\t" + GetMessage(isJapanese,"log_codedisp").format(hex(code),hex(code),hex(code)))
 
+    # ２バイトコードは、区点表を引いてまとめて変換する
+    codesJIS = codesJIS[codesJIS > 0xFF]
+    codesSJIS, codesUTF8, chars = lookupJisCodes(codesJIS)
+    found = (codesSJIS != 0) & (codesUTF8 != 0)
+    if (isVerbose):
+        for code, isFound, codeSJIS, codeUTF8 in zip(codesJIS.tolist(), found.tolist(), codesSJIS.tolist(), codesUTF8.tolist()):
+            print("\t\t" + GetMessage(isJapanese,"log_analyzingmulticode" ).format(hex(code)))
+            if isFound:
+                print("\t\t\t" + GetMessage(isJapanese,"log_codedisp").format(hex(code),hex(codeSJIS),hex(codeUTF8)))
+            else:
+                print(f"\t\t\t" + GetMessage(isJapanese,"log_skippingcode").format(hex(code)))
+    # １バイトコードは、JIS、SJIS、UTF-8が同じ値になる
+    return CodeTable.fromColumns(np.concatenate([codesSingle, codesUTF8[found]]),
+                                 np.concatenate([codesSingle, codesSJIS[found]]),
+                                 np.concatenate([codesSingle, codesJIS[found]]),
+                                 np.concatenate([lookupChars(codesSingle), chars[found]]))
+
+# コード表の１文字分のレコードの型。バイナリ出力の struct KanjiData（IHHBBI）と同じ並びで、すき間はない。
+CODE_RECORD_DTYPE = np.dtype([("utf8", "<u4"), ("sjis", "<u2"), ("jis", "<u2"), ("width", "u1"), ("height", "u1"), ("offset", "<u4")])
+# 並べ替えに使う、エンコーディングとレコードの項目の対応
+CODE_SORT_FIELDS = {"UTF8": "utf8", "SJIS": "sjis", "JIS": "jis"}
+
+# コード表。文字ごとの（UTF-8、SJIS、JIS、幅、高さ、オフセット）を、numpyの構造化配列recordsに列として持つ。
+# 表示文字は、使うとき（レンダリングや、C/Pythonのコメント）に、JISコードから引いてcharsに持つ。
+# 並べ替え・絞り込み・オフセットの設定は、配列の操作で行う。
+# 互換のため、table[i] や for code in table では [utf8, sjis, jis, 文字, 幅, 高さ, オフセット] のリストを返す。
+class CodeTable:
+    def __init__(self, records, chars=None):
+        self.records = records
+        self._chars = chars
+
+    @classmethod
+    def fromColumns(cls, codesUTF8, codesSJIS, codesJIS, chars=None):
+        records = np.zeros(len(codesUTF8), dtype=CODE_RECORD_DTYPE)
+        records["utf8"] = codesUTF8
+        records["sjis"] = codesSJIS
+        records["jis"] = codesJIS
+        return cls(records, chars)
+
+    # 表示文字の配列。まだ作っていなければ、JISコードから作る
+    @property
+    def chars(self):
+        if self._chars is None:
+            self._chars = lookupChars(self.records["jis"])
+        return self._chars
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            utf8, sjis, jis, width, height, offset = self.records[index].tolist()
+            return [utf8, sjis, jis, self.chars[index], width, height, offset]
+        # スライス・インデックス配列・真偽値の配列の場合は、その部分のコード表を返す
+        return CodeTable(self.records[index], None if self._chars is None else self._chars[index])
+
+    def __iter__(self):
+        for (utf8, sjis, jis, width, height, offset), char in zip(self.records.tolist(), self.chars.tolist()):
+            yield [utf8, sjis, jis, char, width, height, offset]
+
+    def copy(self):
+        return CodeTable(self.records.copy(), None if self._chars is None else self._chars.copy())
+
+    # 指定したエンコーディングの順に並べ替えたコード表を返す（同じコードの順番は変えない）
+    def sortedBy(self, out_encoding):
+        return self[np.argsort(self.records[CODE_SORT_FIELDS[out_encoding]], kind="stable")]
+
+    # 終了マークを追加したコード表を返す
+    def withEndMark(self, endMark):
+        if endMark == "ALLZERO":
+            mark = CodeTable.fromColumns([0], [0], [0], np.array([""], dtype=object))
+        elif endMark == "ALLMAX":
+            mark = CodeTable.fromColumns([0xFFFFFFFF], [0xFFFF], [0xFFFF], np.array([""], dtype=object))
         else:
-            if (isVerbose):
-                print("\t\t" + GetMessage(isJapanese,"log_analyzingmulticode" ).format(hex(code)))
-            codeJIS , codeSJIS , codeUTF8 = jis_to_encodings(code)
-            if codeJIS == 0 or codeSJIS == 0 or codeUTF8 == 0:
-                if (isVerbose):
-                    print(f"\t\t\t" + GetMessage(isJapanese,"log_skippingcode").format(hex(code)))
-                continue
-            unicode_char = decode_utf8(codeUTF8)  # JISコードをUnicode文字に変換
-            CodeList.append([codeUTF8,codeSJIS,codeJIS,unicode_char,0,0,0])
+            return self
+        return CodeTable(np.concatenate([self.records, mark.records]), np.concatenate([self.chars, mark.chars]))
 
-            if (isVerbose):
-                print("\t\t\t" + GetMessage(isJapanese,"log_codedisp").format(hex(codeJIS),hex(codeSJIS),hex(codeUTF8)))
+#教育漢字の一覧
+KyouikuKanji = "一右雨円王音下火花貝学気九休玉金空月犬見五口校左三山子四糸字耳七車手十出女小上森人水正生青夕石赤千川先早草足村大男竹中虫町天田土二日入年白八百文木本名目立力林六\
+引羽雲園遠何科夏家歌画回会海絵外角楽活間丸岩顔汽記帰弓牛魚京強教近兄形計元言原戸古午後語工公広交光考行高黄合谷国黒今才細作算止市矢姉思紙寺自時室社弱首秋週春書少場色食心新親図数西声星晴切雪船線前組走多太体台地池知茶昼長鳥朝直通弟店点電刀冬当東答頭同道読内南肉馬売買麦半番父風分聞米歩母方北毎妹万明鳴毛門夜野友用曜来里理話\
+悪安暗医委意育員院飲運泳駅央横屋温化荷界開階寒感漢館岸起期客究急級宮球去橋業曲局銀区苦具君係軽血決研県庫湖向幸港号根祭皿仕死使始指歯詩次事持式実写者主守取酒受州拾終習集住重宿所暑助昭消商章勝乗植申身神真深進世整昔全相送想息速族他打対待代第題炭短談着注柱丁帳調追定庭笛鉄転都度投豆島湯登等動童農波配倍箱畑発反坂板皮悲美鼻筆氷表秒病品負部服福物平返勉放味命面問役薬由油有遊予羊洋葉陽様落流旅両緑礼列練路和\
+愛案以衣位囲胃印英栄塩億加果貨課芽改械害街各覚完官管関観願希季紀喜旗器機議求泣救給挙漁共協鏡競極訓軍郡径型景芸欠結建健験固功好候航康告差菜最材昨札刷殺察参産散残士氏史司試児治辞失借種周祝順初松笑唱焼象照賞臣信成省清静席積折節説浅戦選然争倉巣束側続卒孫帯隊達単置仲貯兆腸低底停的典伝徒努灯堂働特得毒熱念敗梅博飯飛費必票標不夫付府副粉兵別辺変便包法望牧末満未脈民無約勇要養浴利陸良料量輪類令冷例歴連老労録\
+圧移因永営衛易益液演応往桜恩可仮価河過賀快解格確額刊幹慣眼基寄規技義逆久旧居許境均禁句群経潔件券険検限現減故個護効厚耕鉱構興講混査再災妻採際在財罪雑酸賛支志枝師資飼示似識質舎謝授修述術準序招承証条状常情織職制性政勢精製税責績接設舌絶銭祖素総造像増則測属率損退貸態団断築張提程適敵統銅導徳独任燃能破犯判版比肥非備俵評貧布婦富武復複仏編弁保墓報豊防貿暴務夢迷綿輸余預容略留領\
+異遺域宇映延沿我灰拡革閣割株干巻看簡危机揮貴疑吸供胸郷勤筋系敬警劇激穴絹権憲源厳己呼誤后孝皇紅降鋼刻穀骨困砂座済裁策冊蚕至私姿視詞誌磁射捨尺若樹収宗就衆従縦縮熟純処署諸除将傷障城蒸針仁垂推寸盛聖誠宣専泉洗染善奏窓創装層操蔵臓存尊宅担探誕段暖値宙忠著庁頂潮賃痛展討党糖届難乳認納脳派拝背肺俳班晩否批秘腹奮並陛閉片補暮宝訪亡忘棒枚幕密盟模訳郵優幼欲翌乱卵覧裏律臨朗論\
+、。，．・：；？！゛゜´｀¨＾￣＿ヽヾゝゞ〃仝々〆〇ー―‐／＼～∥｜…‥‘’“”（）〔〕［］｛｝〈〉《》「」『』【】＋－±×÷＝≠＜＞≦≧∞∴♂♀°′″℃￥＄￠￡％＃＆＊＠§☆★○●◎◇\
+◆□■△▲▽▼※〒→←↑↓〓∈∋⊆⊇⊂⊃∪∩∧∨￢⇒⇔∀∃∠⊥⌒∂∇≡≒≪≫√∽∝∵∫∬Å‰♯♭♪†‡¶◯\
+０１２３４５６７８９ＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚ\
+ぁあぃいぅうぇえぉおかがきぎくぐけげこごさざしじすずせぜそぞただちぢっつづてでとどなにぬねのはばぱひびぴふぶぷへべぺほぼぽまみむめもゃやゅゆょよらりるれろゎわゐゑをん\
+ァアィイゥウェエォオカガキギクグケゲコゴサザシジスズセゼソゾタダチヂッツヅテデトドナニヌネノハバパヒビピフブプヘベペホボポマミムメモャヤュユョヨラリルレロヮワヰヱヲンヴヵヶ"
 
-    return CodeList
+#フォントの範囲を定義しておく
+ASCII = range(0x0000,0x0100)
+JISL1 = range(0x3021,0x4f54)
+JISL2 = range(0x5021,0x7427)
+JISKIGOU = range(0x2121,0x2F7E)
+
+# デバッグ用の特別なフォント範囲
+test1 = range(0x00A1,0xAF) 
+test2 = range(0x443E,0x4450)
+
+# コードセットは、JISコード空間（0x0000～0xFFFF）上のビットセット（numpyのbool配列）で表す。
+# １バイトコード（0x00～0xFF）はJIS/SJIS/UTF-8で同じ値なので、そのままの位置に置く。
+# 含まれるかどうかの判定や、積・和・差の計算は、配列の演算だけで行える。
+CODE_SPACE = 0x10000
+CODESET_OPERATORS = ("&", "|", "-")
+
+# 区点表で定義されている２バイトコードと、すべての１バイトコードのビットセット
+def getDefinedBits():
+    sjisTbl, utf8Tbl, _ = getJisTable()
+    bits = np.zeros(CODE_SPACE, dtype=bool)
+    bits[:0x100] = True
+    bits.reshape(256, 256)[0x21:0x7F, 0x21:0x7F] = (sjisTbl != 0) & (utf8Tbl != 0)   # 上位バイト=区、下位バイト=点
+    return bits
+
+# コードの範囲からビットセットを作る関数。２バイトコードは、区点表で定義されているものだけにする
+def rangeToBits(codeRange):
+    bits = np.zeros(CODE_SPACE, dtype=bool)
+    bits[codeRange.start:codeRange.stop:codeRange.step] = True
+    return bits & getDefinedBits()
+
+# 文字からJISコードを引く辞書を作る関数。１バイトコードの文字は、-m の指定に従う
+def getCharToJis():
+    charToJis = {}
+    for code in ASCII:
+        if mapping == "KANA" and code >= 0xA1 and code <= 0xDF :
+            charToJis[chr(code - 0xa1 + 0xFF61)] = code
+        else:
+            charToJis[chr(code)] = code
+    _, _, charTbl = getJisTable()
+    for ku, ten in zip(*np.nonzero(charTbl != "")):
+        charToJis[charTbl[ku, ten]] = ((int(ku) + 0x21) << 8) | (int(ten) + 0x21)
+    return charToJis
+
+# 文字列に含まれる文字のビットセットを作る関数。コード表にない文字は無視する
+def charsToBits(content):
+    charToJis = getCharToJis()
+    bits = np.zeros(CODE_SPACE, dtype=bool)
+    bits[[charToJis[char] for char in set(content) if char in charToJis]] = True
+    return bits
+
+# 文字ファイルを読み込んで、含まれる文字のビットセットを作る関数
+def charFileToBits(filename):
+    if not os.path.exists(filename):
+        raise SystemExit(GetMessage(isJapanese,"err_codefilenotexist").format(filename))
+    if isVerbose :
+        print(GetMessage(isJapanese,"log_readingcodefile").format(filename))
+    with open(filename, "r", encoding="utf-8") as file:
+        content = file.read().replace("\n", "")  # 改行を削除
+    if isVerbose :
+        print(GetMessage(isJapanese,"log_outputcontains").format(content))
+    return charsToBits(content)
+
+# 名前付きのコードセットのビットセットを返す関数。名前でないものは、文字ファイルのパスとして扱う
+def getNamedCodeSet(name, charfile):
+    if name == "ASCII":
+        return rangeToBits(ASCII)
+    elif name == "JISL1":
+        return rangeToBits(JISL1)
+    elif name == "JISL2":
+        return rangeToBits(JISL2)
+    elif name == "KIGOU":
+        return rangeToBits(JISKIGOU)
+    elif name == "ALL":
+        return rangeToBits(ASCII) | rangeToBits(JISL1) | rangeToBits(JISL2) | rangeToBits(JISKIGOU)
+    elif name == "LEVEL1":
+        return rangeToBits(ASCII) | rangeToBits(JISL1) | rangeToBits(JISKIGOU)
+    elif name == "SCHOOL":
+        #教育漢字の場合は、JISL1と記号のうち教育漢字の一覧に含まれるものと、すべての１バイト文字
+        return rangeToBits(ASCII) | ((rangeToBits(JISL1) | rangeToBits(JISKIGOU)) & charsToBits(KyouikuKanji))
+    elif name == "CUSTOM":
+        #CUSTOMの場合は、JISL1と記号のうち文字ファイルに含まれるものと、すべての１バイト文字
+        if charfile == "":
+            raise SystemExit(GetMessage(isJapanese,"err_codefileReqired"))
+        return rangeToBits(ASCII) | ((rangeToBits(JISL1) | rangeToBits(JISKIGOU)) & charFileToBits(charfile))
+    elif name == "TEST":
+        return rangeToBits(test1) | rangeToBits(test2)
+    elif name == "charfile":
+        if charfile == "":
+            raise SystemExit(GetMessage(isJapanese,"err_codefileReqired"))
+        return charFileToBits(charfile)
+    else:
+        if not os.path.exists(name):
+            raise SystemExit(GetMessage(isJapanese,"err_codesetunknown").format(name))
+        return charFileToBits(name)
+
+# コードセットの式を、名前と演算子・括弧に分ける関数。演算子は前後を空白で区切る
+def tokenizeCodeSet(expr):
+    tokens = []
+    for word in expr.split():
+        while word.startswith("("):
+            tokens.append("(")
+            word = word[1:]
+        closing = []
+        while word.endswith(")"):
+            closing.append(")")
+            word = word[:-1]
+        if word != "":
+            tokens.append(word)
+        tokens += closing
+    return tokens
+
+# コードセットの式（例： "LEVEL1 & charfile" , "SCHOOL | extra.txt" , "ALL - excluded.txt"）を評価して、ビットセットを返す関数
+# & は積、| は和、- は差。演算子の優先順位はなく、左から順に計算する。括弧も使える。
+def evalCodeSet(expr, charfile):
+    tokens = tokenizeCodeSet(expr)
+    pos = 0
+
+    def syntaxError():
+        return SystemExit(GetMessage(isJapanese,"err_codesetsyntax").format(expr))
+
+    def operand():
+        nonlocal pos
+        if pos >= len(tokens) or tokens[pos] in CODESET_OPERATORS or tokens[pos] == ")":
+            raise syntaxError()
+        token = tokens[pos]
+        pos += 1
+        if token == "(":
+            bits = expression()
+            if pos >= len(tokens) or tokens[pos] != ")":
+                raise syntaxError()
+            pos += 1
+            return bits
+        return getNamedCodeSet(token, charfile)
+
+    def expression():
+        nonlocal pos
+        bits = operand()
+        while pos < len(tokens) and tokens[pos] in CODESET_OPERATORS:
+            op = tokens[pos]
+            pos += 1
+            rhs = operand()
+            if op == "&":
+                bits = bits & rhs
+            elif op == "|":
+                bits = bits | rhs
+            else:
+                bits = bits & ~rhs
+        return bits
+
+    bits = expression()
+    if pos != len(tokens):
+        raise syntaxError()
+    return bits
+
+# コードセットの式から、ファイル名や構造体名に使える名前を作る関数
+# 名前１つだけの場合（ALLなど）は、そのままの名前になる
+def codesetLabel(expr, charfile):
+    words = {"&": "AND", "|": "OR", "-": "NOT", "(": "", ")": ""}
+    labels = []
+    for token in tokenizeCodeSet(expr):
+        if token in words:
+            label = words[token]
+        elif token == "charfile":
+            label = Path(charfile).stem
+        elif os.path.exists(token):
+            label = Path(token).stem
+        else:
+            label = token
+        if label != "":
+            labels.append(label)
+    return "_".join(labels)
+
+# 並列レンダリング用ワーカープロセスの初期化関数。
+# Windowsではワーカーは spawn で起動され、__main__ で設定したグローバル変数が引き継がれないので、ここで設定しなおす。
+# フォントの読み込みもワーカーごとに一度だけ行う。
+def initRenderWorker(fontPath, fontSize, mappingWk, isJapaneseWk):
+    global font, mapping, isVerbose, isImage, isJapanese
+    font = ImageFont.truetype(fontPath, fontSize)
+    mapping = mappingWk
+    isJapanese = isJapaneseWk
+    isVerbose = False           # 複数プロセスのログが混ざってしまうので、ワーカーでは詳細表示をしない
+    isImage = False
+
+# 黒をTrueとした（高さ、幅）のグリフの配列を、左上が(x, y)になるように（fontYSize, fontXSize）のセルに置く関数。
+# セルからはみ出す部分は切り、足りない部分は空白にする
+def placeInCell(pixels, x, y, fontXSize, fontYSize):
+    cell = np.zeros((fontYSize, fontXSize), dtype=bool)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + pixels.shape[1], fontXSize), min(y + pixels.shape[0], fontYSize)
+    if x1 > x0 and y1 > y0:
+        cell[y0:y1, x0:x1] = pixels[y0 - y:y1 - y, x0 - x:x1 - x]
+    return cell
+
+# フォントに埋め込まれたビットマップ（EBLC/EBDT、カラーの場合は CBLC/CBDT）の、１つのサイズ（ストライク）を読むクラス。
+# ドットフォントなどでは、デザインサイズ用に手で作られたビットマップが入っているので、
+# サイズが -s と同じストライクがあれば、レンダリングせずにそのビットマップを使う。
+# 文字からグリフ名はcmapで引き、ストライクにない文字は None を返す（呼び出し元でレンダリングする）。
+# 位置は、セルの上端からアセント（Pillowのフォントと同じ値）のところをベースラインにして、グリフのベアリングで決める。
+class BitmapStrike:
+    def __init__(self, ttFont, locatorTag, dataTag, strikeIndex, ascent):
+        strike = ttFont[locatorTag].strikes[strikeIndex]
+        self.ppem = strike.bitmapSizeTable.ppemY
+        self.bitDepth = strike.bitmapSizeTable.bitDepth
+        self.isColor = dataTag == "CBDT"
+        self.glyphs = ttFont[dataTag].strikeData[strikeIndex]
+        # 形式5・19のグリフはメトリクスを持たず、索引（EBLC/CBLC）の側にある
+        self.indexMetrics = {}
+        for indexSubTable in strike.indexSubTables:
+            metrics = getattr(indexSubTable, "metrics", None)
+            if metrics is not None:
+                self.indexMetrics.update(dict.fromkeys(indexSubTable.names, metrics))
+        self.cmap = ttFont.getBestCmap() or {}
+        self.ascent = ascent
+
+    def __len__(self):
+        return len(self.glyphs)
+
+    # グリフ名のビットマップを、（メトリクス、黒をTrueとした（高さ、幅）の配列）で返す。使えないグリフはNone
+    def glyphPixels(self, glyphName):
+        glyph = self.glyphs.get(glyphName)
+        if glyph is None or not self.isColor and not isinstance(glyph, (ByteAlignedBitmapMixin, BitAlignedBitmapMixin)):
+            return None             # 部品を組み合わせるグリフ（形式8・9）は使わない
+        metrics = getattr(glyph, "metrics", None) or self.indexMetrics.get(glyphName)
+        if metrics is None:
+            return None
+        if self.isColor:
+            image = Image.open(io.BytesIO(glyph.imageData)).convert("RGBA")
+            return metrics, np.asarray(image)[:, :, 3] >= 128           # カラーのグリフは、不透明な部分を黒にする
+        height, width, depth = metrics.height, metrics.width, self.bitDepth
+        data = np.frombuffer(glyph.imageData, dtype=np.uint8)
+        # 行ごとにバイト境界にそろっている形式（1・6）と、行の間にすき間のない形式（2・5・7）がある
+        if isinstance(glyph, ByteAlignedBitmapMixin):
+            rowBytes = (width * depth + 7) // 8
+            bits = np.unpackbits(data[:height * rowBytes].reshape(height, rowBytes), axis=1)[:, :width * depth]
+        else:
+            bits = np.unpackbits(data)[:height * width * depth]
+        bits = bits.reshape(height, width, depth)
+        if depth == 1:
+            return metrics, bits[:, :, 0].astype(bool)
+        # 1画素が複数ビットの場合は、濃さが半分以上を黒にする
+        return metrics, bits.dot(1 << np.arange(depth - 1, -1, -1)) >= (1 << (depth - 1))
+
+    # itemsの各文字を、ストライクのビットマップから（幅、高さ、ビットマップ配列）にする。ストライクにない文字はNone
+    def render(self, items, fontXSize, fontYSize, xOffset, yOffset):
+        halfWidth = getHalfWidth(fontXSize, fontYSize)
+        glyphs = []
+        for codeUTF8, char in items:
+            if len(char) != 1:          # 印刷不能の１バイト文字は、レンダリングの方で空白にする
+                glyphs.append(None)
+                continue
+            if codeUTF8 <= 0xFF and mapping == "KANA" and codeUTF8 >= 0xA1 and codeUTF8 <= 0xDF:
+                char = chr(codeUTF8 - 0xa1 + 0xFF61)  # 半角カナに変換
+            glyphName = self.cmap.get(ord(char))
+            found = self.glyphPixels(glyphName) if glyphName is not None else None
+            if found is None:
+                glyphs.append(None)
+                continue
+            metrics, pixels = found
+            bearingX = getattr(metrics, "BearingX", getattr(metrics, "horiBearingX", 0))
+            bearingY = getattr(metrics, "BearingY", getattr(metrics, "horiBearingY", 0))
+            cell = placeInCell(pixels, xOffset + bearingX, yOffset + self.ascent - bearingY, fontXSize, fontYSize)
+            width = halfWidth if codeUTF8 <= 0xFF else fontXSize
+            glyphs.append((width, fontYSize, np.packbits(cell[:, :width], axis=-1)))
+        return glyphs
+
+# フォントに、サイズがppemの埋め込みビットマップがあれば BitmapStrike を返す関数。なければ、または読めなければNone
+# 白黒（EBLC/EBDT）のストライクを、カラー（CBLC/CBDT）より優先する。
+def loadBitmapStrike(fontPath, ppem, pilFont):
+    try:
+        ttFont = TTFont(fontPath, lazy=True, fontNumber=0)
+        for locatorTag, dataTag in (("EBLC", "EBDT"), ("CBLC", "CBDT")):
+            if locatorTag not in ttFont or dataTag not in ttFont:
+                continue
+            for strikeIndex, strike in enumerate(ttFont[locatorTag].strikes):
+                if strike.bitmapSizeTable.ppemY == ppem:
+                    return BitmapStrike(ttFont, locatorTag, dataTag, strikeIndex, pilFont.getmetrics()[0])
+    except Exception:
+        pass
+    return None
+
+# BDF（ビットマップ）フォントを入力フォントとして読むクラス。
+# ファイルは先頭から１回だけ読み、文字ごとにENCODING→（BBX、BITMAPの16進文字列）の索引を作る。ビットマップの展開は使うときに行う。
+# ENCODINGの意味はCHARSET_REGISTRYで決まり、コード表のUTF-8コードに合わせた索引にする。
+#   JISX0208 : JISコード。既存のJIS→SJIS→UTF-8の変換表でUTF-8コードにする
+#   ISO10646 : Unicodeのコードポイント。文字で引く
+#   それ以外  : １バイトのコード（JISX0201、ISO8859など）。１バイトのコードで引く
+# フォントにない文字は、DEFAULT_CHARのグリフ（なければ空白）にするので、renderはNoneを返さない。
+# 位置は、セルの上端からFONT_ASCENTのところをベースラインにして、BBXで決める。セルより大きいグリフは切り、小さいグリフは余白を付ける。
+class BdfFont:
+    def __init__(self, fontPath):
+        properties = {}
+        glyphs = {}
+        encoding, bbx, rows = -1, None, None
+        with open(fontPath, "r", encoding="latin-1") as f:
+            if not f.readline().startswith("STARTFONT"):
+                raise ValueError("STARTFONT not found")
+            for line in f:
+                if rows is not None:
+                    if line.startswith("ENDCHAR"):
+                        if encoding >= 0 and bbx is not None:
+                            glyphs[encoding] = (bbx, "".join(rows))
+                        rows = None
+                    else:
+                        rows.append(line.strip())
+                    continue
+                keyword, _, value = line.strip().partition(" ")
+                if keyword == "STARTCHAR":
+                    encoding, bbx = -1, properties.get("bbx")
+                elif keyword == "ENCODING":
+                    encoding = int(value.split()[0])        # -1 は符号化されていないグリフ
+                elif keyword == "BBX":
+                    bbx = tuple(int(v) for v in value.split())
+                elif keyword == "BITMAP":
+                    rows = []
+                elif keyword == "FONTBOUNDINGBOX":
+                    properties["bbx"] = tuple(int(v) for v in value.split())
+                elif keyword in ("FONT_ASCENT", "DEFAULT_CHAR", "CHARSET_REGISTRY", "CHARSET_ENCODING"):
+                    properties[keyword] = value.strip().strip('"')
+        if "bbx" not in properties:
+            raise ValueError("FONTBOUNDINGBOX not found")
+
+        fontBBX = properties["bbx"]
+        self.ascent = int(properties.get("FONT_ASCENT", fontBBX[1] + fontBBX[3]))
+        self.registry = properties.get("CHARSET_REGISTRY", "").upper()
+        self.count = len(glyphs)
+        defaultChar = int(properties.get("DEFAULT_CHAR", -1))
+        self.defaultGlyph = glyphs.get(defaultChar)
+        if self.registry.startswith("JISX0208"):
+            # JISコード（GR表現の場合も）を、コード表のUTF-8コードにする。JIS X 0208にないコードは使わない
+            codes = list(glyphs.keys())
+            codesUTF8 = lookupJisCodes([code & 0x7F7F for code in codes])[1].tolist()
+            self.glyphs = {codeUTF8: glyphs[code] for code, codeUTF8 in zip(codes, codesUTF8) if codeUTF8 != 0}
+        else:
+            self.glyphs = glyphs
+        self.isUnicode = self.registry.startswith("ISO10646")
+
+    def __len__(self):
+        return self.count
+
+    # BDFのグリフを、（BBX、黒をTrueとした（高さ、幅）の配列）にする
+    @staticmethod
+    def glyphPixels(glyph):
+        (width, height, bbxX, bbxY), hexRows = glyph
+        rowBytes = (width + 7) // 8
+        if len(hexRows) != height * rowBytes * 2:
+            # 行の16進の桁数がBBXの幅と合わないファイルは、１行ずつ切りそろえる
+            rowLength = len(hexRows) // height if height else 0
+            hexRows = "".join(hexRows[pos:pos + rowLength][:rowBytes * 2].ljust(rowBytes * 2, "0")
+                              for pos in range(0, rowLength * height, rowLength)) if rowLength else "00" * height * rowBytes
+        data = np.frombuffer(bytes.fromhex(hexRows), dtype=np.uint8).reshape(height, rowBytes)
+        return np.unpackbits(data, axis=1)[:, :width].astype(bool)
+
+    # 文字のグリフを探す。フォントにない文字はNone
+    def findGlyph(self, codeUTF8, char):
+        if self.isUnicode:
+            if len(char) != 1:
+                return None
+            if codeUTF8 <= 0xFF and mapping == "KANA" and codeUTF8 >= 0xA1 and codeUTF8 <= 0xDF:
+                char = chr(codeUTF8 - 0xa1 + 0xFF61)  # 半角カナに変換
+            return self.glyphs.get(ord(char))
+        if self.registry.startswith("JISX0208") or codeUTF8 <= 0xFF:
+            return self.glyphs.get(codeUTF8)
+        return None
+
+    # 文字がフォントにあればTrue
+    def covers(self, codeUTF8, char):
+        return self.findGlyph(codeUTF8, char) is not None
+
+    # itemsの各文字を、BDFのビットマップから（幅、高さ、ビットマップ配列）にする。BitmapStrike.renderと同じ形式
+    def render(self, items, fontXSize, fontYSize, xOffset, yOffset):
+        halfWidth = getHalfWidth(fontXSize, fontYSize)
+        glyphs = []
+        missing = 0
+        for codeUTF8, char in items:
+            glyph = self.findGlyph(codeUTF8, char)
+            if glyph is None:
+                missing += 1
+                glyph = self.defaultGlyph
+            if glyph is None:
+                cell = np.zeros((fontYSize, fontXSize), dtype=bool)
+            else:
+                pixels = self.glyphPixels(glyph)
+                bbxX, bbxY = glyph[0][2], glyph[0][3]
+                cell = placeInCell(pixels, xOffset + bbxX, yOffset + self.ascent - (bbxY + pixels.shape[0]), fontXSize, fontYSize)
+            width = halfWidth if codeUTF8 <= 0xFF else fontXSize
+            glyphs.append((width, fontYSize, np.packbits(cell[:, :width], axis=-1)))
+        if isVerbose:
+            print(f"\t\t" + GetMessage(isJapanese,"log_bdf").format(len(items) - missing, missing))
+        return glyphs
+
+# グリフキャッシュのキーに使う、埋め込みビットマップのストライクのサイズ。ストライクを使わない場合はNone
+def getStrikePpem():
+    return bitmap_source.ppem if isinstance(bitmap_source, BitmapStrike) else None
+
+# 入力フォントとして読むファイルのリストを返す関数。
+# FONTX2の全角（_zen.fnt）と半角（_han.fnt）は、ファイル名が対になるもう一方があれば、それも一緒に読む。
+# グリフキャッシュのキー、--watch の監視対象、マニフェストの更新判定は、このリストのすべてのファイルを対象にする。
+def getFontSourcePaths(fontPath):
+    paths = [fontPath]
+    for suffix, partner in (("_zen.fnt", "_han.fnt"), ("_han.fnt", "_zen.fnt")):
+        if fontPath.endswith(suffix) and os.path.exists(fontPath[:-len(suffix)] + partner):
+            paths.append(fontPath[:-len(suffix)] + partner)
+    return paths
+
+# FONTX2形式（Output2FONTX2 の出力と同じ形式）のフォントを入力フォントとして読むクラス。
+# 全角（_zen.fnt）と半角（_han.fnt）の一方を指定すると、ファイル名が対になるもう一方もあれば一緒に読む。
+# ファイルは fontreader.FontX2Font で開く（ヘッダとコードブロック表だけを読み、グリフの領域はmmapする）。
+# 各コードのグリフの位置は、コードブロックから計算で求める。半角ファイルは256文字分そろっている必要がある。
+# 全角のコードは、コードブロックの範囲がJISの範囲（0x2121～0x7E7E）に収まっていればJIS（-en JIS で出力したもの）、そうでなければSJIS。
+# どちらも既存のJIS→SJIS→UTF-8の変換表でUTF-8コードにした索引を作る。半角のコードは１バイトコードそのもの。
+# グリフはセルの左上に置き、-s の大きさより大きければ切り、小さければ余白を付ける。フォントにない文字は空白にする。
+class FontX2Font:
+    def __init__(self, fontPath):
+        self.files = []
+        self.glyphs = {}
+        self.counts = {"zen": 0, "han": 0}
+        self.sizes = {}
+        self.paths = getFontSourcePaths(fontPath)
+        for path in self.paths:
+            self.addFile(path)
+
+    def addFile(self, path):
+        reader = fontreader.FontX2Font(path)
+        if reader.isFullWidth:
+            codes = np.concatenate([np.arange(start, end + 1) for start, end in zip(reader.blockStarts, reader.blockEnds)] or [np.zeros(0, dtype=np.int64)])
+            if len(codes) and codes.max() <= 0x7E7E:
+                codesUTF8 = lookupJisCodes(codes)[1]
+            else:
+                codesUTF8 = sjisToUTF8Codes(codes)
+            kind = "zen"
+        else:
+            codes = codesUTF8 = np.arange(len(reader))      # 半角は、コードの順に256文字
+            kind = "han"
+        # グリフの位置は、コードブロックの順に並べた番号×１文字のサイズ。ファイルの大きさを超えるものは使わない
+        offsets = reader.dataStart + np.arange(len(codes)) * reader.glyphSize
+        usable = offsets + reader.glyphSize <= len(reader.view)
+        if kind == "zen":
+            usable &= codesUTF8 != 0
+        entry = (reader.view, reader.width, reader.height)
+        self.glyphs.update((codeUTF8, (entry, offset)) for codeUTF8, offset in zip(codesUTF8[usable].tolist(), offsets[usable].tolist()))
+        self.files.append(reader)
+        self.counts[kind] = int(usable.sum())
+        self.sizes[kind] = (reader.width, reader.height)
+
+    def __len__(self):
+        return len(self.glyphs)
+
+    # 文字がフォントにあればTrue
+    def covers(self, codeUTF8, char):
+        return codeUTF8 in self.glyphs
+
+    # itemsの各文字を、FONTX2のビットマップから（幅、高さ、ビットマップ配列）にする。BitmapStrike.renderと同じ形式
+    def render(self, items, fontXSize, fontYSize, xOffset, yOffset):
+        halfWidth = getHalfWidth(fontXSize, fontYSize)
+        glyphs = []
+        missing = 0
+        for codeUTF8, char in items:
+            found = self.glyphs.get(codeUTF8)
+            if found is None:
+                missing += 1
+                cell = np.zeros((fontYSize, fontXSize), dtype=bool)
+            else:
+                (data, width, height), offset = found
+                rowBytes = (width + 7) // 8
+                rows = np.frombuffer(data, dtype=np.uint8, count=height * rowBytes, offset=offset).reshape(height, rowBytes)
+                pixels = np.unpackbits(rows, axis=1)[:, :width].astype(bool)
+                cell = placeInCell(pixels, xOffset, yOffset, fontXSize, fontYSize)
+            width = halfWidth if codeUTF8 <= 0xFF else fontXSize
+            glyphs.append((width, fontYSize, np.packbits(cell[:, :width], axis=-1)))
+        if isVerbose:
+            print(f"\t\t" + GetMessage(isJapanese,"log_fontx2").format(len(items) - missing, missing))
+        return glyphs
+
+# Shift_JISコードの配列を、JIS X 0208の変換表でUTF-8コードの配列にする関数。表にないコードは0
+def sjisToUTF8Codes(codesSJIS):
+    sjisTbl, utf8Tbl, charTbl = getJisTable()
+    keys = sjisTbl.ravel()
+    order = np.argsort(keys)
+    sortedKeys = keys[order].astype(np.int64)
+    codesSJIS = np.asarray(codesSJIS, dtype=np.int64)
+    pos = np.clip(np.searchsorted(sortedKeys, codesSJIS), 0, len(sortedKeys) - 1)
+    return np.where((sortedKeys[pos] == codesSJIS) & (codesSJIS != 0), utf8Tbl.ravel()[order][pos], 0)
+
+# 入力フォントの種類を、ファイルの先頭から判定する関数。"BDF"、"FONTX2" または "TrueType"（Pillowで読むフォント）
+def getFontType(fontPath):
+    with open(fontPath, "rb") as f:
+        head = f.read(16)
+    if head.startswith(b"STARTFONT"):
+        return "BDF"
+    if head.startswith(b"FONTX2"):
+        return "FONTX2"
+    return "TrueType"
+
+# 入力フォントを開き、（Pillowのフォント、ビットマップの取り出し元）を返す関数
+# TrueTypeフォントは、Pillowで開き、-s と同じサイズの埋め込みビットマップがあればそれも使う。
+# BDFフォントとFONTX2フォントは、Pillowのフォントは使わず（None）、すべての文字をそのビットマップから取る。
+def openFontSource(fontPath, fontXSize, fontYSize):
+    fontType = getFontType(fontPath)
+    if fontType == "BDF":
+        return None, BdfFont(fontPath)
+    if fontType == "FONTX2":
+        return None, FontX2Font(fontPath)
+    pilFont = loadFont(fontPath, fontXSize)
+    return pilFont, loadBitmapStrike(fontPath, fontYSize, pilFont) if embedded_bitmap else None
+
+# ワーカープロセスで、コード一覧の一部（チャンク）をレンダリングする関数
+# guttersがNoneでなければ、アトラス方式でレンダリングする。renderEngineが"mask"なら、マスク方式でレンダリングする。
+# 戻り値は、チャンク内の各文字の（幅、高さ、ビットマップ配列）のリスト
+def renderChunk(args):
+    chunk, fontXSize, fontYSize, xOffset, yOffset, gutters, renderEngine = args
+    if gutters is not None:
+        return renderAtlas(chunk, fontXSize, fontYSize, xOffset, yOffset, gutters)
+    if renderEngine == "mask":
+        return renderMasks(chunk, fontXSize, fontYSize, xOffset, yOffset)
+    result = []
+    for codeUTF8, char in chunk:
+        bitmap_image = render_glyph_to_bitmap(font, codeUTF8, char, fontXSize, fontYSize, xOffset, yOffset)
+        result.append((bitmap_image.size[0], bitmap_image.size[1], display_bitmap_data(bitmap_image)))
+    return result
+
+# アトラス方式で、左右に必要なすき間（ピクセル）を求める関数。
+# フォントのheadテーブルにある全グリフの外接矩形から、セルの左右にはみ出す最大の幅を求め、ヒンティングによるずれの分を足す。
+# セルの間をこれだけ空けておけば、隣の文字がセルの中に描かれることはない。
+# 上下は１行に並べるので、キャンバスの端で切れるのは１文字ずつ描く場合と同じになり、すき間はいらない。
+def getAtlasGutters(fontPath, fontXSize, xOffset):
+    try:
+        head = TTFont(fontPath, lazy=True, fontNumber=0)["head"]
+        scale = fontXSize / head.unitsPerEm
+        left = max(0, -(xOffset + head.xMin * scale))
+        right = max(0, xOffset + head.xMax * scale - fontXSize)
+    except Exception:
+        # headテーブルが読めないフォントは、１文字分のすき間を空ける
+        left = right = fontXSize
+    gutter = int(np.ceil(max(left, right))) + ATLAS_GUTTER_MARGIN
+    return gutter
+
+# アトラス方式のレンダリング。何文字か（ATLAS_TILE_GLYPHS）ずつ、１枚の横長のキャンバスに、すき間を空けたセルの位置に描画し、
+# キャンバス全体を配列にしてから、セルの部分を切り出して、まとめて白黒化・ビット配列化する。
+# 文字ごとに Image.new や ImageDraw.Draw、配列への変換をしないので、小さいサイズで速くなる。
+# 結果は render_glyph_to_bitmap で１文字ずつ描いたものと同じになる。戻り値は renderGlyphs と同じ。
+def renderAtlas(items, fontXSize, fontYSize, xOffset, yOffset, gutter):
+    halfWidth = getHalfWidth(fontXSize, fontYSize)
+    stride = fontXSize + gutter
+    glyphs = []
+    for start in range(0, len(items), ATLAS_TILE_GLYPHS):
+        tile = items[start:start + ATLAS_TILE_GLYPHS]
+        canvas = Image.new("L", (stride * len(tile) + gutter, fontYSize), color=255)
+        draw = ImageDraw.Draw(canvas)
+        for i, (codeUTF8, char) in enumerate(tile):
+            if len(char) == 4:          # 印刷不能の１バイト文字は、何も描かない
+                continue
+            if codeUTF8 <= 0xFF and mapping == "KANA" and codeUTF8 >= 0xA1 and codeUTF8 <= 0xDF:
+                char = chr(codeUTF8 - 0xa1 + 0xFF61)  # 半角カナに変換
+            draw.text((gutter + i * stride + xOffset, yOffset), char, font=font, fill=1)
+
+        # 各セルを（文字数、高さ、幅）の配列として切り出し、全角幅と半角幅でまとめてビット配列にする
+        pixels = np.asarray(canvas)
+        columns = gutter + np.arange(len(tile))[:, None] * stride + np.arange(fontXSize)
+        cells = pixels[:, columns].transpose(1, 0, 2)
+        fullBitmaps = pack_bitmap_array(cells)
+        halfBitmaps = pack_bitmap_array(cells[:, :, :halfWidth])
+        for i, (codeUTF8, char) in enumerate(tile):
+            if len(char) == 4 or codeUTF8 <= 0xFF:
+                glyphs.append((halfWidth, fontYSize, halfBitmaps[i]))
+            else:
+                glyphs.append((fontXSize, fontYSize, fullBitmaps[i]))
+    return glyphs
+
+# 半角文字の幅。render_glyph_to_bitmap のcrop（幅の半分を丸める）と同じにする
+def getHalfWidth(fontXSize, fontYSize):
+    return Image.new("L", (fontXSize, fontYSize)).crop((0, 0, fontXSize/2, fontYSize)).size[0]
+
+# マスク方式で、黒にする濃淡のしきい値。
+# render_glyph_to_bitmap は、白(255)の画像に濃淡をマスクにして1の色で描き、128未満を黒にしている。
+# 描画の合成の丸めと同じ結果にするため、0～255の濃淡を実際に同じ方法で描いて、黒になる最小の濃淡を求める。
+MASK_THRESHOLD = None
+
+def getMaskThreshold():
+    global MASK_THRESHOLD
+    if MASK_THRESHOLD is None:
+        canvas = Image.new("L", (256, 1), color=255)
+        coverage = Image.frombytes("L", (256, 1), bytes(range(256)))
+        ImageDraw.Draw(canvas).draw.draw_bitmap((0, 0), coverage.im, 1)
+        MASK_THRESHOLD = int(np.argmax(np.asarray(canvas)[0] < 128))
+    return MASK_THRESHOLD
+
+# マスク方式のレンダリング。draw.text と同じ引数でフォントから文字の濃淡（マスク）と描画位置を受け取り、
+# 画像を作らずに、セルの大きさの配列に置いてしきい値で白黒にする。半角文字は、半角の幅で切る。
+# 結果は render_glyph_to_bitmap で１文字ずつ描いたものと同じになる。戻り値は renderGlyphs と同じ。
+def renderMasks(items, fontXSize, fontYSize, xOffset, yOffset):
+    halfWidth = getHalfWidth(fontXSize, fontYSize)
+    threshold = getMaskThreshold()
+    glyphs = []
+    for codeUTF8, char in items:
+        isHalf = len(char) == 4 or codeUTF8 <= 0xFF
+        cell = np.zeros((fontYSize, fontXSize), dtype=np.uint8)
+        if len(char) != 4:          # 印刷不能の１バイト文字は、何も描かない
+            if isHalf and mapping == "KANA" and codeUTF8 >= 0xA1 and codeUTF8 <= 0xDF:
+                char = chr(codeUTF8 - 0xa1 + 0xFF61)  # 半角カナに変換
+            mask, (left, top) = font.getmask2(char, "L", anchor="la", start=(0.0, 0.0))
+            coverage = np.asarray(Image.Image()._new(mask))
+            # マスクの描画位置から、セルに入る部分だけを置く
+            x, y = xOffset + left, yOffset + top
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + coverage.shape[1], fontXSize), min(y + coverage.shape[0], fontYSize)
+            if x1 > x0 and y1 > y0:
+                cell[y0:y1, x0:x1] = coverage[y0 - y:y1 - y, x0 - x:x1 - x]
+        width = halfWidth if isHalf else fontXSize
+        glyphs.append((width, fontYSize, np.packbits(cell[:, :width] >= threshold, axis=-1)))
+    return glyphs
+
+# グリフを（幅、高さ、ビットマップ配列）のリストにする関数。itemsは（UTF-8コード、文字）のリスト
+# ビットマップの取り出し元（bitmap_source：埋め込みビットマップのストライク、またはBDFフォント）があれば、
+# そこにある文字はそこから取り、残りだけをレンダリングする。戻り値はitemsと同じ順番になる。
+def renderGlyphs(items, fontXSize, fontYSize, xOffset=0, yOffset=-1, jobs=1):
+    if bitmap_source is None:
+        return rasterizeGlyphs(items, fontXSize, fontYSize, xOffset, yOffset, jobs)
+    fromStrike = bitmap_source.render(items, fontXSize, fontYSize, xOffset, yOffset)
+    rest = [item for item, glyph in zip(items, fromStrike) if glyph is None]
+    if isVerbose and isinstance(bitmap_source, BitmapStrike):
+        print(f"\t\t" + GetMessage(isJapanese,"log_strike").format(bitmap_source.ppem, len(items) - len(rest), len(rest)))
+    rendered = iter(rasterizeGlyphs(rest, fontXSize, fontYSize, xOffset, yOffset, jobs) if rest else [])
+    return [glyph if glyph is not None else next(rendered) for glyph in fromStrike]
+
+# グリフを（幅、高さ、ビットマップ配列）のリストにレンダリングする関数。itemsは（UTF-8コード、文字）のリスト
+# jobsが2以上の場合は、チャンクに分けてプロセスプールでレンダリングする。戻り値はitemsと同じ順番になる。
+def rasterizeGlyphs(items, fontXSize, fontYSize, xOffset=0, yOffset=-1, jobs=1):
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if isImage:                 # 画像を１文字ずつ表示する場合は、並列化できない
+        jobs = 1
+
+    # アトラス方式とマスク方式は画像を作らないので、画像を１文字ずつ表示する場合には使えない
+    renderEngine = "glyph" if isImage else engine
+    gutter = getAtlasGutters(font_path, fontXSize, xOffset) if renderEngine == "atlas" else None
+    if isVerbose and gutter is not None:
+        print(f"\t\t" + GetMessage(isJapanese,"log_atlas").format(ATLAS_TILE_GLYPHS, gutter))
+
+    if (jobs <= 1 or len(items) <= 1) and gutter is not None:
+        return renderAtlas(items, fontXSize, fontYSize, xOffset, yOffset, gutter)
+    if (jobs <= 1 or len(items) <= 1) and renderEngine == "mask":
+        return renderMasks(items, fontXSize, fontYSize, xOffset, yOffset)
+    if jobs <= 1 or len(items) <= 1:
+        glyphs = []
+        for codeUTF8, char in items:
+            bitmap_image = render_glyph_to_bitmap(font, codeUTF8, char, fontXSize, fontYSize, xOffset, yOffset)
+            glyphs.append((bitmap_image.size[0], bitmap_image.size[1], display_bitmap_data(bitmap_image)))
+        return glyphs
+
+    if isVerbose:
+        print(f"\t\t" + GetMessage(isJapanese,"log_parallel").format(jobs))
+    # ワーカー間の負荷が偏らないよう、ワーカー数より多めのチャンクに分割する
+    chunkSize = max(1, -(-len(items) // (jobs * 4)))
+    tasks = [(items[start:start + chunkSize], fontXSize, fontYSize, xOffset, yOffset, gutter, renderEngine) for start in range(0, len(items), chunkSize)]
+    with multiprocessing.Pool(jobs, initializer=initRenderWorker, initargs=(font_path, fontXSize, mapping, isJapanese)) as pool:
+        results = pool.map(renderChunk, tasks)
+    return [glyph for result in results for glyph in result]
 
 # コードの一覧からビットマップ配列を作り、コード一覧にはビットマップのオフセット位置を追加する関数
-def convToDataAndBitmap(codeList,fontXSize,fontYSize,xOffset = 0,yOffset=-1): 
+# jobsが2以上の場合は、コード一覧をチャンクに分けてプロセスプールでレンダリングする。
+# オフセットはレンダリング後にコード一覧の順で計算するので、出力は１プロセスで実行した場合と同じになる。
+# glyphCacheが指定された場合は、キャッシュにないグリフだけをレンダリングし、結果をキャッシュに保存する。
+def convToDataAndBitmap(codeList,fontXSize,fontYSize,xOffset = 0,yOffset=-1,jobs = 1,glyphCache = None,dedup = False,compression = "none",aliasCodes = frozenset()):
     if (isVerbose):
         print(f"\t" + GetMessage(isJapanese,"log_convdatabitmap").format(len(codeList),fontXSize,fontYSize,xOffset,yOffset))
 
-    byteOffset = 0
-    for code in codeList:
-        code[6] = byteOffset
-        if isVerbose:
+    codesUTF8 = codeList.records["utf8"].tolist()
+    # aliasCodes（フォントにない文字）は、全角と半角で最初の１文字ずつだけレンダリングし、ほかの文字はそのグリフを使う
+    aliasOf = {}
+    if aliasCodes:
+        fallbacks = {}
+        aliasOf = {code: fallbacks.setdefault(code <= 0xFF, code) for code in codesUTF8 if code in aliasCodes}
+    cached = {}
+    if glyphCache is not None:
+        cached = glyphCache.get(codesUTF8)
+    missing = [(code, char) for code, char in zip(codesUTF8, codeList.chars.tolist()) if code not in cached and aliasOf.get(code, code) == code]
+    if glyphCache is not None and isVerbose:
+        print(f"\t\t" + GetMessage(isJapanese,"log_cachestat").format(len(codeList) - len(missing), len(missing)))
+
+    rendered = dict(zip([item[0] for item in missing], renderGlyphs(missing, fontXSize, fontYSize, xOffset, yOffset, jobs)))
+    if glyphCache is not None:
+        glyphCache.put(rendered)
+
+    # 結果をコード一覧の順にマージして、幅・高さ・オフセット（ビットマップサイズの累積和）を設定する
+    glyphs = [rendered[code] if code in rendered else cached[code] for code in (aliasOf.get(code, code) for code in codesUTF8)]
+    bmpList = GlyphStore([glyph[2] for glyph in glyphs], dedup, compression)
+    codeList.records["width"] = np.fromiter((glyph[0] for glyph in glyphs), dtype=np.uint8, count=len(glyphs))
+    codeList.records["height"] = np.fromiter((glyph[1] for glyph in glyphs), dtype=np.uint8, count=len(glyphs))
+    codeList.records["offset"] = bmpList.starts
+    if compression != "none":
+        totalBytes = int(bmpList.bitmapBytes.sum())
+        packedBytes = int(bmpList.sizes.sum())
+        print(GetMessage(isJapanese,"log_compress").format(compression, totalBytes, packedBytes, packedBytes / totalBytes if totalBytes else 1.0))
+    if dedup:
+        print(GetMessage(isJapanese,"log_dedup").format(len(bmpList) - len(bmpList.owners), bmpList.savedBytes, bmpList.nbytes))
+    if isVerbose:
+        for code in codeList:
             print(f"\t\t" + GetMessage(isJapanese,"log_converting").format(hex(code[0]),hex(code[1]),hex(code[2]),code[3],code[6]))
-        bitmap_image = render_glyph_to_bitmap(font,code[0], code[3], fontXSize, fontYSize ,xOffset,yOffset)
-        code[4] = bitmap_image.size[0]  # 幅を取得
-        code[5] = bitmap_image.size[1]  # 高さを取得
-        bmpData = display_bitmap_data(bitmap_image)
-        bmpList.append(bmpData)
-        byteOffset += bmpData.size
     if isVerbose:
         print(f"\t" + GetMessage(isJapanese,"log_doneconvert").format(len(codeList),len(bmpList)))
     return (codeList,bmpList)
 
+# コード一覧の順に並んだビットマップ配列を、１つの連続したバッファにまとめて持つクラス。
+# 文字ごとの小さな配列をたくさん持つ代わりに、バッファと、各文字の開始位置・バイト数・高さ・１行のバイト数の配列を持つ。
+# store[i] は i 番目の文字の（高さ、１行のバイト数）の配列、store.view(i) はそのバイト列で、どちらもバッファをコピーしない。
+# 開始位置は、コード一覧のoffsetBMP（code[6]）と同じになる。
+# dedupがTrueの場合は、バイト列が同じビットマップ（空白や、同じ形の異体字など）をバッファに１つだけ置き、
+# 後から出てきた文字の開始位置は、最初に出てきた文字と同じ位置にする。
+# ownersは、バッファに置いたビットマップごとの、最初の文字の番号（バッファ内の順）。
+# compressionが"packbits"の場合は、各文字のビットマップをPackBitsで圧縮してバッファに置く（重複は圧縮後のバイト列でまとめる）。
+# このとき、sizesは圧縮後のバイト数で、store[i] は展開した配列を返す。
+class GlyphStore:
+    def __init__(self, bitmaps, dedup=False, compression="none"):
+        count = len(bitmaps)
+        self.compression = compression
+        self.heights = np.fromiter((bitmap.shape[0] for bitmap in bitmaps), dtype=np.int64, count=count)
+        self.rowBytes = np.fromiter((bitmap.shape[1] for bitmap in bitmaps), dtype=np.int64, count=count)
+        self.bitmapBytes = self.heights * self.rowBytes
+        self.sizes = self.bitmapBytes.copy()
+        self.starts = np.empty(count, dtype=np.int64)
+        chunks = []
+        owners = []
+        seen = {}
+        position = 0
+        for index, bitmap in enumerate(bitmaps):
+            chunk = np.asarray(bitmap, dtype=np.uint8).tobytes()
+            if compression == "packbits":
+                chunk = packBits(chunk)
+                self.sizes[index] = len(chunk)
+            if dedup and chunk in seen:
+                self.starts[index] = seen[chunk]
+                continue
+            seen[chunk] = position
+            self.starts[index] = position
+            chunks.append(chunk)
+            owners.append(index)
+            position += len(chunk)
+        self.owners = np.array(owners, dtype=np.int64)
+        # バッファは変更できないbytesにして、配列としてはそれを参照する（コピーしない）
+        self.raw = b"".join(chunks)
+        self.buffer = np.frombuffer(self.raw, dtype=np.uint8)
+        self.data = memoryview(self.raw)
+
+    def __len__(self):
+        return len(self.heights)
+
+    def __getitem__(self, index):
+        start = self.starts[index]
+        if self.compression == "packbits":
+            data = fontreader.unpackBits(self.raw[start:start + self.sizes[index]], int(self.bitmapBytes[index]))
+            return np.frombuffer(data, dtype=np.uint8).reshape(self.heights[index], self.rowBytes[index])
+        return self.buffer[start:start + self.sizes[index]].reshape(self.heights[index], self.rowBytes[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def view(self, index):
+        start = int(self.starts[index])
+        return self.data[start:start + int(self.sizes[index])]
+
+    # ビットマップデータの合計バイト数（重複をまとめた後の、バッファの大きさ）
+    @property
+    def nbytes(self):
+        return len(self.raw)
+
+    # 重複をまとめたことで減ったバイト数
+    @property
+    def savedBytes(self):
+        return int(self.sizes.sum()) - len(self.raw)
+
+# ビットマップの圧縮方式。packbitsは、グリフごとにPackBits（TIFFなどと同じランレングス圧縮）で圧縮する
+COMPRESSION_TYPES = ("none", "packbits")
+# 圧縮できる出力形式（C言語の展開関数を付けられる形式）
+COMPRESS_OUTPUT_TYPES = ("CData", "PBinary")
+
+# PackBitsで圧縮する関数
+# 制御バイト n が 0～127 なら続く n+1 バイトをそのまま、-1～-127（0x81～0xFF）なら次の１バイトを 1-n 回繰り返す。
+# 同じ値が３バイト以上続くところを繰り返しにし、それ以外は128バイトまでの非圧縮ブロックにする。
+def packBits(data):
+    output = bytearray()
+    length = len(data)
+    pos = 0
+    while pos < length:
+        run = 1
+        while pos + run < length and run < 128 and data[pos + run] == data[pos]:
+            run += 1
+        if run >= 3:
+            output.append(257 - run)
+            output.append(data[pos])
+            pos += run
+            continue
+        end = pos
+        while end < length and end - pos < 128 and not (end + 2 < length and data[end] == data[end + 1] == data[end + 2]):
+            end += 1
+        output.append(end - pos - 1)
+        output += data[pos:end]
+        pos = end
+    return bytes(output)
+
+# 生成するCのヘッダに入れる、PackBitsの展開関数。
+# 複数のフォントのヘッダをインクルードしても重複しないよう、マクロで囲む
+PACKBITS_C_DECODER = """#ifndef KANJI_PACKBITS_DECODER
+#define KANJI_PACKBITS_DECODER
+// Decode one PackBits-compressed glyph.
+//   src  : &bitmap[offsetBMP]
+//   dst  : buffer of height * ((width + 7) / 8) bytes
+//   size : height * ((width + 7) / 8)
+static inline void DecodeKanjiBitmap(const uint8_t *src, uint8_t *dst, uint16_t size) {
+\tuint16_t pos = 0;
+\twhile (pos < size) {
+\t\tint8_t n = (int8_t)*src++;
+\t\tif (n >= 0) {
+\t\t\tfor (int i = 0; i <= n; i++) dst[pos++] = *src++;
+\t\t} else if (n != -128) {
+\t\t\tuint8_t value = *src++;
+\t\t\tfor (int i = 0; i <= -n; i++) dst[pos++] = value;
+\t\t}
+\t}
+}
+#endif
+"""
+
+# ディスク上のグリフキャッシュ。
+# キーは（フォントファイルの内容のハッシュ、サイズ、Xオフセット、Yオフセット、マッピング、UTF-8コード）で、
+# ビットマップ配列（パック済み）と幅・高さをSQLiteのファイル１つに保存する。
+# 合計サイズが上限を超えたら、最後に使われた時刻が古いものから削除する（LRU）。
+class GlyphCache:
+    def __init__(self, cacheDir, maxBytes, fontPaths, fontSize, xOffset, yOffset, mappingWk, strikePpem=None):
+        os.makedirs(cacheDir, exist_ok=True)
+        self.maxBytes = maxBytes
+        # 入力フォントが複数のファイル（FONTX2の全角と半角）の場合は、すべてのファイルの内容をハッシュする
+        hasher = hashlib.sha256()
+        for fontPath in fontPaths:
+            with open(fontPath, "rb") as f:
+                hasher.update(f.read())
+        fontHash = hasher.hexdigest()
+        # フォントと描画パラメータの組み合わせを、１つの文字列にしてキーの前半に使う
+        # 埋め込みビットマップを使う場合は、レンダリングした結果と区別する
+        self.renderKey = f"{fontHash}:{fontSize}:{xOffset}:{yOffset}:{mappingWk}"
+        if strikePpem is not None:
+            self.renderKey += f":sbit{strikePpem}"
+        self.db = sqlite3.connect(os.path.join(cacheDir, "glyphcache.sqlite3"))
+        self.db.execute("CREATE TABLE IF NOT EXISTS glyph ("
+                        "render_key TEXT NOT NULL, code INTEGER NOT NULL, "
+                        "width INTEGER NOT NULL, height INTEGER NOT NULL, data BLOB NOT NULL, "
+                        "last_used INTEGER NOT NULL, PRIMARY KEY (render_key, code))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS glyph_last_used ON glyph (last_used)")
+
+    # UTF-8コードのリストに対応するグリフを探す。戻り値は コード→（幅、高さ、ビットマップ配列） の辞書
+    def get(self, codes):
+        found = {}
+        wanted = set(codes)
+        for code, width, height, data in self.db.execute("SELECT code, width, height, data FROM glyph WHERE render_key = ?", (self.renderKey,)):
+            if code in wanted:
+                found[code] = (width, height, np.frombuffer(data, dtype=np.uint8).reshape(height, -1))
+        if found:
+            self.db.executemany("UPDATE glyph SET last_used = ? WHERE render_key = ? AND code = ?",
+                                [(time.time_ns(), self.renderKey, code) for code in found])
+            self.db.commit()
+        return found
+
+    # コード→（幅、高さ、ビットマップ配列） の辞書をキャッシュに保存し、上限を超えた分を削除する
+    def put(self, glyphs):
+        if not glyphs:
+            return
+        now = time.time_ns()
+        self.db.executemany("INSERT OR REPLACE INTO glyph VALUES (?, ?, ?, ?, ?, ?)",
+                            [(self.renderKey, code, width, height, bmpData.tobytes(), now) for code, (width, height, bmpData) in glyphs.items()])
+        self.evict()
+        self.db.commit()
+
+    # 合計サイズが上限以下になるまで、最後に使われた時刻が古いものから削除する
+    def evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM glyph").fetchone()[0]
+        if total <= self.maxBytes:
+            return
+        victims = []
+        for rowid, size in self.db.execute("SELECT rowid, LENGTH(data) FROM glyph ORDER BY last_used"):
+            if total <= self.maxBytes:
+                break
+            victims.append((rowid,))
+            total -= size
+        self.db.executemany("DELETE FROM glyph WHERE rowid = ?", victims)
+
+    def close(self):
+        self.db.close()
+
+
+# メモリ上のグリフキャッシュ。監視モードで、前回のビルドでレンダリングしたグリフを再利用するために使う。
+# backingにGlyphCacheを指定すると、メモリにないグリフはディスクのキャッシュからも探す。
+class MemoryGlyphCache:
+    def __init__(self, backing=None):
+        self.glyphs = {}
+        self.backing = backing
+
+    def get(self, codes):
+        found = {code: self.glyphs[code] for code in codes if code in self.glyphs}
+        if self.backing is not None:
+            rest = [code for code in codes if code not in found]
+            if rest:
+                fromDisk = self.backing.get(rest)
+                self.glyphs.update(fromDisk)
+                found.update(fromDisk)
+        return found
+
+    def put(self, glyphs):
+        self.glyphs.update(glyphs)
+        if self.backing is not None:
+            self.backing.put(glyphs)
+
+    # codesに含まれないグリフ（文字セットから削除された文字）を捨てる
+    def retain(self, codes):
+        for code in [code for code in self.glyphs if code not in codes]:
+            del self.glyphs[code]
+
 def printBitArray(bitArray):
     for row in bitArray:
         for value in row:
@@ -470,14 +1700,260 @@ def printBitArray(bitArray):
 
 
 # C言語のヘッダファイルに出力する関数
-def Output2CLang(OutFileName, codeList , bitmapList) :
+# Cヘッダの１バイト分の文字列の表。ビットマップの各バイトを、毎回hex()やbin()で変換しないよう、あらかじめ作っておく
+CDATA_HEX_CELLS = [f"\t0x{value:02x}," for value in range(256)]
+CDATA_BIN_CELLS = [f"{value:08b}" for value in range(256)]
+# ファイルに書き込む単位（文字数）。出力文字列をこの程度ためてから、まとめて書き込む
+CDATA_WRITE_CHUNK = 1 << 20
+
+# ビットマップの１行（バイト列）を、Cヘッダの１行の文字列にする関数。
+# 空白行など、同じ内容の行は何度も現れるので、作った文字列はrowCacheに入れて再利用する。
+def formatCDataRow(rowBytes, rowCache, bitsComment=True):
+    text = rowCache.get(rowBytes)
+    if text is None:
+        text = "".join([CDATA_HEX_CELLS[value] for value in rowBytes])
+        if bitsComment:
+            text += "\t\t// " + "".join([CDATA_BIN_CELLS[value] for value in rowBytes]) + " \n"
+        else:
+            text += "\n"
+        rowCache[rowBytes] = text
+    return text
+
+# 圧縮したビットマップを出力するときの、１行あたりのバイト数
+CDATA_PACKED_BYTES_PER_LINE = 16
+
+# 出力文字列をためておき、一定量を超えたらファイルに書き込むクラス。詳細表示のときは、画面にも表示する
+class ChunkedWriter:
+    def __init__(self, f, chunkSize=CDATA_WRITE_CHUNK):
+        self.f = f
+        self.chunkSize = chunkSize
+        self.parts = []
+        self.length = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.length += len(text)
+        if isVerbose:
+            print(text, end="")
+        if self.length >= self.chunkSize:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.f.write("".join(self.parts))
+            self.parts = []
+            self.length = 0
+
+# 最小完全ハッシュ（--hash-index）
+# コード一覧の各コードを、最大２回のハッシュ（バケットを決めるものと、その変位を使うもの）で、重ならない番号（0～n-1）に対応させる表を作る。
+# 方式は hash and displace：まずコードをバケットに分け、バケットごとに、中のコードがすべて空いている番号に入る
+# 変位（ハッシュの種）を探す。コードが１つだけのバケットは、空いている番号を直接 -(番号+1) として持つ。
+# Cの関数（PERFECT_HASH_C_FUNCTIONS）と同じ計算をするため、32bitで桁あふれさせる。
+# 除算のないCPU（Cortex-M0など）でも速いよう、範囲への変換は割り算ではなく掛け算とシフトで行う。
+PERFECT_HASH_KEYS_PER_BUCKET = 2
+# １つのバケットで試す変位の上限。普通は数十回以内に見つかるので、これを超えたら変換をやめる
+PERFECT_HASH_MAX_SEED = 1 << 16
+
+def kanjiHash(key, seed):
+    h = (key ^ (seed * 0x9E3779B9)) & 0xFFFFFFFF
+    h = (h * 0x85EBCA77) & 0xFFFFFFFF
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+    h ^= h >> 16
+    return h
+
+def kanjiHashReduce(h, n):
+    return (h * n) >> 32
+
+# keysのハッシュ表を作る関数。（変位の表、番号→keysの位置 の表）を返す
+def makePerfectHash(keys):
+    count = len(keys)
+    bucketCount = max(1, (count + PERFECT_HASH_KEYS_PER_BUCKET - 1) // PERFECT_HASH_KEYS_PER_BUCKET)
+    buckets = [[] for _ in range(bucketCount)]
+    for index, key in enumerate(keys):
+        buckets[kanjiHashReduce(kanjiHash(key, 0), bucketCount)].append(index)
+    displacements = [0] * bucketCount
+    slots = [-1] * count
+    # コードの多いバケットから、全部が空いている番号に入る変位を探す
+    order = sorted(range(bucketCount), key=lambda bucket: -len(buckets[bucket]))
+    for bucket in order:
+        members = buckets[bucket]
+        if len(members) <= 1:
+            continue
+        for seed in range(1, PERFECT_HASH_MAX_SEED + 1):
+            targets = {kanjiHashReduce(kanjiHash(keys[index], seed), count) for index in members}
+            if len(targets) == len(members) and all(slots[target] < 0 for target in targets):
+                break
+        else:
+            raise SystemExit(GetMessage(isJapanese,"err_hashseed").format(PERFECT_HASH_MAX_SEED, len(members)))
+        displacements[bucket] = seed
+        for index in members:
+            slots[kanjiHashReduce(kanjiHash(keys[index], seed), count)] = index
+    # 残りの、コードが１つのバケットは、空いている番号に直接入れる
+    freeSlots = [slot for slot in range(count) if slots[slot] < 0]
+    for bucket in order:
+        if len(buckets[bucket]) == 1:
+            slot = freeSlots.pop()
+            slots[slot] = buckets[bucket][0]
+            displacements[bucket] = -slot - 1
+    return displacements, slots
+
+# 生成するCのヘッダに入れる、ハッシュの計算関数（makePerfectHash と同じ計算）
+PERFECT_HASH_C_FUNCTIONS = """#ifndef KANJI_PERFECT_HASH
+#define KANJI_PERFECT_HASH
+static inline uint32_t KanjiHash(uint32_t key, uint32_t seed) {
+\tuint32_t h = key ^ (seed * 0x9E3779B9u);
+\th *= 0x85EBCA77u;
+\th ^= h >> 13;
+\th *= 0xC2B2AE35u;
+\th ^= h >> 16;
+\treturn h;
+}
+static inline uint32_t KanjiHashReduce(uint32_t h, uint32_t n) {
+\treturn (uint32_t)(((uint64_t)h * n) >> 32);
+}
+#endif
+"""
 
+# コード一覧のハッシュ表と、それで検索するCの関数 名前_FindKanji() の文字列を作る関数
+# キーは、出力のエンコーディングのコード。同じコードが複数ある場合は、先の文字を使う
+def makeCDataHashIndex(codeList, out_encoding):
+    fieldName = CODE_SORT_FIELDS.get(out_encoding, "utf8")
+    memberName = {"utf8": "Unicode", "sjis": "SJIS", "jis": "JIS"}[fieldName]
+    keys, positions = np.unique(codeList.records[fieldName], return_index=True)
+    positions = positions.tolist()
+    displacements, slots = makePerfectHash(keys.tolist())
+    dispType = "int16_t" if max(map(abs, displacements)) < 0x8000 else "int32_t"
+    slotType = "uint16_t" if len(codeList) <= 0x10000 else "uint32_t"
     strOutput = ""
+    strOutput += f"// Perfect hash index over {memberName} (--hash-index).\n"
+    strOutput += f"// {structure_name}_FindKanji(code) returns the entry for the code with at most two hashes and one compare, or NULL.\n"
+    strOutput += PERFECT_HASH_C_FUNCTIONS
+    strOutput += f"static const {dispType} {structure_name}_hash_disp[{len(displacements)}] = {{\n"
+    for pos in range(0, len(displacements), 16):
+        strOutput += "\t" + "".join(f"{value}," for value in displacements[pos:pos + 16]) + "\n"
+    strOutput += "};\n"
+    strOutput += f"static const {slotType} {structure_name}_hash_slot[{len(slots)}] = {{\n"
+    for pos in range(0, len(slots), 16):
+        strOutput += "\t" + "".join(f"{positions[index]}," for index in slots[pos:pos + 16]) + "\n"
+    strOutput += "};\n"
+    strOutput += f"static inline const KanjiData *{structure_name}_FindKanji(uint32_t code) {{\n"
+    strOutput += f"\tint32_t d = {structure_name}_hash_disp[KanjiHashReduce(KanjiHash(code, 0), {len(displacements)})];\n"
+    strOutput += f"\tuint32_t slot = d < 0 ? (uint32_t)(-d - 1) : KanjiHashReduce(KanjiHash(code, (uint32_t)d), {len(slots)});\n"
+    strOutput += f"\tconst KanjiData *data = &{structure_name}[{structure_name}_hash_slot[slot]];\n"
+    strOutput += f"\treturn data->{memberName} == code ? data : NULL;\n"
+    strOutput += "}\n"
+    return strOutput
+
+# 区点の直接索引（--kuten-index）
+# JIS X 0208の２バイトコードは94区×94点の表になるので、区ごとに、点の有無のビット（32点ずつ３語）と、
+# 各語の最初の文字の位置を持てば、位置＝基準位置＋その点より前にあるビットの数 で、探さずに求められる。
+# １バイトコードは、256個の表で位置を直接引く。ない文字は KANJI_NO_ENTRY。
+# コード一覧がJISの順（JIS・SJISでソートした場合）でなければ、区点の順の位置から配列の位置への表も出力する。
+KUTEN_ROWS = 94
+KUTEN_WORDS = 3     # 94点を32bitずつに分けた語の数
+
+KUTEN_C_FUNCTIONS = """#ifndef KANJI_KUTEN_INDEX
+#define KANJI_KUTEN_INDEX
+#define KANJI_NO_ENTRY 0xFFFF
+static inline uint8_t KanjiPopCount32(uint32_t v) {
+\tv = v - ((v >> 1) & 0x55555555u);
+\tv = (v & 0x33333333u) + ((v >> 2) & 0x33333333u);
+\treturn (uint8_t)((((v + (v >> 4)) & 0x0F0F0F0Fu) * 0x01010101u) >> 24);
+}
+// Shift_JIS (2 bytes) to JIS X 0208. Returns 0 for codes outside the JIS X 0208 area.
+static inline uint16_t KanjiSJISToJIS(uint16_t sjis) {
+\tint hi = sjis >> 8, lo = sjis & 0xFF;
+\tif (lo < 0x40 || lo == 0x7F || lo > 0xFC) return 0;
+\tif (hi >= 0x81 && hi <= 0x9F) hi -= 0x81;
+\telse if (hi >= 0xE0 && hi <= 0xEF) hi -= 0xC1;
+\telse return 0;
+\thi = hi * 2 + 0x21;
+\tif (lo >= 0x9F) {
+\t\thi++;
+\t\tlo -= 0x7E;
+\t} else {
+\t\tlo -= (lo >= 0x80) ? 0x20 : 0x1F;
+\t}
+\treturn (uint16_t)((hi << 8) | lo);
+}
+#endif
+"""
+
+# 区点の直接索引と、それで検索するCの関数 名前_FindJIS() / 名前_FindSJIS() の文字列を作る関数
+def makeCDataKutenIndex(codeList):
+    codes, positions = np.unique(codeList.records["jis"].astype(np.int64), return_index=True)
+    if len(codeList) >= 0xFFFF:
+        raise SystemExit(GetMessage(isJapanese,"err_kutenindexsize").format(len(codeList)))
+    single = codes <= 0xFF
+    singleTable = np.full(256, 0xFFFF, dtype=np.int64)
+    singleTable[codes[single]] = positions[single]
+    # 区点の範囲外のコードは表に入らない（名前_FindJIS() では見つからない）
+    ku = (codes >> 8) - 0x21
+    ten = (codes & 0xFF) - 0x21
+    inGrid = ~single & (ku >= 0) & (ku < KUTEN_ROWS) & (ten >= 0) & (ten < KUTEN_ROWS)
+    ku, ten, positions = ku[inGrid], ten[inGrid], positions[inGrid]
+    presence = np.zeros((KUTEN_ROWS, KUTEN_WORDS * 32), dtype=np.uint8)
+    presence[ku, ten] = 1
+    bits = np.packbits(presence, axis=1, bitorder="little").view("<u4")          # (区, 語)
+    counts = presence.reshape(KUTEN_ROWS * KUTEN_WORDS, 32).sum(axis=1)
+    bases = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    # 区点の順に並んだ文字が、配列の中でも連続していれば、位置の表はいらない
+    direct = len(positions) == 0 or np.array_equal(positions, np.arange(positions[0], positions[0] + len(positions)))
+    if direct and len(positions):
+        bases = bases + positions[0]
+
+    strOutput = ""
+    strOutput += "// Direct ku-ten index (--kuten-index).\n"
+    strOutput += f"// {structure_name}_FindJIS(code) / {structure_name}_FindSJIS(code) return the entry for the code without searching, or NULL.\n"
+    strOutput += KUTEN_C_FUNCTIONS
+    strOutput += f"static const uint16_t {structure_name}_single[256] = {{\n"
+    for pos in range(0, 256, 16):
+        strOutput += "\t" + "".join(f"0x{value:04x}," for value in singleTable[pos:pos + 16].tolist()) + "\n"
+    strOutput += "};\n"
+    strOutput += f"static const uint16_t {structure_name}_ku_base[{KUTEN_ROWS}][{KUTEN_WORDS}] = {{\n"
+    strOutput += "".join(f"\t{{{', '.join(str(value) for value in row)}}},\n" for row in bases.reshape(KUTEN_ROWS, KUTEN_WORDS).tolist())
+    strOutput += "};\n"
+    strOutput += f"static const uint32_t {structure_name}_ku_bits[{KUTEN_ROWS}][{KUTEN_WORDS}] = {{\n"
+    strOutput += "".join(f"\t{{{', '.join(f'0x{value:08x}' for value in row)}}},\n" for row in bits.tolist())
+    strOutput += "};\n"
+    if direct:
+        entry = "rank"
+    else:
+        strOutput += f"static const uint16_t {structure_name}_kuten_pos[{len(positions)}] = {{\n"
+        for pos in range(0, len(positions), 16):
+            strOutput += "\t" + "".join(f"{value}," for value in positions[pos:pos + 16].tolist()) + "\n"
+        strOutput += "};\n"
+        entry = f"{structure_name}_kuten_pos[rank]"
+    strOutput += f"static inline const KanjiData *{structure_name}_FindJIS(uint16_t code) {{\n"
+    strOutput += "\tif (code < 0x100) {\n"
+    strOutput += f"\t\tuint16_t index = {structure_name}_single[code];\n"
+    strOutput += f"\t\treturn index == KANJI_NO_ENTRY ? NULL : &{structure_name}[index];\n"
+    strOutput += "\t}\n"
+    strOutput += "\tuint8_t ku = (uint8_t)((code >> 8) - 0x21), ten = (uint8_t)((code & 0xFF) - 0x21);\n"
+    strOutput += f"\tif (ku >= {KUTEN_ROWS} || ten >= {KUTEN_ROWS}) return NULL;\n"
+    strOutput += f"\tuint32_t bits = {structure_name}_ku_bits[ku][ten >> 5], mask = 1u << (ten & 31);\n"
+    strOutput += "\tif (!(bits & mask)) return NULL;\n"
+    strOutput += f"\tuint16_t rank = {structure_name}_ku_base[ku][ten >> 5] + KanjiPopCount32(bits & (mask - 1));\n"
+    strOutput += f"\treturn &{structure_name}[{entry}];\n"
+    strOutput += "}\n"
+    strOutput += f"static inline const KanjiData *{structure_name}_FindSJIS(uint16_t code) {{\n"
+    strOutput += "\tif (code < 0x100) {\n"
+    strOutput += f"\t\treturn {structure_name}_FindJIS(code);\n"
+    strOutput += "\t}\n"
+    strOutput += "\tuint16_t jis = KanjiSJISToJIS(code);\n"
+    strOutput += f"\treturn jis ? {structure_name}_FindJIS(jis) : NULL;\n"
+    strOutput += "}\n"
+    return strOutput
+
+def Output2CLang(OutFileName, codeList , bitmapList, out_encoding="UTF8") :
+
     if isVerbose:
         print(GetMessage(isJapanese,"log_genoutput").format(OutFileName))
 
-    with open(OutFileName, "w", encoding="utf-8") as f:
-        cmd_line = " ".join(sys.argv)  # 引数をスペース区切りの文字列として取得
+    with open(OutFileName, "w", encoding="utf-8", buffering=CDATA_WRITE_CHUNK) as f:
+        out = ChunkedWriter(f)
+        cmd_line = " ".join(command_args)  # 引数をスペース区切りの文字列として取得
         cmd_line = os.path.basename(cmd_line)
         strOutput = ""
         strOutput +="// This file is auto generated by font.py\n"
@@ -488,14 +1964,13 @@ def Output2CLang(OutFileName, codeList , bitmapList) :
         strOutput +="// Code Set: " + code_set + "\n"
         strOutput +="// Character count: " + str(len(codeList)) + "\n"
         strOutput +=f"// data size:{total_size(bitmapList):} bytes\n"
+        if bitmapList.compression == "packbits":
+            strOutput +=f"// Compression: PackBits (uncompressed {int(bitmapList.bitmapBytes.sum())} bytes). Decode with DecodeKanjiBitmap().\n"
         strOutput +=f"// \n"
-
-        f.write(strOutput)
+        out.write(strOutput)
         if isVerbose:
-            print(strOutput,end="")
             print()
 
-
         #まず、ビットマップ情報の表示
         strOutput = ""
         strOutput += "/*\n"
@@ -508,26 +1983,23 @@ def Output2CLang(OutFileName, codeList , bitmapList) :
         strOutput += "\tuint32_t offsetBMP;\n"
         strOutput += "};\n"
         strOutput += "*/\n"
-
-        f.write(strOutput)
+        if bitmapList.compression == "packbits":
+            strOutput += PACKBITS_C_DECODER
+        out.write(strOutput)
         if isVerbose:
-            print(strOutput,end="")
             print()
 
-        if (isEndMark == "ALLZERO"):
-            codeList.append([0,0,0,"",0,0,0])
-        elif (isEndMark == "ALLMAX"):
-            codeList.append([0xFFFFFFFF,0xFFFF,0xFFFF,"",0,0,0])
+        # ハッシュ表は終了マークを含めずに作る（終了マークは最後に付くので、文字の位置は変わらない）
+        hashIndex = makeCDataHashIndex(codeList, out_encoding) if hash_index and len(codeList) else ""
+        kutenIndex = makeCDataKutenIndex(codeList) if kuten_index else ""
 
-        strOutput = ""
-        strOutput += f"static const KanjiData {structure_name}[] = {{\n"
-        for i, code in enumerate(codeList):
-            strWkLine = ""
-            strWkLine = "\t{" + f"0x{hex(code[0])[2:].zfill(8)} , 0x{hex(code[1])[2:].zfill(4)} , 0x{hex(code[2])[2:].zfill(4)} , {code[4]:>2} ,{code[5]:>2} , 0x{hex(code[6])[2:].zfill(8)}" + "}"
-            if i < len(codeList) - 1:
-                strWkLine += ","
-            else:
-                strWkLine += " "
+        # 終了マークは、呼び出し元のコード一覧を変更しないよう、コピーに追加する
+        codeList = codeList.withEndMark(isEndMark)
+
+        out.write(f"static const KanjiData {structure_name}[] = {{\n")
+        codes = list(codeList)     # 行ごとに書式化するので、先にリストにしておく
+        lastNo = len(codes) - 1
+        for i, code in enumerate(codes):
             # 最後に、どの文字コードなのかを示すため、コメントを付ける。ただ、バックスラッシュ記号が // の中にあると、
             # 継続行として扱われてしまい、次の行がコメントになってしまうので、表示文字はダブルクォートで囲む。
             # この動作って、C++の仕様？と思って調べたら、仕様だった。
@@ -538,79 +2010,172 @@ def Output2CLang(OutFileName, codeList , bitmapList) :
             #   char *fn;    //　読み込み元 "C:\hoge\"
             # だと、行末がバックスラッシュにならないので問題ない。
             # //を継続行にしたい奴っているの？？？もはや仕様のバグ・・・
-            strWkLine += f"\t// \"{code[3]}\"\n"
-            strOutput += strWkLine
-        strOutput += "};\n"
-
-        f.write(strOutput)
-        if isVerbose:
-            print (strOutput,end="")
+            out.write(f"\t{{0x{code[0]:08x} , 0x{code[1]:04x} , 0x{code[2]:04x} , {code[4]:>2} ,{code[5]:>2} , 0x{code[6]:08x}}}{',' if i < lastNo else ' '}\t// \"{code[3]}\"\n")
+        out.write("};\n")
+        out.write(hashIndex)
+        out.write(kutenIndex)
 
         # 次に対応するビットマップデータを表示
-        offset = 0
-        strOutput = f"static const uint8_t {bitmapdata_name}[] = {{\n"
-        f.write(strOutput)
-        if isVerbose:
-            print (strOutput,end="")
-
-
-        for charNo , row in enumerate(bitmapList):
-            oneBlock = ""
-            oneBlock += f"// UNICODE:0x{hex(codeList[charNo][0])[2:].zfill(8)} -  Offset:0x{hex(codeList[charNo][6])[2:].zfill(8)}   -- CHAR:\"{codeList[charNo][3]}\" \n"
-            for value in row:
-                bitsInfo = ""
-                for x , xdata in enumerate(value) :
-                    bitsInfo += bin(xdata)[2:].zfill(8)
-                    oneBlock += f"\t0x{hex(xdata)[2:].zfill(2)}"
-
-                    #print(f"0x{hex(xdata)[2:].zfill(2)}",end = "")
-                    if x < len(value) - 1:
-                        oneBlock += ","
-                    else:
-                        oneBlock += ","
-                        oneBlock += f"\t\t// {bitsInfo} \n"
-                        #print(f"\t\t// {bitsInfo}")
-            oneBlock += "\n"
-            f.write(oneBlock)
-            if isVerbose:
-                print (oneBlock,end="")
-        f.write("};\n")
-        if isVerbose:
-            print ("};")
+        out.write(f"static const uint8_t {bitmapdata_name}[] = {{\n")
+
+        rowCache = {}
+        raw = bitmapList.raw
+        for charNo in bitmapList.owners.tolist():     # 重複をまとめた場合は、バッファに置いたビットマップだけを出力する
+            code = codes[charNo]
+            out.write(f"// UNICODE:0x{code[0]:08x} -  Offset:0x{code[6]:08x}   -- CHAR:\"{code[3]}\" \n")
+            # グリフのバイト列を、バッファから行ごとに切り出す
+            # 圧縮した場合は行の区切りがないので、CDATA_PACKED_BYTES_PER_LINE バイトずつ、２進数のコメントなしで出力する
+            start = int(bitmapList.starts[charNo])
+            end = start + int(bitmapList.sizes[charNo])
+            if bitmapList.compression == "packbits":
+                rowLength, rowComment = CDATA_PACKED_BYTES_PER_LINE, False
+            else:
+                rowLength, rowComment = int(bitmapList.rowBytes[charNo]), bitsComment
+            if end > start:
+                out.write("".join([formatCDataRow(raw[pos:min(pos + rowLength, end)], rowCache, rowComment) for pos in range(start, end, rowLength)]))
+            out.write("\n")
+        out.write("};\n")
+        out.flush()
     if isVerbose:
         print(GetMessage(isJapanese,"log_done"))
 
 #バイナリデータに変換する
 #
-def Output2Binary(OutFileName, codeList , bitmapList) :
+# PBinary形式の _code.bin の先頭に付けるヘッダ（--bin-header）。
+# マジック(4) バージョン(1) バイト順 'B'/'L'(1) レコードサイズ(2) レコード数(4) ビットマップのバイト数(4) の16バイトで、
+# マジックとバイト順以外は、レコードと同じバイト順で書く。
+# ビットマップをPackBitsで圧縮した場合（--compress packbits）は、バージョンを2にする。
+PBINARY_MAGIC = b"PFCB"
+PBINARY_VERSION = 1
+PBINARY_VERSION_PACKBITS = 2
+PBINARY_HEADER_FORMAT = "4sBBHII"
+PBINARY_BYTEORDERS = {"big": ">", "little": "<"}
+
+def makePBinaryHeader(recordCount, bitmapBytes, byteorder, compression="none"):
+    order = PBINARY_BYTEORDERS[byteorder]
+    version = PBINARY_VERSION_PACKBITS if compression == "packbits" else PBINARY_VERSION
+    return struct.pack(order + PBINARY_HEADER_FORMAT, PBINARY_MAGIC, version, ord("B" if order == ">" else "L"),
+                       CODE_RECORD_DTYPE.itemsize, recordCount, bitmapBytes)
+
+def Output2Binary(OutFileName, codeList , bitmapList, byteorder="big", withHeader=False) :
     #　まず、struct KanjiData をそのままバイナリデータにしていく。
     with open(OutFileName+"_code.bin", "wb") as f:
         if isVerbose:
             print(GetMessage(isJapanese,"log_genoutput").format(OutFileName+"_code.bin"))
-        for code in codeList:
-            # 各データをバイナリ形式に変換して書き込む。IHHBBIとして、32bit/16/16/8/8/32 を指定する。
-            binary_data = struct.pack(">IHHBBI", code[0], code[1],code[2], code[4],code[5],code[6])
-            f.write(binary_data)
+        if withHeader:
+            f.write(makePBinaryHeader(len(codeList), bitmapList.nbytes, byteorder, bitmapList.compression))
+        # コード表のレコードは IHHBBI（32bit/16/16/8/8/32）と同じ並びなので、指定のバイト順にしてそのまま書き込む。
+        # 同じバイト順なら、変換もコピーもせずにメモリの内容を書き込む
+        records = np.ascontiguousarray(codeList.records, dtype=CODE_RECORD_DTYPE.newbyteorder(PBINARY_BYTEORDERS[byteorder]))
+        f.write(memoryview(records).cast("B"))
     #　次に、ビットマップデータをバイナリ形式に変換して書き込む。            
     with open(OutFileName+"_bitmap.bin", "wb") as f:
         if isVerbose:
             print(GetMessage(isJapanese,"log_genoutput").format(OutFileName+"_bitmap.bin"))       
-        for charNo , row in enumerate(bitmapList):
-            oneBlock = ""
-            oneBlock += f"// UNICODE:0x{hex(codeList[charNo][0])[2:].zfill(8)} -  Offset:0x{hex(codeList[charNo][6])[2:].zfill(8)}   -- CHAR:\"{codeList[charNo][3]}\" \n"
-            for value in row:
-                for x , xdata in enumerate(value) :
-                    f.write(xdata)
+        # ビットマップはコード一覧の順に連続しているので、バッファをそのまま書き込む
+        f.write(bitmapList.data)
+    # 圧縮した場合は、展開用のCの関数を _decoder.h に出力する
+    if bitmapList.compression == "packbits":
+        with open(OutFileName+"_decoder.h", "w", encoding="utf-8") as f:
+            if isVerbose:
+                print(GetMessage(isJapanese,"log_genoutput").format(OutFileName+"_decoder.h"))
+            f.write("// This file is auto generated by font.py\n")
+            f.write(f"// PackBits decoder for {os.path.basename(OutFileName)}_bitmap.bin\n")
+            f.write("#include <stdint.h>\n")
+            f.write(PACKBITS_C_DECODER)
+    if isVerbose:
+        print(GetMessage(isJapanese,"log_done"))
+
+# Python形式の１バイト分の文字列の表
+PYTHON_HEX_CELLS = [f"0x{value:02X}," for value in range(256)]
+
+# Python形式の出力方式。listは従来の整数のリスト、bytesとbase85はデータを１つのbytesリテラルにまとめる
+PYTHON_FORMATS = ("list", "bytes", "base85")
+# bytesリテラル１行あたりのバイト数
+PYTHON_BYTES_PER_LINE = 48
+
+# データを、Pythonのbytesリテラルの行（隣り合うリテラルはコンパイル時に連結される）にする関数
+def pythonBytesLiteral(data, pythonFormat):
+    if pythonFormat == "base85":
+        text = base64.b85encode(data).decode("ascii")       # base85の文字には " と \ がないので、そのまま b"..." にできる
+        step = PYTHON_BYTES_PER_LINE * 2
+        return "\n".join(f'\tb"{text[pos:pos + step]}"' for pos in range(0, len(text), step)) or '\tb""'
+    return "\n".join(f"\t{bytes(data[pos:pos + PYTHON_BYTES_PER_LINE])!r}" for pos in range(0, len(data), PYTHON_BYTES_PER_LINE)) or '\tb""'
+
+# 生成するPythonモジュールに入れる検索関数。indexは並び順のコード（リトルエンディアンのuint32）の配列
+PYTHON_LOOKUP_HELPER = '''
+RECORD = struct.Struct("<IHHBBI")
+
+def _loadIndex(data):
+    if sys.byteorder == "little":
+        return memoryview(data).cast("I")
+    keys = array.array("I")
+    keys.frombytes(data)
+    keys.byteswap()
+    return keys
+
+_index = _loadIndex(index)
+
+# コード（ENCODINGの値。UTF8はUTF-8のバイト列をそのまま整数にしたもの）を二分探索して、
+# (utf8, sjis, jis, 幅, 高さ, ビットマップのmemoryview) を返す。見つからなければNone
+def find(codeValue):
+    pos = bisect.bisect_left(_index, codeValue)
+    if pos >= len(_index) or _index[pos] != codeValue:
+        return None
+    utf8, sjis, jis, width, height, offset = RECORD.unpack_from(code, pos * RECORD.size)
+    return (utf8, sjis, jis, width, height, memoryview(bitmap)[offset:offset + height * ((width + 7) // 8)])
+'''
+
+# Python形式で、コード表とビットマップを１つずつのbytesリテラル（またはbase85）にして出力する関数。
+# code と bitmap は従来の出力と同じ内容のbytesなので、そのまま置き換えて使える。
+# 整数のリストをコンパイル・実行しないので、importが速い。
+def Output2PythonCompact(OutFileName, codeList, bitmapList, pythonFormat, out_encoding):
+    if isVerbose:
+        print(GetMessage(isJapanese,"log_genoutput").format(OutFileName))
+    cmd_line = os.path.basename(" ".join(command_args))
+    # 検索用の索引は、終了マークを付ける前のコード表の並び順のコード
+    sortField = CODE_SORT_FIELDS[out_encoding]
+    index = codeList.records[sortField].astype("<u4").tobytes()
+    records = codeList.withEndMark(isEndMark).records.astype(CODE_RECORD_DTYPE).tobytes()
+
+    with open(OutFileName, "w", encoding="utf-8") as f:
+        strOutput = ""
+        strOutput +="# This file is auto generated by font.py\n"
+        strOutput +="# "+cmd_line+"\n"
+        strOutput +="# Do not edit this file directly.\n"
+        strOutput +="# Font: " + Path(font_path).name + "\n"
+        strOutput +="# Font Size: " + str(font_XSize)+"x"+str(font_YSize)  + "\n"
+        strOutput +="# Code Set: " + code_set + "\n"
+        strOutput +="# Character count: " + str(len(codeList)) + "\n"
+        strOutput +=f"# data size:{total_size(bitmapList):} bytes\n"
+        strOutput +=f"# \n"
+        strOutput += "import array\nimport bisect\nimport struct\nimport sys\n"
+        if pythonFormat == "base85":
+            strOutput += "from base64 import b85decode\n"
+        strOutput += "\n"
+        strOutput += f"ENCODING = \"{out_encoding}\"\n"
+        strOutput += f"COUNT = {len(codeList)}\n"
+        f.write(strOutput)
+
+        # code: struct.pack("<IHHBBI") のレコードを並べたもの（終了マークを含む）、index: 検索用のコード、bitmap: ビットマップデータ
+        for name, data in (("code", records), ("index", index), ("bitmap", bitmapList.data)):
+            if pythonFormat == "base85":
+                f.write(f"{name} = b85decode(\n{pythonBytesLiteral(data, pythonFormat)}\n)\n")
+            else:
+                f.write(f"{name} = (\n{pythonBytesLiteral(data, pythonFormat)}\n)\n")
+        f.write(PYTHON_LOOKUP_HELPER)
     if isVerbose:
         print(GetMessage(isJapanese,"log_done"))
 
 # Pythonのバイナリデータに変換する
-def Output2Python(OutFileName, codeList , bitmapList) :
+def Output2Python(OutFileName, codeList , bitmapList, out_encoding="UTF8") :
+    if python_format != "list":
+        return Output2PythonCompact(OutFileName, codeList, bitmapList, python_format, out_encoding)
 
     strOutput = ""
     if isVerbose:
         print(GetMessage(isJapanese,"log_genoutput").format(OutFileName))
-    cmd_line = " ".join(sys.argv)  # 引数をスペース区切りの文字列として取得
+    cmd_line = " ".join(command_args)  # 引数をスペース区切りの文字列として取得
     cmd_line = os.path.basename(cmd_line)
 
 
@@ -638,10 +2203,8 @@ def Output2Python(OutFileName, codeList , bitmapList) :
         if isVerbose:
             print(strOutput,end="")
             print()
-        if (isEndMark == "ALLZERO"):
-            codeList.append([0,0,0,"",0,0,0])
-        elif (isEndMark == "ALLMAX"):
-            codeList.append([0xFFFFFFFF,0xFFFF,0xFFFF,"",0,0,0])
+        # 終了マークは、呼び出し元のコード一覧を変更しないよう、コピーに追加する
+        codeList = codeList.withEndMark(isEndMark)
         strOutput = ""
         strOutput += f"code = b\"\".join(struct.pack(\"<IHHBBI\", *data) for data in [\n"
 #        strOutput += f"{structure_name} = b\"\".join(struct.pack(\"<IHHBBI\", *data) for data in [\n"
@@ -671,11 +2234,8 @@ def Output2Python(OutFileName, codeList , bitmapList) :
 
         # 次に対応するビットマップデータを表示
         # 各サブリストを処理
-        for sublist in bitmapList:
-            strOutput = ""
-            for subsublist in sublist:
-                for byte in subsublist:
-                    strOutput += f"0x{byte:02X},"
+        for charNo in bitmapList.owners.tolist():
+            strOutput = "".join([PYTHON_HEX_CELLS[byte] for byte in bitmapList.view(charNo)])
             f.write(strOutput+"\n")  # 変数を出力
             if isVerbose:
                 print(strOutput)
@@ -692,6 +2252,9 @@ def Output2Python(OutFileName, codeList , bitmapList) :
 
  
 
+# FONTX2の半角ファイルの文字数（１バイトコードのすべて）
+FONTX2_HAN_CELLS = 256
+
 def Output2FONTX2(OutFileName, codeList, bitmapList,out_encoding):
     """
     FONTX2形式で全角用・半角用を別々のファイルに出力する（文字コードはShiftJIS、エンディアン逆）
@@ -704,33 +2267,20 @@ def Output2FONTX2(OutFileName, codeList, bitmapList,out_encoding):
 
     # コードブロックテーブルを作成（全角用のみ）
     def make_code_blocks(codeList,out_encoding):
-        blocks = []
-        prev = None
-        start = None
         if (out_encoding == "UTF8"):
             raise SystemExit(GetMessage(isJapanese,"err_cannotuseenc").format(out_encoding,"FONTX2"))
-        elif (out_encoding == "SJIS"):
-            cidx = 1   
-        elif (out_encoding == "JIS"):
-            cidx = 2
-        else:
+        elif (out_encoding not in ("SJIS", "JIS")):
             raise SystemExit(GetMessage(isJapanese,"err_notsupportedencoding").format(out_encoding))
 
-        for code in sorted([c[cidx] for c in codeList if c[cidx] > 0xFF]):
-            if start is None:
-                start = code
-                prev = code
-            elif prev != None and code == prev + 1:
-                prev = code
-            elif prev == None :
-                SystemError(GetMessage(isJapanese,"err_logicerror").format(sys._getframe().f_lineno, "make_code_blocks: prev is None but start is not None"))
-            else:
-                blocks.append((start, prev))
-                start = code
-                prev = code
-        if start is not None:
-            blocks.append((start, prev))
-        return blocks
+        # コードを並べて、連続していない位置でブロックを区切る
+        codes = codeList.records[CODE_SORT_FIELDS[out_encoding]].astype(np.int64)
+        codes = np.sort(codes[codes > 0xFF])
+        if len(codes) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(codes) != 1)
+        starts = np.concatenate([codes[:1], codes[breaks + 1]])
+        ends = np.concatenate([codes[breaks], codes[-1:]])
+        return list(zip(starts.tolist(), ends.tolist()))
 
     def make_header_zen(font_name, width, height, nb):
         header = bytearray(18 + nb * 4)
@@ -756,24 +2306,26 @@ def Output2FONTX2(OutFileName, codeList, bitmapList,out_encoding):
         return header
 
     # SJIS順に並び替え
-    sjis_sorted = sorted(enumerate(codeList), key=lambda x: x[1][1])
-    sorted_codeList = [x[1] for x in sjis_sorted]
-    sorted_bitmapList = [bitmapList[x[0]] for x in sjis_sorted]
+    sjis_order = np.argsort(codeList.records["sjis"], kind="stable")
+    sorted_codeList = codeList[sjis_order]
+    sorted_bitmapList = [bitmapList[idx] for idx in sjis_order.tolist()]
+    sjis_codes = sorted_codeList.records["sjis"].tolist()
+    widths = sorted_codeList.records["width"].tolist()
 
     # 半角用ファイル出力（ShiftJISコードを使う、エンディアン逆、ヘッダ17バイト）
+    # 半角は、コード×１文字のサイズの位置から読まれるので、コードセットにないコードも空白にして、いつも256文字分を出力する
     if isVerbose:
         print(GetMessage(isJapanese,"log_genoutput").format(han_file))
+    han_width = font_XSize // 2
+    han_cells = [bytes(font_YSize * ((han_width + 7) // 8))] * FONTX2_HAN_CELLS
+    for idx, (sjis_val, width) in enumerate(zip(sjis_codes, widths)):
+        if sjis_val <= 0xFF:
+            # f_han.write(bytes([0x00, sjis_val & 0xFF]))  # FONTX2仕様では不要なので削除
+            bytes_per_row = max(1, (width + 7) // 8)
+            han_cells[sjis_val] = sorted_bitmapList[idx][:, :bytes_per_row].tobytes()
     with open(han_file, "wb") as f_han:
-        f_han.write(make_header_han(font_path, font_XSize // 2, font_YSize))
-        for idx, code in enumerate(sorted_codeList):
-            sjis_val = code[1]
-            width = code[4]
-            bmp = sorted_bitmapList[idx]
-            if sjis_val <= 0xFF:
-                # f_han.write(bytes([0x00, sjis_val & 0xFF]))  # FONTX2仕様では不要なので削除
-                bytes_per_row = max(1, (width + 7) // 8)
-                for row in bmp:
-                    f_han.write(bytes(row[:bytes_per_row]))
+        f_han.write(make_header_han(font_path, han_width, font_YSize))
+        f_han.write(b"".join(han_cells))
     if isVerbose:
         print(GetMessage(isJapanese,"log_done"))
 
@@ -797,15 +2349,12 @@ def Output2FONTX2(OutFileName, codeList, bitmapList,out_encoding):
 
     with open(zen_file, "wb") as f_zen:
         f_zen.write(header)
-        for idx, code in enumerate(sorted_codeList):
-            sjis_val = code[1]
-            width = code[4]
+        for idx, (sjis_val, width) in enumerate(zip(sjis_codes, widths)):
             if sjis_val > 0xFF:
                 bmp = sorted_bitmapList[idx]
                 # f_zen.write(bytes([0x01, sjis_val & 0xFF, (sjis_val >> 8) & 0xFF]))  # FONTX2仕様上不要なので削除
                 bytes_per_row = max(1, (width + 7) // 8)
-                for row in bmp:
-                    f_zen.write(bytes(row[:bytes_per_row]))
+                f_zen.write(bmp[:, :bytes_per_row].tobytes())
     if isVerbose:
         print(GetMessage(isJapanese,"log_done"))
 
@@ -857,8 +2406,7 @@ CHARS {count}
         
 
         for row in bitmap:
-            hexstr = ''.join(f"{b:02X}" for b in row[:(width+7)//8])
-            lines.append(hexstr)
+            lines.append(row[:(width+7)//8].tobytes().hex().upper())
         lines.append("ENDCHAR")
         return '\n'.join(lines)
     
@@ -872,8 +2420,9 @@ CHARS {count}
             f.write("ENDFONT\n")
     else:
         # 半角
-        han_codes = [(c, b) for c, b in zip(codeList, bitmapList) if c[1] <= 0xFF]
-        zen_codes = [(c, b) for c, b in zip(codeList, bitmapList) if c[1] > 0xFF]
+        isHan = (codeList.records["sjis"] <= 0xFF).tolist()
+        han_codes = [(c, b) for c, b, han in zip(codeList, bitmapList, isHan) if han]
+        zen_codes = [(c, b) for c, b, han in zip(codeList, bitmapList, isHan) if not han]
         han_file = OutFileName.replace('.bdf', '_han.bdf')
         zen_file = OutFileName.replace('.bdf', '_zen.bdf')
         # 半角
@@ -894,41 +2443,405 @@ CHARS {count}
             print(GetMessage(isJapanese,"log_done"))
 
 
-if __name__ == "__main__":
-
-    # locale.getlocale()[0] が None の場合を考慮して安全に判定
-    loc = locale.getlocale()[0]
-    if loc is not None and (('JP' in loc) or ('Japanese' in loc)):
-        isJapanese = True
+# 出力形式と、出力ファイル名を自動で作るときの拡張子
+OUTPUT_EXTENSIONS = {"CData": ".h", "PBinary": "", "Python": ".py", "FONTX2": ".fnt", "BDF": ".bdf"}
+OUTPUT_TYPES = list(OUTPUT_EXTENSIONS.keys())
+# フォントにない文字の扱い（--missing）。checkCoverage を参照
+MISSING_MODES = ("render", "drop", "alias", "report")
+# ビットマップをオフセットで参照する出力形式。これらの形式では、同じビットマップをまとめられる
+DEDUP_OUTPUT_TYPES = ("CData", "PBinary", "Python")
+
+# フォントを読み込む関数。同じファイル・サイズのフォントは、一度読み込んだものを使う
+def loadFont(fontPath, fontSize):
+    key = (os.path.abspath(fontPath), fontSize, os.path.getmtime(fontPath))
+    if key not in FONT_CACHE:
+        FONT_CACHE[key] = ImageFont.truetype(fontPath, fontSize)
+    return FONT_CACHE[key]
+
+# フォントのcmap（Unicode→グリフ名）を読む関数。同じファイルは、一度読んだものを使う
+def getFontCmap(fontPath):
+    key = (os.path.abspath(fontPath), os.path.getmtime(fontPath))
+    if key not in CMAP_CACHE:
+        try:
+            CMAP_CACHE[key] = TTFont(fontPath, lazy=True, fontNumber=0).getBestCmap() or {}
+        except Exception:
+            CMAP_CACHE[key] = None          # cmapが読めないフォントは、すべての文字があるものとする
+    return CMAP_CACHE[key]
+
+# レンダリングの前に、コード一覧の各文字がフォントにあるかを調べ、--missing に従ってフォントにない文字を扱う関数
+# TrueTypeフォントはcmapで、BDF・FONTX2フォントはそのグリフの索引で調べる。印刷不能の１バイト文字は、いつもあるものとする。
+#   render : 調べない（すべてレンダリングする）
+#   drop   : フォントにない文字をコード一覧から取り除く
+#   alias  : フォントにない文字は残し、１つの代わりのグリフを共有させる
+#   report : フォントにない文字を表示し、すべてレンダリングする
+# 戻り値は（コード一覧、代わりのグリフを使う文字のUTF-8コードの集合）
+def checkCoverage(codeList):
+    if missing_mode == "render":
+        return codeList, frozenset()
+    codesUTF8 = codeList.records["utf8"].tolist()
+    chars = codeList.chars.tolist()
+    if font is None:
+        isMissing = [len(char) == 1 and not bitmap_source.covers(code, char) for code, char in zip(codesUTF8, chars)]
     else:
-        isJapanese = False
+        cmap = getFontCmap(font_path)
+        if cmap is None:
+            return codeList, frozenset()
+        isMissing = [len(char) == 1 and ord(char) not in cmap for char in chars]
+    isMissing = np.array(isMissing, dtype=bool)
+    missingChars = [char for char, flag in zip(chars, isMissing.tolist()) if flag]
+    if missing_mode == "drop":
+        print(GetMessage(isJapanese,"log_missingdrop").format(len(missingChars), len(codeList)))
+        return codeList[~isMissing], frozenset()
+    if missing_mode == "alias":
+        print(GetMessage(isJapanese,"log_missingalias").format(len(missingChars), len(codeList)))
+        return codeList, frozenset(code for code, flag in zip(codesUTF8, isMissing.tolist()) if flag)
+    print(GetMessage(isJapanese,"log_missingreport").format(len(missingChars), len(codeList), "".join(missingChars)))
+    return codeList, frozenset()
+
+# 指定されたコードセットの式を評価して、UTF-8/SJIS/JISコードのリスト配列を作り、指定されたエンコーディングでソートする関数
+# 一括ビルドでは、同じ条件のコード一覧を作ったことがあれば、そのコピーを返す
+def buildCodeList(code_set, charfile, out_encoding):
+    if CODELIST_CACHE is not None:
+        key = (code_set, os.path.abspath(charfile) if charfile != "" else "", mapping, out_encoding)
+        if key not in CODELIST_CACHE:
+            CODELIST_CACHE[key] = makeCodeList(code_set, charfile, out_encoding)
+        return CODELIST_CACHE[key].copy()
+    return makeCodeList(code_set, charfile, out_encoding)
+
+# コードセットの式からコード一覧を作ってソートする関数（buildCodeListの本体）
+def makeCodeList(code_set, charfile, out_encoding):
+    #指定されたコードセットの式を評価して、文字コードを変換してUTF-8/SJIS/JISコードのリスト配列にしておく
+    if isVerbose :
+        print(GetMessage(isJapanese,"log_gencodetbl").format(code_set))
+    codeBits = evalCodeSet(code_set, charfile)
+    codeList = getCodeTblFromCodes(np.flatnonzero(codeBits))    # コードのリスト。
+    if isVerbose:
+        print(GetMessage(isJapanese,"log_done"))
 
-    # 環境変数LANGが存在していたらisJapaneseを上書き
-    lang_env = os.environ.get('LANG')
-    if lang_env:
-        if 'ja' in lang_env.lower() or 'jp' in lang_env.lower():
-            isJapanese = True
-        else:
-            isJapanese = False
 
-    #教育漢字の一覧
-    KyouikuKanji = "一右雨円王音下火花貝学気九休玉金空月犬見五口校左三山子四糸字耳七車手十出女小上森人水正生青夕石赤千川先早草足村大男竹中虫町天田土二日入年白八百文木本名目立力林六\
-引羽雲園遠何科夏家歌画回会海絵外角楽活間丸岩顔汽記帰弓牛魚京強教近兄形計元言原戸古午後語工公広交光考行高黄合谷国黒今才細作算止市矢姉思紙寺自時室社弱首秋週春書少場色食心新親図数西声星晴切雪船線前組走多太体台地池知茶昼長鳥朝直通弟店点電刀冬当東答頭同道読内南肉馬売買麦半番父風分聞米歩母方北毎妹万明鳴毛門夜野友用曜来里理話\
-悪安暗医委意育員院飲運泳駅央横屋温化荷界開階寒感漢館岸起期客究急級宮球去橋業曲局銀区苦具君係軽血決研県庫湖向幸港号根祭皿仕死使始指歯詩次事持式実写者主守取酒受州拾終習集住重宿所暑助昭消商章勝乗植申身神真深進世整昔全相送想息速族他打対待代第題炭短談着注柱丁帳調追定庭笛鉄転都度投豆島湯登等動童農波配倍箱畑発反坂板皮悲美鼻筆氷表秒病品負部服福物平返勉放味命面問役薬由油有遊予羊洋葉陽様落流旅両緑礼列練路和\
-愛案以衣位囲胃印英栄塩億加果貨課芽改械害街各覚完官管関観願希季紀喜旗器機議求泣救給挙漁共協鏡競極訓軍郡径型景芸欠結建健験固功好候航康告差菜最材昨札刷殺察参産散残士氏史司試児治辞失借種周祝順初松笑唱焼象照賞臣信成省清静席積折節説浅戦選然争倉巣束側続卒孫帯隊達単置仲貯兆腸低底停的典伝徒努灯堂働特得毒熱念敗梅博飯飛費必票標不夫付府副粉兵別辺変便包法望牧末満未脈民無約勇要養浴利陸良料量輪類令冷例歴連老労録\
-圧移因永営衛易益液演応往桜恩可仮価河過賀快解格確額刊幹慣眼基寄規技義逆久旧居許境均禁句群経潔件券険検限現減故個護効厚耕鉱構興講混査再災妻採際在財罪雑酸賛支志枝師資飼示似識質舎謝授修述術準序招承証条状常情織職制性政勢精製税責績接設舌絶銭祖素総造像増則測属率損退貸態団断築張提程適敵統銅導徳独任燃能破犯判版比肥非備俵評貧布婦富武復複仏編弁保墓報豊防貿暴務夢迷綿輸余預容略留領\
-異遺域宇映延沿我灰拡革閣割株干巻看簡危机揮貴疑吸供胸郷勤筋系敬警劇激穴絹権憲源厳己呼誤后孝皇紅降鋼刻穀骨困砂座済裁策冊蚕至私姿視詞誌磁射捨尺若樹収宗就衆従縦縮熟純処署諸除将傷障城蒸針仁垂推寸盛聖誠宣専泉洗染善奏窓創装層操蔵臓存尊宅担探誕段暖値宙忠著庁頂潮賃痛展討党糖届難乳認納脳派拝背肺俳班晩否批秘腹奮並陛閉片補暮宝訪亡忘棒枚幕密盟模訳郵優幼欲翌乱卵覧裏律臨朗論\
-、。，．・：；？！゛゜´｀¨＾￣＿ヽヾゝゞ〃仝々〆〇ー―‐／＼～∥｜…‥‘’“”（）〔〕［］｛｝〈〉《》「」『』【】＋－±×÷＝≠＜＞≦≧∞∴♂♀°′″℃￥＄￠￡％＃＆＊＠§☆★○●◎◇\
-◆□■△▲▽▼※〒→←↑↓〓∈∋⊆⊇⊂⊃∪∩∧∨￢⇒⇔∀∃∠⊥⌒∂∇≡≒≪≫√∽∝∵∫∬Å‰♯♭♪†‡¶◯\
-０１２３４５６７８９ＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚ\
-ぁあぃいぅうぇえぉおかがきぎくぐけげこごさざしじすずせぜそぞただちぢっつづてでとどなにぬねのはばぱひびぴふぶぷへべぺほぼぽまみむめもゃやゅゆょよらりるれろゎわゐゑをん\
-ァアィイゥウェエォオカガキギクグケゲコゴサザシジスズセゼソゾタダチヂッツヅテデトドナニヌネノハバパヒビピフブプヘベペホボポマミムメモャヤュユョヨラリルレロヮワヰヱヲンヴヵヶ"
+    return sortCodeList(codeList, out_encoding)
 
+# コードセットを、指定されたエンコーディングでソートする関数。こうしないと、後から検索するときにバイナリサーチで検索ができないため
+def sortCodeList(codeList, out_encoding):
+    if isVerbose:
+        print(GetMessage(isJapanese,"log_sorting").format(out_encoding))
+    if out_encoding not in CODE_SORT_FIELDS:
+        raise SystemExit(GetMessage(isJapanese,"err_notsupportedencoding").format(out_encoding))
+    codeList = codeList.sortedBy(out_encoding)
+    
+    if isVerbose:
+        print(GetMessage(isJapanese,"log_done"))
+    return codeList
 
+# コード一覧とビットマップ配列を、指定された形式のファイルに出力する関数
+def writeOutput(outFormat, output_file, codeList, bmpList, out_encoding):
+    if outFormat == "CData" :
+        Output2CLang(output_file,codeList,bmpList,out_encoding)
+    elif outFormat == "PBinary" :
+        Output2Binary(output_file,codeList,bmpList,pbinary_byteorder,pbinary_header)
+    elif outFormat == "Python" :
+        Output2Python(output_file,codeList,bmpList,out_encoding)
+    elif outFormat == "FONTX2":
+        Output2FONTX2(output_file, codeList, bmpList,out_encoding)
+    elif outFormat == "BDF":
+        Output2BDF(output_file, codeList, bmpList, Path(font_path).name, font_XSize, font_YSize, bdf_split , out_encoding)
 
+# コード一覧から、出力形式ごとにビットマップ配列を作ってファイルに出力する関数
+# targetsは（出力形式、出力ファイル名、エンコーディング）のリスト。
+# 出力形式ごとに、コード一覧のコピーをそのエンコーディングでソートしてオフセットを決める。
+# グリフはglyphCacheに保存されるので、レンダリングは最初の出力形式のときだけ行われる。
+# aliasCodesの文字は、代わりのグリフを共有する（checkCoverage）。
+# 各出力は別々のコード一覧・ビットマップ配列を使うので、互いに影響せず、並行して書き込む。
+def convertAndWrite(codeList, targets, glyphCache, aliasCodes=frozenset()):
+    outputs = []
+    for outFormat, output_file, out_encoding in targets:
+        targetList = sortCodeList(codeList, out_encoding)
+        if isVerbose:
+            print(GetMessage(isJapanese,"log_genbitmap"))
+        targetList , bmpList = convToDataAndBitmap(targetList, font_XSize, font_YSize, x_offset, y_offset, jobs, glyphCache,
+                                                   dedup and outFormat in DEDUP_OUTPUT_TYPES,
+                                                   compression if outFormat in COMPRESS_OUTPUT_TYPES else "none", aliasCodes)
+        if isVerbose:
+            print(GetMessage(isJapanese,"log_done"))
+        outputs.append((outFormat, output_file, targetList, bmpList, out_encoding))
+
+    if len(outputs) == 1 or isVerbose:      # 詳細表示が混ざらないよう、詳細表示のときは順番に出力する
+        for output in outputs:
+            writeOutput(*output)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(outputs)) as executor:
+            for future in [executor.submit(writeOutput, *output) for output in outputs]:
+                future.result()
+
+# 監視モードでファイルの更新を調べる間隔（秒）
+WATCH_INTERVAL = 0.2
+
+# 監視するファイルの更新時刻を取得する関数。存在しないファイル（保存中など）はNoneにする
+def getWatchStamps(watchFiles):
+    stamps = {}
+    for path in watchFiles:
+        try:
+            stat = os.stat(path)
+            stamps[path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamps[path] = None
+    return stamps
+
+# 監視モード。フォントファイルと文字ファイルの更新を監視し、変更されたらコード一覧を作り直して、
+# 前回から追加された文字だけをレンダリングし、削除された文字は取り除いて、出力ファイルを書き直す。Ctrl+Cで終了する。
+def watchAndRebuild(code_set, charfile, targets, glyphCache):
+    global font, bitmap_source
+    fontPaths = getFontSourcePaths(font_path)
+    watchFiles = list(fontPaths)
+    if charfile != "":
+        watchFiles.append(charfile)
+    for token in tokenizeCodeSet(code_set):
+        if token not in CODESET_OPERATORS and os.path.exists(token) and token not in watchFiles:
+            watchFiles.append(token)
+
+    memoryCache = MemoryGlyphCache(glyphCache)
+    stamps = None
+    prevCodes = set()
+    lastError = None
+    try:
+        while True:
+            newStamps = getWatchStamps(watchFiles)
+            if newStamps != stamps and None not in newStamps.values():
+                fontChanged = stamps is not None and any(newStamps[path] != stamps[path] for path in fontPaths)
+                oldStamps = stamps
+                stamps = newStamps
+                startTime = time.perf_counter()
+                try:
+                    if fontChanged:
+                        # フォントが変わったら、これまでのグリフは使えない
+                        font, bitmap_source = openFontSource(font_path, font_XSize, font_YSize)
+                        if glyphCache is not None:
+                            newCache = GlyphCache(cache_dir, cache_size * 1024 * 1024, fontPaths, font_XSize, x_offset, y_offset, mapping,
+                                                  getStrikePpem())
+                            glyphCache.close()
+                            glyphCache = newCache
+                        memoryCache = MemoryGlyphCache(glyphCache)
+                        prevCodes = set()
+                        fontChanged = False
+                    codeList, aliasCodes = checkCoverage(buildCodeList(code_set, charfile, targets[0][2]))
+                    codes = set(codeList.records["utf8"].tolist())
+                    memoryCache.retain(codes)
+                    convertAndWrite(codeList, targets, memoryCache, aliasCodes)
+                except (SystemExit, OSError, ValueError) as e:
+                    # 文字ファイルの編集途中などのエラーでは終了せず、次の更新を待つ
+                    # フォントを開けなかった場合（書き込みの途中など）は、フォントの更新時刻を古いままにして、次の確認で開き直す
+                    message = str(e)
+                    if fontChanged:
+                        stamps = dict(newStamps)
+                        stamps.update((path, oldStamps[path]) for path in fontPaths)
+                        message = GetMessage(isJapanese,"err_fontfileinvalid").format(font_path, e)
+                    if message != lastError:
+                        print(message)
+                        lastError = message
+                    time.sleep(WATCH_INTERVAL)
+                    continue
+                lastError = None
+                print(GetMessage(isJapanese,"log_watchrebuilt").format(", ".join(target[1] for target in targets), len(codes - prevCodes), len(prevCodes - codes), (time.perf_counter() - startTime) * 1000))
+                prevCodes = codes
+                print(GetMessage(isJapanese,"log_watching"))
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        print(GetMessage(isJapanese,"log_watchstop"))
+    finally:
+        if glyphCache is not None:
+            glyphCache.close()
+
+
+# マニフェストのジョブのキーと、対応するコマンドライン引数
+MANIFEST_OPTIONS = {
+    "name": "--name", "size": "--size", "xoffset": "--xoffset", "yoffset": "--yoffset",
+    "codeset": "--codeset", "charfile": "--charfile", "output": "--output", "mapping": "--mapping",
+    "endmark": "--endmark", "outtype": "--outtype", "bdf-split": "--bdf-split", "encoding": "--encoding",
+    "cache-dir": "--cache-dir", "cache-size": "--cache-size", "engine": "--engine", "byteorder": "--byteorder", "python-format": "--python-format",
+    "compress": "--compress", "missing": "--missing",
+}
+MANIFEST_FLAGS = {"filereplace": "--filereplace", "no-bits-comment": "--no-bits-comment", "bin-header": "--bin-header",
+                  "no-dedup": "--no-dedup", "hash-index": "--hash-index",
+                  "kuten-index": "--kuten-index", "no-embedded-bitmap": "--no-embedded-bitmap"}
+# リストで指定すると、組み合わせの数だけジョブに展開するキー
+MANIFEST_MATRIX_KEYS = ("font", "size", "codeset")
+
+# 出力ファイル名から、実際に作成されるファイルの一覧を返す関数
+def outputFilesOf(outFormat, output_file, bdf_split):
+    if outFormat == "PBinary":
+        if compression != "none":
+            return [output_file + "_code.bin", output_file + "_bitmap.bin", output_file + "_decoder.h"]
+        return [output_file + "_code.bin", output_file + "_bitmap.bin"]
+    elif outFormat == "FONTX2":
+        return [output_file + "_zen.fnt", output_file + "_han.fnt"]
+    elif outFormat == "BDF" and bdf_split:
+        return [output_file.replace('.bdf', '_han.bdf'), output_file.replace('.bdf', '_zen.bdf')]
+    return [output_file]
+
+# 出力形式ごとの出力ファイル名のリストを返す関数
+# isBaseがTrueなら、output_fileは拡張子のない名前で、形式ごとの拡張子を付ける。
+# 複数の出力形式を指定した場合は、-oで指定した名前（拡張子を除く）に、形式ごとの拡張子を付ける
+def getOutputFileNames(outFormats, output_file, isBase, isReplace):
+    output_base = output_file
+    if not isBase and len(outFormats) > 1:
+        for ext in OUTPUT_EXTENSIONS.values():
+            if ext != "" and output_base.endswith(ext):
+                output_base = output_base[:-len(ext)]
+                break
+    output_files = []
+    for outFormat in outFormats:
+        if isBase or len(outFormats) > 1:
+            output_files.append(output_base + OUTPUT_EXTENSIONS[outFormat])
+        else:
+            output_files.append(output_file)
 
+    #出力ファイル名に不適切な文字が含まれている場合、アンダースコアに置換する
+    if (isReplace):
+        # 置換対象の文字リスト
+        invalid_chars = {"-"," ","+", "-", "*" ,"/", " ", " ", "(", ")", "[", "]", "{", "}", ":", ";", ",",  "<", ">", "?", "!", "@", "#", "$", "%", "^", "&", "~", "`"}
+        # 置換後の文字列を作成
+        output_files = ["".join("_" if char in invalid_chars else char for char in name) for name in output_files]
+    return output_files
 
+# 出力ファイルがすべて存在し、どの入力ファイルよりも新しいかを調べる関数
+def isUpToDate(outputs, inputs):
+    try:
+        oldestOutput = min(os.path.getmtime(path) for path in outputs)
+    except (OSError, ValueError):
+        return False
+    newestInput = max(os.path.getmtime(path) for path in inputs if os.path.exists(path))
+    return oldestOutput >= newestInput
+
+# マニフェストファイル（TOMLまたはJSON）を読み込んで、ジョブごとのコマンドライン引数のリストを返す関数
+# [defaults] の値はすべてのジョブに使われ、[[jobs]] の値で上書きされる。
+# font/size/codesetにリストを指定すると、その組み合わせの数だけジョブに展開される。
+def loadManifest(manifestPath):
+    if not os.path.exists(manifestPath):
+        raise SystemExit(GetMessage(isJapanese,"err_manifestnotexist").format(manifestPath))
+    try:
+        if manifestPath.lower().endswith(".json"):
+            with open(manifestPath, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        else:
+            import tomllib          # Python 3.11以降の標準ライブラリ
+            with open(manifestPath, "rb") as f:
+                manifest = tomllib.load(f)
+    except Exception as e:
+        raise SystemExit(GetMessage(isJapanese,"err_manifestinvalid").format(manifestPath, e))
+
+    defaults = manifest.get("defaults", {})
+    jobArgvs = []
+    outputJobs = {}         # 出力ファイル→それを書くジョブの引数。同じファイルを書くジョブがあればエラーにする
+    for job in manifest.get("jobs", []):
+        settings = dict(defaults)
+        settings.update(job)
+        if "font" not in settings:
+            raise SystemExit(GetMessage(isJapanese,"err_manifestnofont").format(job))
+        for key in settings:
+            if key not in MANIFEST_OPTIONS and key not in MANIFEST_FLAGS and key != "font":
+                raise SystemExit(GetMessage(isJapanese,"err_manifestkey").format(key))
+        # font/size/codesetのリストを展開する
+        matrix = [[value] if not isinstance(value, list) else value for value in (settings.get(key) for key in MANIFEST_MATRIX_KEYS)]
+        for combination in itertools.product(*matrix):
+            expanded = dict(settings)
+            for key, value in zip(MANIFEST_MATRIX_KEYS, combination):
+                if value is not None:
+                    expanded[key] = value
+            argv = [str(expanded["font"])]
+            for key, value in expanded.items():
+                if key in MANIFEST_OPTIONS:
+                    if isinstance(value, list):             # 出力形式やエンコーディングのリストは、カンマ区切りにする
+                        value = ",".join(str(v) for v in value)
+                    argv.append(f"{MANIFEST_OPTIONS[key]}={value}")
+                elif key in MANIFEST_FLAGS and value:
+                    argv.append(MANIFEST_FLAGS[key])
+            # outputを指定しなければ、出力ファイル名にはフォント・サイズ・コードセットが入るので、展開したジョブの間で重ならない
+            if "output" in expanded:
+                outtype = expanded.get("outtype", "CData")
+                outFormats = outtype if isinstance(outtype, list) else [t.strip() for t in str(outtype).split(",")]
+                names = getOutputFileNames(outFormats, str(expanded["output"]), False, bool(expanded.get("filereplace")))
+                for outFormat, name in zip(outFormats, names):
+                    for path in outputFilesOf(outFormat, name, bool(expanded.get("bdf-split"))):
+                        path = os.path.normpath(os.path.join(os.path.dirname(manifestPath), path))
+                        if path in outputJobs:
+                            raise SystemExit(GetMessage(isJapanese,"err_manifestduplicateoutput").format(path, " ".join(outputJobs[path]), " ".join(argv)))
+                        outputJobs[path] = argv
+            jobArgvs.append(argv)
+    return jobArgvs
+
+# 一括ビルドのワーカープロセスの初期化関数。フォントとコード表は、ワーカー内でジョブをまたいで再利用する
+def initBuildWorker(isJapaneseWk):
+    global isJapanese, CODELIST_CACHE
+    isJapanese = isJapaneseWk
+    CODELIST_CACHE = {}
+
+# 一括ビルドの１つのジョブを実行する関数。戻り値は（ジョブ番号、状態、メッセージ）
+# ジョブの中では、さらにプロセスを起動できないので、--jobs は1にする
+def runBuildJob(args):
+    index, argv, upToDateInputs = args
+    try:
+        built = convertFont(argv + ["--jobs=1"], upToDateInputs)
+    except SystemExit as e:
+        return (index, "error", str(e))
+    except Exception as e:
+        return (index, "error", repr(e))
+    return (index, "built" if built else "skipped", "")
+
+# マニフェストファイルによる一括ビルド（font.py build manifest.toml）
+# すべてのジョブを１つのプロセスプールで実行し、出力が最新のジョブは飛ばす。
+def runBuild(argv):
+    global CODELIST_CACHE
+    parser = argparse.ArgumentParser(prog="font.py build", description=GetMessage(isJapanese,"build_general"),formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("manifest", type=str, help=GetMessage(isJapanese,"build_manifest"))
+    parser.add_argument("-j", "--jobs", type=int, default=0, help=GetMessage(isJapanese,"build_jobs"))
+    parser.add_argument("-f", "--force", action="store_true", help=GetMessage(isJapanese,"build_force"))
+    args = parser.parse_args(argv)
+
+    manifestPath = os.path.abspath(args.manifest)
+    jobArgvs = loadManifest(manifestPath)
+    # ジョブのファイル名は、マニフェストファイルのあるディレクトリからの相対パスとして扱う
+    os.chdir(os.path.dirname(manifestPath))
+    upToDateInputs = None if args.force else [manifestPath, os.path.abspath(__file__)]
+    tasks = [(index, jobArgv, upToDateInputs) for index, jobArgv in enumerate(jobArgvs)]
+
+    jobs = args.jobs
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, max(1, len(tasks)))
+
+    failed = 0
+    def report(result):
+        nonlocal failed
+        index, status, message = result
+        commandLine = " ".join(jobArgvs[index])
+        if status == "error":
+            failed += 1
+            print(GetMessage(isJapanese,"log_buildfailed").format(index + 1, len(tasks), commandLine, message))
+        elif status == "skipped":
+            print(GetMessage(isJapanese,"log_buildskipped").format(index + 1, len(tasks), commandLine))
+        else:
+            print(GetMessage(isJapanese,"log_buildbuilt").format(index + 1, len(tasks), commandLine))
 
+    if jobs <= 1:
+        CODELIST_CACHE = {}
+        for task in tasks:
+            report(runBuildJob(task))
+    else:
+        with multiprocessing.Pool(jobs, initializer=initBuildWorker, initargs=(isJapanese,)) as pool:
+            for result in pool.imap_unordered(runBuildJob, tasks):
+                report(result)
+
+    print(GetMessage(isJapanese,"log_builddone").format(len(tasks), failed))
+    if failed > 0:
+        raise SystemExit(1)
+
+# コマンドライン引数（sys.argvの２番目以降と同じ形式のリスト）を受け取って、フォントを変換する関数
+# upToDateInputsが指定された場合（マニフェストによる一括ビルド）は、出力ファイルがすべて入力ファイルとupToDateInputsより新しければ、変換を行わない。
+# 戻り値は、出力ファイルを作成した場合はTrue、最新なので何もしなかった場合はFalse
+def convertFont(argv, upToDateInputs=None):
+    global font, font_path, font_XSize, font_YSize, x_offset, y_offset, code_set, mapping, charfile
+    global isVerbose, isImage, isEndMark, bitsComment, dedup, compression, hash_index, kuten_index, embedded_bitmap, bitmap_source, missing_mode, pbinary_byteorder, pbinary_header, python_format, engine, bdf_split, jobs, cache_dir, cache_size
+    global structure_name, bitmapdata_name, command_args
 
     parser = argparse.ArgumentParser(description=GetMessage(isJapanese,"general"),formatter_class=argparse.RawTextHelpFormatter,epilog=GetMessage(isJapanese,"epilog"))
     # コマンドライン引数の解析
@@ -936,20 +2849,36 @@ if __name__ == "__main__":
     parser.add_argument("-n", "--name", type=str, default="", help=GetMessage(isJapanese,"--name"))
     parser.add_argument("-s", "--size", type=int, default=12, help=GetMessage(isJapanese,"--siuze"))
     parser.add_argument("-xo", "--xoffset", type=int, default=0, help=GetMessage(isJapanese,"--xoffset"))
-    parser.add_argument("-yo", "--yoffset", type=int, default=-1, help=GetMessage(isJapanese,"--yoffset"))
-    parser.add_argument("-cs", "--codeset", choices=["ALL","LEVEL1","SCHOOL","CUSTOM","TEST"], default="ALL", help=GetMessage(isJapanese,"--codeset"))
+    parser.add_argument("-yo", "--yoffset", type=int, default=None, help=GetMessage(isJapanese,"--yoffset"))
+    parser.add_argument("-cs", "--codeset", type=str, default="ALL", help=GetMessage(isJapanese,"--codeset"))
     parser.add_argument("-cf", "--charfile", type=str, default="",help=GetMessage(isJapanese,"--charfile"))
     parser.add_argument("-o", "--output", type=str, default="XXX.XXX", help=GetMessage(isJapanese,"--output"))
     parser.add_argument("-m", "--mapping", choices=["KANA","NONE"], default="KANA", help=GetMessage(isJapanese,"--mapping"))
     parser.add_argument("-em","--endmark" , choices=["ALLZERO","ALLMAX","NONE"], default="ALLZERO", help=GetMessage(isJapanese,"--endmark"))
 
-    parser.add_argument("-t","--outtype" , choices=["CData","PBinary","Python", "FONTX2","BDF"], default="CData", help=GetMessage(isJapanese,"--outtype"))
+    parser.add_argument("-t","--outtype" , type=str, default="CData", help=GetMessage(isJapanese,"--outtype"))
     parser.add_argument("-bs", "--bdf-split", choices=["Default" , "True","False"], default="Default" , help=GetMessage(isJapanese,"--bdf-split"))
-    parser.add_argument("-en" , "--encoding", choices=["DEFAULT" , "UTF8","SJIS","JIS"], default="DEFAULT", help=GetMessage(isJapanese,"--encoding"))
+    parser.add_argument("-en" , "--encoding", type=str, default="DEFAULT", help=GetMessage(isJapanese,"--encoding"))
     parser.add_argument("-fr", "--filereplace", action="store_true", help=GetMessage(isJapanese,"--oufilereplacettype"))
+    parser.add_argument("-bo", "--byteorder", choices=list(PBINARY_BYTEORDERS.keys()), default="big", help=GetMessage(isJapanese,"--byteorder"))
+    parser.add_argument("-bh", "--bin-header", action="store_true", help=GetMessage(isJapanese,"--bin-header"))
+    parser.add_argument("-pf", "--python-format", choices=PYTHON_FORMATS, default="list", help=GetMessage(isJapanese,"--python-format"))
+    parser.add_argument("-nb", "--no-bits-comment", action="store_true", help=GetMessage(isJapanese,"--no-bits-comment"))
+    parser.add_argument("-nd", "--no-dedup", action="store_true", help=GetMessage(isJapanese,"--no-dedup"))
+    parser.add_argument("-cp", "--compress", choices=COMPRESSION_TYPES, default="none", help=GetMessage(isJapanese,"--compress"))
+    parser.add_argument("-hi", "--hash-index", action="store_true", help=GetMessage(isJapanese,"--hash-index"))
+    parser.add_argument("-ki", "--kuten-index", action="store_true", help=GetMessage(isJapanese,"--kuten-index"))
+    parser.add_argument("-ne", "--no-embedded-bitmap", action="store_true", help=GetMessage(isJapanese,"--no-embedded-bitmap"))
+    parser.add_argument("-mi", "--missing", choices=MISSING_MODES, default="render", help=GetMessage(isJapanese,"--missing"))
+    parser.add_argument("--cache-dir", type=str, default="", help=GetMessage(isJapanese,"--cache-dir"))
+    parser.add_argument("--cache-size", type=int, default=256, help=GetMessage(isJapanese,"--cache-size"))
+    parser.add_argument("-j", "--jobs", type=int, default=1, help=GetMessage(isJapanese,"--jobs"))
+    parser.add_argument("--engine", choices=RENDER_ENGINES, default="glyph", help=GetMessage(isJapanese,"--engine"))
+    parser.add_argument("-w", "--watch", action="store_true", help=GetMessage(isJapanese,"--watch"))
     parser.add_argument("-v", "--verbose", action="store_true", help=GetMessage(isJapanese,"--verbose"))
     parser.add_argument("-i", "--image", action="store_true", help=GetMessage(isJapanese,"--image"))
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    command_args = [sys.argv[0]] + list(argv)
     font_path = args.font_path
     font_XSize = args.size
     font_YSize = args.size
@@ -961,65 +2890,93 @@ if __name__ == "__main__":
     isVerbose = args.verbose
     isImage = args.image
     isEndMark = args.endmark
-    outFormat = args.outtype
+    bitsComment = not args.no_bits_comment
+    dedup = not args.no_dedup
+    compression = args.compress
+    hash_index = args.hash_index
+    kuten_index = args.kuten_index
+    embedded_bitmap = not args.no_embedded_bitmap
+    missing_mode = args.missing
+    pbinary_byteorder = args.byteorder
+    pbinary_header = args.bin_header
+    python_format = args.python_format
+    outFormats = [t.strip() for t in args.outtype.split(",")]
     isReplace = args.filereplace
     charfile = args.charfile
     bdf_split = args.bdf_split
-    out_encoding = args.encoding
+    out_encodings = [e.strip() for e in args.encoding.split(",")]
+    jobs = args.jobs
+    engine = args.engine
+    isWatch = args.watch
+    cache_dir = args.cache_dir
+    cache_size = args.cache_size
+
+    #出力形式は、カンマ区切りで複数指定できる。同じ形式を２回指定することはできない
+    for outFormat in outFormats:
+        if outFormat not in OUTPUT_TYPES:
+            raise SystemExit(GetMessage(isJapanese,"err_notsupportedouttype").format(outFormat))
+        if outFormats.count(outFormat) > 1:
+            raise SystemExit(GetMessage(isJapanese,"err_duplicateouttype").format(outFormat))
 
     #bdf_splitがデフォルトの場合は、BDF形式のときだけTrueにする
     if (bdf_split.lower() == "default"):
-        if (outFormat == "BDF"):
+        if ("BDF" in outFormats):
             bdf_split = True
         else:
             bdf_split = False
     else:
         bdf_split = (bdf_split.lower() == "true")
 
-    #エンコーディングのデフォルト値を、出力タイプにより決定する
-    if (out_encoding == "DEFAULT"):
-        if (outFormat == "CData") or (outFormat == "PBinary") or (outFormat == "Python"):
-            out_encoding = "UTF8"
-        elif (outFormat == "FONTX2"):
-            out_encoding = "SJIS"
-        elif (outFormat == "BDF"):
-            out_encoding = "JIS"
+    #エンコーディングは、１つだけ指定した場合はすべての出力形式に、カンマ区切りで指定した場合は出力形式ごとに使う
+    if len(out_encodings) == 1:
+        out_encodings = out_encodings * len(outFormats)
+    elif len(out_encodings) != len(outFormats):
+        raise SystemExit(GetMessage(isJapanese,"err_encodingcount").format(len(out_encodings), len(outFormats)))
+    for i, out_encoding in enumerate(out_encodings):
+        #エンコーディングのデフォルト値を、出力タイプにより決定する
+        if (out_encoding == "DEFAULT"):
+            if (outFormats[i] == "CData") or (outFormats[i] == "PBinary") or (outFormats[i] == "Python"):
+                out_encodings[i] = "UTF8"
+            elif (outFormats[i] == "FONTX2"):
+                out_encodings[i] = "SJIS"
+            elif (outFormats[i] == "BDF"):
+                out_encodings[i] = "JIS"
+        elif out_encoding not in ("UTF8","SJIS","JIS"):
+            raise SystemExit(GetMessage(isJapanese,"err_notsupportedencoding").format(out_encoding))
     
 
     #入力ファイルが　”test" なら、テスト用のデータを読み込む
     if (font_path == "test"):
         font_path = "E:\\Programing\\VSCode\\Font\\JF-Dot-Shinonome12.ttf"
     
-    if (code_set == "CUSTOM"):
+    codeSetTokens = tokenizeCodeSet(code_set)
+    if ("CUSTOM" in codeSetTokens) or ("charfile" in codeSetTokens):
         if charfile == "":
             raise SystemExit(GetMessage(isJapanese,"err_codefileReqired"))
         if os.path.exists(charfile) == False:
             raise SystemExit(GetMessage(isJapanese,"err_codefilenotexist").format(charfile))
 
-    #出力ファイルが指定されなかったら、フォントファイル名に基づいて、.hファイルを作成する
+    #コードセットの式から、ファイル名や構造体名に使う名前を作る
+    code_set_name = codesetLabel(code_set, charfile)
+
+    #出力ファイルが指定されなかったら、フォントファイル名に基づいて、.hファイルなどを作成する
     if (output_file == "XXX.XXX"):
-        if (outFormat == "CData"):
-            output_file = Path(font_path).name.split(".")[0] + "_" + str(font_XSize).zfill(2) + "x"+str(font_YSize).zfill(2)  + "_" + code_set +".h"
-        elif (outFormat == "PBinary"):
-            output_file = Path(font_path).name.split(".")[0] + "_" + str(font_XSize).zfill(2) + "x"+str(font_YSize).zfill(2)  + "_" + code_set
-        elif (outFormat == "Python"):
-            output_file = Path(font_path).name.split(".")[0] + "_" + str(font_XSize).zfill(2) + "x"+str(font_YSize).zfill(2)  + "_" + code_set +".py"
-        elif (outFormat == "FONTX2"):
-            output_file = Path(font_path).name.split(".")[0] + "_" + str(font_XSize).zfill(2) + "x"+str(font_YSize).zfill(2)  + "_" + code_set +".fnt"
-        elif (outFormat == "BDF"):
-            output_file = Path(font_path).name.split(".")[0] + "_" + str(font_XSize).zfill(2) + "x"+str(font_YSize).zfill(2)  + "_" + code_set +".bdf"
+        output_files = getOutputFileNames(outFormats, Path(font_path).name.split(".")[0] + "_" + str(font_XSize).zfill(2) + "x"+str(font_YSize).zfill(2)  + "_" + code_set_name, True, isReplace)
+    else:
+        output_files = getOutputFileNames(outFormats, output_file, False, isReplace)
 
     #全角半角分離(-bsオプション）は、BDF形式のときしか指定できない
-    if (bdf_split and outFormat != "BDF"):
+    if (bdf_split and "BDF" not in outFormats):
         raise SystemExit(GetMessage(isJapanese,"err_bdfsplitonlybdf"))
+    if compression != "none" and not any(outFormat in COMPRESS_OUTPUT_TYPES for outFormat in outFormats):
+        raise SystemExit(GetMessage(isJapanese,"err_compressonly"))
+    if hash_index and "CData" not in outFormats:
+        raise SystemExit(GetMessage(isJapanese,"err_hashindexonlycdata"))
+    if kuten_index and "CData" not in outFormats:
+        raise SystemExit(GetMessage(isJapanese,"err_kutenindexonlycdata"))
 
-    #出力ファイル名に不適切な文字が含まれている場合、アンダースコアに置換する
-    if (isReplace):
-        # 置換対象の文字リスト
-        invalid_chars = {"-"," ","+", "-", "*" ,"/", " ", " ", "(", ")", "[", "]", "{", "}", ":", ";", ",",  "<", ">", "?", "!", "@", "#", "$", "%", "^", "&", "~", "`"}
-        # 置換後の文字列を作成
-        cleaned_name = "".join("_" if char in invalid_chars else char for char in output_file)
-        output_file = cleaned_name
+    # 出力形式・出力ファイル名・エンコーディングの組
+    targets = list(zip(outFormats, output_files, out_encodings))
 
 
     if (args.name == ""):
@@ -1031,150 +2988,84 @@ if __name__ == "__main__":
 
 
 
-        structure_name =  cleaned_name+ "_" + str(font_XSize).zfill(2) + "x"+str(font_YSize).zfill(2)  + "_" + code_set
-        bitmapdata_name = cleaned_name+ "_" + str(font_XSize).zfill(2) + "x"+str(font_YSize).zfill(2)  + "_" + code_set + "_bitmap"
+        structure_name =  cleaned_name+ "_" + str(font_XSize).zfill(2) + "x"+str(font_YSize).zfill(2)  + "_" + code_set_name
+        bitmapdata_name = cleaned_name+ "_" + str(font_XSize).zfill(2) + "x"+str(font_YSize).zfill(2)  + "_" + code_set_name + "_bitmap"
     else:
         structure_name = args.name
         bitmapdata_name =  args.name+"_bitmap"
 
    
-    # Pillowでフォントデータを読み込み。
+    # マニフェストによる一括ビルドでは、出力ファイルがすべて入力ファイルより新しければ何もしない
+    if upToDateInputs is not None:
+        inputs = list(upToDateInputs) + getFontSourcePaths(font_path) + [token for token in tokenizeCodeSet(code_set) if token not in CODESET_OPERATORS and os.path.exists(token)]
+        if charfile != "":
+            inputs.append(charfile)
+        outputs = [path for outFormat, output_file, out_encoding in targets for path in outputFilesOf(outFormat, output_file, bdf_split)]
+        if isUpToDate(outputs, inputs):
+            return False
+
+    # Pillowでフォントデータを読み込み（BDFフォントは、ビットマップをそのまま読み込む）。
+    # サイズが同じ埋め込みビットマップがあれば、その文字はレンダリングせずにビットマップを使う
     if not os.path.exists(font_path) :
         raise SystemExit(GetMessage(isJapanese,"err_fontfilenotexist").format(font_path))
     try:
-        font =  ImageFont.truetype(font_path, font_XSize)
+        font, bitmap_source = openFontSource(font_path, font_XSize, font_YSize)
     except Exception as e:
         raise SystemExit(GetMessage(isJapanese,"err_fontfileinvalid").format(font_path, e))
-    
-
-    #フォントの範囲を定義しておく
-
-    ASCII = range(0x0000,0x0100)
-    JISL1 = range(0x3021,0x4f54)
-    JISL2 = range(0x5021,0x7427)
-    JISKIGOU = range(0x2121,0x2F7E)
-    
-    # デバッグ用の特別なフォント範囲
-    test1 = range(0x00A1,0xAF) 
-    test2 = range(0x443E,0x4450)
-
-    #指定されたフォントセットに基づいて、文字コードを変換してUTF-8/SJIS/JISコードのリスト配列にしておく
-    codeList = []                           # コードのリスト。
-    if (code_set == "ALL"):
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_gencodetbl").format("ASCII/JISL1/JISL2/JISKIGOU"))
-        codeList += getCodeTbl(ASCII)
-        codeList += getCodeTbl(JISL1)
-        codeList += getCodeTbl(JISL2)
-        codeList += getCodeTbl(JISKIGOU)   
-   
-    elif (code_set == "LEVEL1"):
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_gencodetbl").format("ASCII/JISL1/JISKIGOU"))
-        codeList += getCodeTbl(ASCII)
-        codeList += getCodeTbl(JISL1)
-        codeList += getCodeTbl(JISKIGOU)
-    elif (code_set == "SCHOOL"):
-        #教育漢字の場合、少し複雑。とりあえずJISL1のテーブルを作って、そこから該当しないものを削除していくことにする。
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_gencodetbl").format("ASCII/教育漢字/JISKIGOU"))
-        codeList += getCodeTbl(ASCII)
-        codeList += getCodeTbl(JISL1)
-        codeList += getCodeTbl(JISKIGOU)
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_removingcodetbl"))
-
-        for d in codeList :
-            if d[0] <= 0xFF:            #１バイト文字は含める
-                continue
-            if d[3] not in KyouikuKanji:    #教育漢字に含まれないものは削除する
-                codeList.remove(d)
-    elif (code_set == "CUSTOM"):
-        # 教育漢字と同じ方法で、ALLのセットから使用しないものを削除していく。効率は大変悪くなるが仕方ない。
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_readingcodefile").format(charfile))
-        with open(charfile, "r", encoding="utf-8") as file:
-            content = file.read().replace("\n", "")  # 改行を削除
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_outputcontains").format(content))
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_gencodetbl").format("ASCII/JISL1/JISL2/JISKIGOU"))
-        codeList += getCodeTbl(ASCII)
-        codeList += getCodeTbl(JISL1)
-        codeList += getCodeTbl(JISKIGOU)
-
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_removeunused"))
-        for d in codeList :
-            if d[0] <= 0xFF:            #１バイト文字は含める
-                continue
-            if d[3] not in content:    #教育漢字に含まれないものは削除する
-                codeList.remove(d)
-    elif (code_set == "CUSTOM2"):
-        # 教育漢字と同じ方法で、ALLのセットから使用しないものを削除していく。CUSTOMと違い、１バイト文字も削除対象にする。
-        # 本来の利用目的は１バイト文字は２５６個あるという前提で作られている（キーでの検索ではなく直接計算でビットマップ画像を求めるため）ので、これは主にデバッグ用になる
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_readingcodefile").format(charfile))
-        with open(charfile, "r", encoding="utf-8") as file:
-            content = file.read().replace("\n", "")  # 改行を削除
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_outputcontains").format(content))
-            print(f"{content}")
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_gencodetbl").format("ASCII/JISL1/JISL2/JISKIGOU"))
-        codeList += getCodeTbl(ASCII)
-        codeList += getCodeTbl(JISL1)
-        codeList += getCodeTbl(JISKIGOU)
-
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_removeunused"))
-        for d in codeList :
-            if d[3] not in content:    #教育漢字に含まれないものは削除する
-                codeList.remove(d)
-
-    elif (code_set == "TEST"):
-        if isVerbose :
-            print(GetMessage(isJapanese,"log_gencodetbl").format("TEST"))
-        codeList += getCodeTbl(test1)
-        codeList += getCodeTbl(test2)
-    if isVerbose:
-        print(GetMessage(isJapanese,"log_done"))
+    if isinstance(bitmap_source, BitmapStrike):
+        print(GetMessage(isJapanese,"log_strikefound").format(bitmap_source.ppem, len(bitmap_source)))
+    elif isinstance(bitmap_source, BdfFont):
+        print(GetMessage(isJapanese,"log_bdffound").format(len(bitmap_source), bitmap_source.registry or "-"))
+    elif isinstance(bitmap_source, FontX2Font):
+        print(GetMessage(isJapanese,"log_fontx2found").format(bitmap_source.counts["zen"], bitmap_source.counts["han"],
+              ", ".join(f"{width}x{height}" for width, height in bitmap_source.sizes.values())))
+    # -yo のデフォルトは、TrueTypeフォントでは-1、ビットマップフォントでは（フォントの位置のままにするため）0
+    if y_offset is None:
+        y_offset = -1 if font is not None else 0
+
+    glyphCache = None
+    if cache_dir != "":
+        glyphCache = GlyphCache(cache_dir, cache_size * 1024 * 1024, getFontSourcePaths(font_path), font_XSize, x_offset, y_offset, mapping,
+                                getStrikePpem())
+
+    # 監視モードでは、ファイルが更新されるたびに出力を作り直す
+    if isWatch:
+        watchAndRebuild(code_set, charfile, targets, glyphCache)
+        return True
+
+    codeList = buildCodeList(code_set, charfile, targets[0][2])
+    # フォントにない文字を、レンダリングの前に取り除く・代わりのグリフにする・表示する
+    codeList, aliasCodes = checkCoverage(codeList)
+
+    #　コードセットテーブルを、ビットマップデータに変換して、出力形式ごとにファイルに出力する
+    convertAndWrite(codeList, targets, MemoryGlyphCache(glyphCache), aliasCodes)
+    if glyphCache is not None:
+        glyphCache.close()
+
+    for outFormat, output_file, out_encoding in targets:
+        print(GetMessage(isJapanese,"log_success").format(output_file))
+    return True
 
 
-    # コードセットを、指定されたエンコーディングでソートする。こうしないと、後から検索するときにバイナリサーチで検索ができないため
+if __name__ == "__main__":
 
-    if isVerbose:
-        print(GetMessage(isJapanese,"log_sorting").format(out_encoding))
-    if (out_encoding == "UTF8") :
-        codeList.sort(key=lambda x: x[0])
-    elif (out_encoding == "SJIS") :
-        codeList.sort(key=lambda x: x[1])
-    elif (out_encoding == "JIS") :
-        codeList.sort(key=lambda x: x[2])
+    # locale.getlocale()[0] が None の場合を考慮して安全に判定
+    loc = locale.getlocale()[0]
+    if loc is not None and (('JP' in loc) or ('Japanese' in loc)):
+        isJapanese = True
     else:
-        raise SystemExit(GetMessage(isJapanese,"err_notsupportedencoding").format(out_encoding))
-    
-    if isVerbose:
-        print(GetMessage(isJapanese,"log_done"))
-
-    #　コードセットテーブルを、ビットマップデータに変換する。同時に、コードセットテーブル内のXサイズ、Yサイズ、ビットマップデータを更新する
-    if isVerbose:
-        print(GetMessage(isJapanese,"log_genbitmap"))
-    bmpList = []
-    codeList , bmpList = convToDataAndBitmap(codeList,  font_XSize,font_YSize,x_offset,y_offset)
-    if isVerbose:
-        print(GetMessage(isJapanese,"log_done"))
-
-    if outFormat == "CData" :
-        Output2CLang(output_file,codeList,bmpList)
-    elif outFormat == "PBinary" :
-        Output2Binary(output_file,codeList,bmpList)
-    elif outFormat == "Python" :
-        Output2Python(output_file,codeList,bmpList)
-    elif outFormat == "FONTX2":
-        Output2FONTX2(output_file, codeList, bmpList,out_encoding)
-    elif outFormat == "BDF":
-        Output2BDF(output_file, codeList, bmpList, Path(font_path).name, font_XSize, font_YSize, bdf_split , out_encoding)
+        isJapanese = False
 
-    print(GetMessage(isJapanese,"log_success").format(output_file))
+    # 環境変数LANGが存在していたらisJapaneseを上書き
+    lang_env = os.environ.get('LANG')
+    if lang_env:
+        if 'ja' in lang_env.lower() or 'jp' in lang_env.lower():
+            isJapanese = True
+        else:
+            isJapanese = False
 
+    # 最初の引数が build の場合は、マニフェストファイルによる一括ビルドを行う
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        runBuild(sys.argv[2:])
+    else:
+        convertFont(sys.argv[1:])
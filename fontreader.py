@@ -0,0 +1,269 @@
+# font.py が出力したバイナリ形式（PBinary）とFONTX2形式のフォントを読むモジュール
+#
+#   from fontreader import PBinaryFont, FontX2Font
+#
+#   with PBinaryFont("MyFont") as f:                 # MyFont_code.bin / MyFont_bitmap.bin
+#       glyph = f.findChar("漢")                      # 文字で検索（UTF-8順のファイル）
+#       glyph = f.find(0x889F, "SJIS")                # SJISコードで検索
+#       glyph.rows()                                  # 1行ずつのmemoryview
+#
+#   with FontX2Font("MyFont.fnt_zen.fnt") as f:
+#       glyph = f.findChar("漢")
+#
+# ファイルはmmapで開き、全体を読み込まない。開くときに読むのはヘッダだけなので、フォントの大きさによらず一定時間で開ける。
+# 検索は、マップしたコード表（PBinary）やコードブロック表（FONTX2）の二分探索で行い、
+# ビットマップは、マップしたファイルのmemoryview（コピーなし）で返す。
+# 返したmemoryviewが残っているうちは、close() してもmmapは閉じられず、memoryviewがなくなったときに閉じられる。
+# PackBitsで圧縮したPBinary（--compress packbits）の場合は、１文字ずつ展開したbytesを返す。
+
+import bisect
+import codecs
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+# font.py の PBinary 形式の定義（font.py の CODE_RECORD_DTYPE / PBINARY_* と同じ）
+PBINARY_MAGIC = b"PFCB"
+PBINARY_VERSION_PACKBITS = 2
+PBINARY_HEADER_FORMAT = "4sBBHII"
+PBINARY_HEADER_SIZE = struct.calcsize(">" + PBINARY_HEADER_FORMAT)
+PBINARY_RECORD_FORMAT = "IHHBBI"
+PBINARY_RECORD_SIZE = struct.calcsize(">" + PBINARY_RECORD_FORMAT)
+# レコード内の各コードの位置と形式
+PBINARY_CODE_FIELDS = {"UTF8": (0, "I"), "SJIS": (4, "H"), "JIS": (6, "H")}
+
+FONTX2_MAGIC = b"FONTX2"
+FONTX2_HAN_CELLS = 256      # 半角ファイルは、１バイトコードの256文字をコードの順に持つ
+
+# 検索結果の１文字。codeは検索に使ったコード、bitmapは（高さ×１行のバイト数）バイトのmemoryview
+class Glyph(namedtuple("Glyph", ["code", "width", "height", "bitmap"])):
+    __slots__ = ()
+
+    @property
+    def bytesPerRow(self):
+        return (self.width + 7) // 8
+
+    # ビットマップを１行ずつのmemoryviewのリストにして返す
+    def rows(self):
+        step = self.bytesPerRow
+        return [self.bitmap[pos:pos + step] for pos in range(0, len(self.bitmap), step)]
+
+
+def mapFile(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""              # 空のファイルはmmapできない
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# mmapを閉じる。返したビットマップのmemoryviewが残っている場合は閉じられないので、それがなくなったときに任せる
+def closeMap(mapped):
+    if isinstance(mapped, mmap.mmap):
+        try:
+            mapped.close()
+        except BufferError:
+            pass
+
+
+# PackBitsで圧縮したデータを、sizeバイトに展開する（font.py も、圧縮したビットマップの展開にこれを使う）
+def unpackBits(data, size):
+    output = bytearray()
+    pos = 0
+    while len(output) < size:
+        control = data[pos]
+        if control < 128:
+            output += data[pos + 1:pos + 2 + control]
+            pos += 2 + control
+        else:
+            if control != 128:
+                output += bytes([data[pos + 1]]) * (257 - control)
+                pos += 1
+            pos += 1
+    return bytes(output)
+
+
+# 文字を、font.pyのコード表と同じ形式のUTF-8（バイト列をそのまま整数にしたもの）、SJIS、JISのコードにする。
+# 変換できない文字はNone
+def charToCode(char, encoding):
+    if len(char) == 1 and ord(char) <= 0x7F:
+        return ord(char)
+    if len(char) == 1 and 0xFF61 <= ord(char) <= 0xFF9F:
+        return ord(char) - 0xFF61 + 0xA1                 # 半角カナは、font.pyと同じく１バイトのコード
+    if len(char) == 1 and 0x80 <= ord(char) <= 0xFF and not 0xA1 <= ord(char) <= 0xDF:
+        # Latin-1の文字（0xA1～0xDFは半角カナ）は、font.pyと同じく、JIS X 0208にない文字だけ１バイトのコード
+        try:
+            inJIS = len(codecs.encode(char, "euc_jp")) == 2
+        except UnicodeEncodeError:
+            inJIS = False
+        if not inJIS:
+            return ord(char)
+    if encoding == "UTF8":
+        return int.from_bytes(char.encode("utf-8"), "big")
+    try:
+        if encoding == "SJIS":
+            data = codecs.encode(char, "shift_jis")
+            return int.from_bytes(data, "big")
+        data = codecs.encode(char, "euc_jp")
+    except UnicodeEncodeError:
+        return None
+    if len(data) == 2:
+        return int.from_bytes(data, "big") & 0x7F7F     # EUC-JPの２バイト文字はJISコード+0x8080
+    return None
+
+
+# font.py -t PBinary の出力（名前_code.bin と 名前_bitmap.bin）を読むクラス
+# encodingには、変換したときの -en（コード表の並び順）を指定する。
+# byteorderは、_code.bin にヘッダ（--bin-header）があればそれに従い、なければ指定された値（デフォルトは big）を使う。
+# compressionも同じで、ヘッダがあればそのバージョンから決まり、なければ指定された値（"none" または "packbits"）を使う。
+class PBinaryFont:
+    def __init__(self, basePath, encoding="UTF8", byteorder="big", compression="none"):
+        if encoding not in PBINARY_CODE_FIELDS:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        self.encoding = encoding
+        self.codeMap = mapFile(basePath + "_code.bin")
+        self.bitmapMap = mapFile(basePath + "_bitmap.bin")
+        self.codeView = memoryview(self.codeMap)
+        self.bitmapView = memoryview(self.bitmapMap)
+        self.version = 0
+        self.recordStart = 0
+        self.compression = compression
+        order = ">" if byteorder == "big" else "<"
+        if self.codeView[:4] == PBINARY_MAGIC:
+            magic, self.version, orderMark, recordSize, count, bitmapBytes = struct.unpack_from(
+                (">" if self.codeView[5] == ord("B") else "<") + PBINARY_HEADER_FORMAT, self.codeView, 0)
+            order = ">" if orderMark == ord("B") else "<"
+            if recordSize != PBINARY_RECORD_SIZE:
+                raise ValueError(f"Unsupported record size: {recordSize}")
+            self.recordStart = PBINARY_HEADER_SIZE
+            self.compression = "packbits" if self.version == PBINARY_VERSION_PACKBITS else "none"
+        self.count = (len(self.codeView) - self.recordStart) // PBINARY_RECORD_SIZE
+        self.recordStruct = struct.Struct(order + PBINARY_RECORD_FORMAT)
+        self.keyStructs = {name: (offset, struct.Struct(order + fmt)) for name, (offset, fmt) in PBINARY_CODE_FIELDS.items()}
+        self.otherIndexes = {}
+
+    def __len__(self):
+        return self.count
+
+    # i番目のレコード（utf8, sjis, jis, 幅, 高さ, オフセット）
+    def record(self, index):
+        return self.recordStruct.unpack_from(self.codeView, self.recordStart + index * PBINARY_RECORD_SIZE)
+
+    def key(self, index, encoding):
+        offset, keyStruct = self.keyStructs[encoding]
+        return keyStruct.unpack_from(self.codeView, self.recordStart + index * PBINARY_RECORD_SIZE + offset)[0]
+
+    def glyphAt(self, index, code):
+        codeUTF8, codeSJIS, codeJIS, width, height, offset = self.record(index)
+        size = height * ((width + 7) // 8)
+        if self.compression == "packbits":
+            return Glyph(code, width, height, unpackBits(self.bitmapView[offset:], size))
+        return Glyph(code, width, height, self.bitmapView[offset:offset + size])
+
+    # コードを指定して検索する。見つからなければNone
+    # ファイルの並び順のコードなら、マップしたコード表を二分探索する。
+    # それ以外のコードで検索する場合は、最初の１回だけ、そのコードの索引を作る。
+    def find(self, code, encoding=None):
+        encoding = encoding or self.encoding
+        if encoding == self.encoding:
+            lo, hi = 0, self.count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.key(mid, encoding) < code:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < self.count and self.key(lo, encoding) == code:
+                return self.glyphAt(lo, code)
+            return None
+        if encoding not in self.otherIndexes:
+            self.otherIndexes[encoding] = {self.key(index, encoding): index for index in range(self.count)}
+        index = self.otherIndexes[encoding].get(code)
+        return None if index is None else self.glyphAt(index, code)
+
+    # 文字を指定して検索する
+    def findChar(self, char):
+        code = charToCode(char, self.encoding)
+        return None if code is None else self.find(code)
+
+    def close(self):
+        self.codeView.release()
+        self.bitmapView.release()
+        for mapped in (self.codeMap, self.bitmapMap):
+            closeMap(mapped)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# font.py -t FONTX2 の出力（名前_zen.fnt / 名前_han.fnt）を読むクラス
+# 全角ファイルは、コードブロック表を二分探索して文字の位置を求める。半角ファイルは、コード×１文字のサイズの位置にある。
+# 半角ファイルは256文字分そろっている必要があり、そうでなければ ValueError にする（font.py は、いつも256文字分を出力する）。
+# encodingは、変換したときの -en（SJIS または JIS）。
+class FontX2Font:
+    def __init__(self, path, encoding="SJIS"):
+        self.encoding = encoding
+        self.map = mapFile(path)
+        self.view = memoryview(self.map)
+        if self.view[:6] != FONTX2_MAGIC:
+            self.close()
+            raise ValueError(f"Not a FONTX2 file: {path}")
+        self.name = bytes(self.view[6:14]).rstrip(b"\x00 ").decode("ascii", errors="replace")
+        self.width = self.view[14]
+        self.height = self.view[15]
+        self.isFullWidth = self.view[16] == 1
+        self.glyphSize = self.height * ((self.width + 7) // 8)
+        if self.isFullWidth:
+            # コードブロックは最大255個なので、先頭位置と累積の文字数は開くときに求めておく
+            blockCount = self.view[17]
+            blocks = struct.unpack_from("<" + "HH" * blockCount, self.view, 18)
+            self.blockStarts = list(blocks[0::2])
+            self.blockEnds = list(blocks[1::2])
+            self.blockBase = []
+            total = 0
+            for start, end in zip(self.blockStarts, self.blockEnds):
+                self.blockBase.append(total)
+                total += end - start + 1
+            self.dataStart = 18 + blockCount * 4
+            self.count = total
+        else:
+            # 半角ファイルはコードから位置を計算するので、256文字そろっていないファイルは正しく読めない
+            self.dataStart = 17
+            self.count = (len(self.view) - self.dataStart) // self.glyphSize if self.glyphSize else 0
+            if self.count != FONTX2_HAN_CELLS:
+                self.close()
+                raise ValueError(f"Half-width FONTX2 file must hold {FONTX2_HAN_CELLS} glyphs, but has {self.count}: {path}")
+
+    def __len__(self):
+        return self.count
+
+    # コードを指定して検索する。見つからなければNone
+    def find(self, code):
+        if self.isFullWidth:
+            block = bisect.bisect_right(self.blockStarts, code) - 1
+            if block < 0 or code > self.blockEnds[block]:
+                return None
+            index = self.blockBase[block] + code - self.blockStarts[block]
+        else:
+            index = code
+            if index < 0 or index >= self.count:
+                return None
+        start = self.dataStart + index * self.glyphSize
+        return Glyph(code, self.width, self.height, self.view[start:start + self.glyphSize])
+
+    def findChar(self, char):
+        code = charToCode(char, self.encoding)
+        return None if code is None else self.find(code)
+
+    def close(self):
+        self.view.release()
+        closeMap(self.map)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()